@@ -1,24 +1,38 @@
 import asyncio
+import csv
+import gzip
 import json
+import os
+import tempfile
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from telegram import Bot, Message
-from chatgpt_api import ChatGPTAPIClient
+from chatgpt_api import ChatGPTAPIClient, StreamInterrupted
 from channel_manager import ChannelManager
-from config import DEFAULT_TOPICS, MAX_ARTICLE_LENGTH, DEFAULT_LANGUAGE
+from storage import Storage, ArticleRepository, ScheduleRepository, ARTICLE_FIELDS, new_id
+from scheduler import JobScheduler
+from config import (
+    DEFAULT_TOPICS, MAX_ARTICLE_LENGTH, DEFAULT_LANGUAGE,
+    ARTICLE_GENERATION_TIMEOUT, ARTICLE_BATCH_CONCURRENCY, SCHEDULER_JITTER, EXPORT_FORMATS
+)
 
 class ArticleGenerator:
     """Generates articles on trending topics using OpenAI ChatGPT"""
     
-        def __init__(self, bot: Bot, chatgpt_client: ChatGPTAPIClient,
-                 channel_manager: ChannelManager, language: str = DEFAULT_LANGUAGE):
+    def __init__(self, bot: Bot, chatgpt_client: ChatGPTAPIClient,
+                 channel_manager: ChannelManager, language: str = DEFAULT_LANGUAGE,
+                 storage: Storage = None, scheduler: JobScheduler = None):
         self.bot = bot
         self.chatgpt_client = chatgpt_client
         self.channel_manager = channel_manager
         self.language = language
-        self.generated_articles = {}  # Track generated articles
+        self.storage = storage or Storage()
+        self.articles = ArticleRepository(self.storage)  # Generated articles
+        self.schedules = ScheduleRepository(self.storage)  # Schedule for article posting
         self.topic_suggestions = DEFAULT_TOPICS.copy()
-        self.article_schedule = {}  # Schedule for article posting
+        self.scheduler = scheduler  # Runs article schedules when set
+        if scheduler:
+            scheduler.register("article_schedule", self._run_schedule_job)
         
     async def generate_article_on_topic(self, topic: str, language: str = None) -> Optional[str]:
         """Generate an article on a specific topic"""
@@ -26,20 +40,10 @@ class ArticleGenerator:
             lang = language or self.language
             
             # Generate article using OpenAI ChatGPT
-            article = self.chatgpt_client.generate_article(topic, lang)
+            article = await self.chatgpt_client.generate_article(topic, lang)
             
             if article:
-                # Store the generated article
-                article_id = f"article_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-                self.generated_articles[article_id] = {
-                    "topic": topic,
-                    "content": article,
-                    "language": lang,
-                    "generated_at": datetime.now().isoformat(),
-                    "posted": False
-                }
-                
-                return article_id
+                return self._store_article(topic, article, lang)
             
             return None
             
@@ -47,48 +51,129 @@ class ArticleGenerator:
             print(f"Error generating article on topic '{topic}': {e}")
             return None
     
+    async def stream_article_on_topic(self, topic: str, language: str = None,
+                                      on_update: Callable[[str], Awaitable[None]] = None) -> Optional[str]:
+        """Generate an article while streaming it; on_update gets the text received so far"""
+        try:
+            lang = language or self.language
+            article = ""
+            
+            try:
+                async for delta in self.chatgpt_client.stream_article(topic, lang):
+                    article += delta
+                    if on_update:
+                        await on_update(article)
+            except StreamInterrupted as e:
+                print(f"Streamed article on topic '{topic}' is incomplete: {e}")
+                if e.cut_off:
+                    # A retry would be cut off the same way
+                    return None
+                # Never store the partial text, generate the article again
+                return await self.generate_article_on_topic(topic, lang)
+            
+            if not article:
+                # Streaming unavailable or failed before the first token
+                return await self.generate_article_on_topic(topic, lang)
+            
+            return self._store_article(topic, article, lang)
+            
+        except Exception as e:
+            print(f"Error streaming article on topic '{topic}': {e}")
+            return None
+    
+    def _store_article(self, topic: str, content: str, language: str) -> str:
+        """Store a generated article and return its ID"""
+        # Unique even for articles finished at the same moment by different workers
+        article_id = f"article_{new_id()}"
+        self.articles.save(article_id, {
+            "topic": topic,
+            "content": content,
+            "language": language,
+            "generated_at": datetime.now().isoformat(),
+            "posted": False
+        })
+        return article_id
+    
+    async def select_trending_topic(self, language: str = None) -> str:
+        """Pick a trending topic, falling back to the default topics"""
+        # Get trending topics from OpenAI ChatGPT
+        trending_topics = await self.chatgpt_client.get_trending_topics(language or self.language)
+        
+        if trending_topics:
+            # Select the first trending topic
+            return trending_topics[0]
+        
+        # Fallback to default topics
+        import random
+        return random.choice(self.topic_suggestions)
+    
     async def generate_trending_article(self, language: str = None) -> Optional[str]:
         """Generate an article on a trending topic"""
         try:
-                    # Get trending topics from OpenAI ChatGPT
-        trending_topics = self.chatgpt_client.get_trending_topics(language or self.language)
-            
-            if trending_topics:
-                # Select the first trending topic
-                selected_topic = trending_topics[0]
-                return await self.generate_article_on_topic(selected_topic, language)
-            else:
-                # Fallback to default topics
-                import random
-                fallback_topic = random.choice(self.topic_suggestions)
-                return await self.generate_article_on_topic(fallback_topic, language)
+            topic = await self.select_trending_topic(language)
+            return await self.generate_article_on_topic(topic, language)
                 
         except Exception as e:
             print(f"Error generating trending article: {e}")
             return None
     
-    async def generate_multiple_articles(self, count: int = 3, language: str = None) -> List[str]:
-        """Generate multiple articles on different topics"""
+    async def stream_trending_article(self, language: str = None,
+                                      on_update: Callable[[str], Awaitable[None]] = None) -> Optional[str]:
+        """Generate an article on a trending topic while streaming it"""
+        try:
+            topic = await self.select_trending_topic(language)
+            return await self.stream_article_on_topic(topic, language, on_update)
+                
+        except Exception as e:
+            print(f"Error streaming trending article: {e}")
+            return None
+    
+    async def generate_multiple_articles(self, count: int = 3, language: str = None,
+                                         on_progress: Callable[[int, int, str, Optional[str]], Awaitable[None]] = None,
+                                         concurrency: int = ARTICLE_BATCH_CONCURRENCY) -> List[str]:
+        """Generate multiple articles on different topics concurrently
+        
+        At most `concurrency` articles are generated at once and each one has its own
+        ARTICLE_GENERATION_TIMEOUT deadline. Failed or timed out articles are skipped,
+        the IDs of the rest are returned in topic order. on_progress is awaited with
+        (done, total, topic, article_id or None) as each article finishes.
+        """
         try:
-            article_ids = []
+            lang = language or self.language
             
             # Get trending topics
-            trending_topics = self.chatgpt_client.get_trending_topics(language or self.language)
-            
-            # Use trending topics if available, otherwise use default topics
-            topics_to_use = trending_topics if trending_topics else self.topic_suggestions
-            
-            # Generate articles for different topics
-            for i in range(min(count, len(topics_to_use))):
-                topic = topics_to_use[i]
-                article_id = await self.generate_article_on_topic(topic, language)
-                if article_id:
-                    article_ids.append(article_id)
+            trending_topics = await self.chatgpt_client.get_trending_topics(lang, count)
+            
+            # The model may return fewer topics than asked for: top up with the default topics
+            topics_to_use = list(dict.fromkeys(trending_topics + self.topic_suggestions))[:count]
+            
+            semaphore = asyncio.Semaphore(concurrency)
+            done = 0
+            
+            async def generate(topic: str) -> Optional[str]:
+                nonlocal done
+                async with semaphore:
+                    try:
+                        # The deadline starts once a slot is free, not while queued
+                        article_id = await asyncio.wait_for(
+                            self.generate_article_on_topic(topic, lang), ARTICLE_GENERATION_TIMEOUT
+                        )
+                    except asyncio.TimeoutError:
+                        print(f"Article generation on topic '{topic}' timed out")
+                        article_id = None
                 
-                # Add small delay between generations
-                await asyncio.sleep(2)
+                done += 1
+                if on_progress:
+                    try:
+                        await on_progress(done, len(topics_to_use), topic, article_id)
+                    except Exception as e:
+                        print(f"Error reporting article progress: {e}")
+                return article_id
+            
+            results = await asyncio.gather(*(generate(topic) for topic in topics_to_use),
+                                           return_exceptions=True)
             
-            return article_ids
+            return [result for result in results if isinstance(result, str)]
             
         except Exception as e:
             print(f"Error generating multiple articles: {e}")
@@ -97,11 +182,11 @@ class ArticleGenerator:
     async def post_article_to_channel(self, article_id: str, channel_id: str) -> bool:
         """Post a generated article to a channel"""
         try:
-            if article_id not in self.generated_articles:
+            article_data = self.articles.get(article_id)
+            if article_data is None:
                 print(f"Article {article_id} not found")
                 return False
             
-            article_data = self.generated_articles[article_id]
             content = article_data["content"]
             topic = article_data["topic"]
             
@@ -113,10 +198,13 @@ class ArticleGenerator:
             
             if message:
                 # Mark as posted
-                self.generated_articles[article_id]["posted"] = True
-                self.generated_articles[article_id]["posted_at"] = datetime.now().isoformat()
-                self.generated_articles[article_id]["channel_id"] = channel_id
-                self.generated_articles[article_id]["message_id"] = message.message_id
+                self.articles.update(
+                    article_id,
+                    posted=True,
+                    posted_at=datetime.now().isoformat(),
+                    channel_id=channel_id,
+                    message_id=message.message_id
+                )
                 
                 return True
             
@@ -151,15 +239,20 @@ class ArticleGenerator:
                                         channel_id: str = None) -> bool:
         """Schedule regular article generation"""
         try:
-            schedule_id = f"schedule_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            schedule_id = f"schedule_{new_id()}"
             
-            self.article_schedule[schedule_id] = {
+            self.schedules.save(schedule_id, {
                 "interval_hours": interval_hours,
                 "channel_id": channel_id,
                 "active": True,
                 "next_generation": datetime.now() + timedelta(hours=interval_hours),
                 "last_generated": None
-            }
+            })
+            
+            if self.scheduler:
+                interval = interval_hours * 3600
+                self.scheduler.schedule("article_schedule", {"schedule_id": schedule_id}, delay=interval,
+                                        interval=interval, jitter=SCHEDULER_JITTER, job_id=schedule_id)
             
             print(f"Article generation scheduled with ID: {schedule_id}")
             return True
@@ -168,30 +261,67 @@ class ArticleGenerator:
             print(f"Error scheduling article generation: {e}")
             return False
     
+    def cancel_schedule(self, schedule_id: str) -> bool:
+        """Deactivate an article schedule"""
+        try:
+            if self.schedules.get(schedule_id) is None:
+                return False
+            self.schedules.set_active(schedule_id, False)
+            if self.scheduler:
+                self.scheduler.cancel(schedule_id)
+            return True
+            
+        except Exception as e:
+            print(f"Error cancelling schedule: {e}")
+            return False
+    
+    def sync_schedules(self):
+        """Create scheduler jobs for active schedules that have none (e.g. created before the scheduler)"""
+        if not self.scheduler:
+            return
+        for schedule_id, schedule in self.schedules.get_active():
+            if self.scheduler.get_job(schedule_id) is None:
+                self.scheduler.schedule(
+                    "article_schedule", {"schedule_id": schedule_id},
+                    run_at=schedule["next_generation"].timestamp(),
+                    interval=schedule["interval_hours"] * 3600, jitter=SCHEDULER_JITTER, job_id=schedule_id
+                )
+    
+    async def _run_schedule_job(self, payload: Dict):
+        await self.run_schedule(payload["schedule_id"])
+    
+    async def run_schedule(self, schedule_id: str) -> Optional[str]:
+        """Generate (and post, if the schedule has a channel) one scheduled article"""
+        schedule = self.schedules.get(schedule_id)
+        if schedule is None or not schedule["active"]:
+            if self.scheduler:
+                self.scheduler.cancel(schedule_id)
+            return None
+        
+        current_time = datetime.now()
+        article_id = await self.generate_trending_article()
+        
+        if article_id:
+            # Update schedule
+            schedule["last_generated"] = current_time.isoformat()
+            schedule["next_generation"] = current_time + timedelta(hours=schedule["interval_hours"])
+            self.schedules.save(schedule_id, schedule)
+            
+            # Post to channel if specified
+            if schedule["channel_id"]:
+                await self.post_article_to_channel(article_id, schedule["channel_id"])
+        
+        return article_id
+    
     async def process_scheduled_articles(self) -> List[str]:
-        """Process scheduled article generation"""
+        """Process due article schedules now (the scheduler does this on its own)"""
         try:
             generated_articles = []
-            current_time = datetime.now()
             
-            for schedule_id, schedule in self.article_schedule.items():
-                if not schedule["active"]:
-                    continue
-                
-                if schedule["next_generation"] <= current_time:
-                    # Time to generate article
-                    article_id = await self.generate_trending_article()
-                    
-                    if article_id:
-                        generated_articles.append(article_id)
-                        
-                        # Update schedule
-                        schedule["last_generated"] = current_time.isoformat()
-                        schedule["next_generation"] = current_time + timedelta(hours=schedule["interval_hours"])
-                        
-                        # Post to channel if specified
-                        if schedule["channel_id"]:
-                            await self.post_article_to_channel(article_id, schedule["channel_id"])
+            for schedule_id, _schedule in self.schedules.get_due(datetime.now()):
+                article_id = await self.run_schedule(schedule_id)
+                if article_id:
+                    generated_articles.append(article_id)
             
             return generated_articles
             
@@ -202,20 +332,12 @@ class ArticleGenerator:
     def get_article_statistics(self) -> Dict:
         """Get statistics about generated articles"""
         try:
-            total_articles = len(self.generated_articles)
-            posted_articles = sum(1 for article in self.generated_articles.values() if article.get("posted", False))
-            
-            # Group by language
-            language_stats = {}
-            for article in self.generated_articles.values():
-                lang = article.get("language", "unknown")
-                language_stats[lang] = language_stats.get(lang, 0) + 1
+            total_articles = self.articles.count()
+            posted_articles = self.articles.count(posted=True)
             
-            # Group by topic
-            topic_stats = {}
-            for article in self.generated_articles.values():
-                topic = article.get("topic", "unknown")
-                topic_stats[topic] = topic_stats.get(topic, 0) + 1
+            # Group by language and topic
+            language_stats = self.articles.count_by("language")
+            topic_stats = self.articles.count_by("topic")
             
             return {
                 "total_generated": total_articles,
@@ -223,7 +345,7 @@ class ArticleGenerator:
                 "posting_rate": f"{(posted_articles/total_articles*100):.1f}%" if total_articles > 0 else "0%",
                 "by_language": language_stats,
                 "by_topic": topic_stats,
-                "active_schedules": len([s for s in self.article_schedule.values() if s["active"]])
+                "active_schedules": self.schedules.count_active()
             }
             
         except Exception as e:
@@ -232,36 +354,36 @@ class ArticleGenerator:
     
     def get_article_by_id(self, article_id: str) -> Optional[Dict]:
         """Get article data by ID"""
-        return self.generated_articles.get(article_id)
+        return self.articles.get(article_id)
     
-    def search_articles(self, query: str) -> List[Tuple[str, Dict]]:
-        """Search articles by content or topic"""
+    def search_articles(self, query: str, limit: int = 50, offset: int = 0) -> List[Tuple[str, Dict]]:
+        """Search articles by content or topic, best matches first (word* matches a prefix)"""
         try:
-            results = []
-            query_lower = query.lower()
-            
-            for article_id, article_data in self.generated_articles.items():
-                content = article_data.get("content", "").lower()
-                topic = article_data.get("topic", "").lower()
-                
-                if query_lower in content or query_lower in topic:
-                    results.append((article_id, article_data))
-            
-            return results
+            return self.articles.search(query, limit, offset)
             
         except Exception as e:
             print(f"Error searching articles: {e}")
             return []
     
+    def count_search_results(self, query: str) -> int:
+        """Number of articles matching a search query"""
+        try:
+            return self.articles.count_search(query)
+            
+        except Exception as e:
+            print(f"Error counting search results: {e}")
+            return 0
+    
     async def edit_article(self, article_id: str, new_content: str) -> bool:
         """Edit an existing article"""
         try:
-            if article_id not in self.generated_articles:
+            article_data = self.articles.get(article_id)
+            if article_data is None:
                 return False
             
-            article_data = self.generated_articles[article_id]
             article_data["content"] = new_content
             article_data["edited_at"] = datetime.now().isoformat()
+            self.articles.save(article_id, article_data)
             
             # Update in channel if already posted
             if article_data.get("posted", False) and "channel_id" in article_data and "message_id" in article_data:
@@ -283,24 +405,66 @@ class ArticleGenerator:
             print(f"Error editing article: {e}")
             return False
     
-    def export_articles(self, format_type: str = "json") -> str:
-        """Export articles in specified format"""
+    def delete_article(self, article_id: str) -> bool:
+        """Delete a stored article (a posted copy stays in the channel)"""
         try:
-            if format_type == "json":
-                return json.dumps(self.generated_articles, indent=2, ensure_ascii=False)
-            elif format_type == "text":
-                output = []
-                for article_id, article_data in self.generated_articles.items():
-                    output.append(f"=== {article_id} ===")
-                    output.append(f"Topic: {article_data['topic']}")
-                    output.append(f"Language: {article_data['language']}")
-                    output.append(f"Generated: {article_data['generated_at']}")
-                    output.append(f"Content:\n{article_data['content']}")
-                    output.append("\n" + "="*50 + "\n")
-                return "\n".join(output)
-            else:
-                return "Unsupported format"
-                
+            if article_id not in self.articles:
+                return False
+            self.articles.delete(article_id)
+            return True
+            
+        except Exception as e:
+            print(f"Error deleting article: {e}")
+            return False
+    
+    async def export_articles(self, format_type: str = "jsonl", compress: bool = False, language: str = None,
+                              posted: bool = None, since: datetime = None,
+                              until: datetime = None) -> Optional[Tuple[str, int]]:
+        """Export articles to a temporary file, returning its path and the article count
+        
+        Articles are read page by page and written as they come, so memory use
+        doesn't grow with the archive. Formats: jsonl, csv, json and text,
+        gzip-compressed with compress. The caller deletes the file.
+        """
+        if format_type not in EXPORT_FORMATS:
+            return None
+        suffix = f".{format_type}" + (".gz" if compress else "")
+        handle, path = tempfile.mkstemp(prefix="articles_", suffix=suffix)
+        os.close(handle)
+        count = 0
+        try:
+            opener = gzip.open if compress else open
+            with opener(path, "wt", encoding="utf-8", newline="") as output:
+                writer = csv.writer(output) if format_type == "csv" else None
+                if writer:
+                    writer.writerow(("id",) + ARTICLE_FIELDS)
+                elif format_type == "json":
+                    output.write("{")
+                for article_id, article_data in self.articles.iter_all(
+                        language=language, posted=posted, since=since, until=until):
+                    if writer:
+                        writer.writerow((article_id,) + tuple(article_data.get(field) for field in ARTICLE_FIELDS))
+                    elif format_type == "jsonl":
+                        output.write(json.dumps({"id": article_id, **article_data}, ensure_ascii=False) + "\n")
+                    elif format_type == "json":
+                        output.write(("," if count else "") + f"\n  {json.dumps(article_id)}: ")
+                        output.write(json.dumps(article_data, ensure_ascii=False))
+                    else:
+                        output.write(f"=== {article_id} ===\n"
+                                     f"Topic: {article_data['topic']}\n"
+                                     f"Language: {article_data['language']}\n"
+                                     f"Generated: {article_data['generated_at']}\n"
+                                     f"Content:\n{article_data['content']}\n"
+                                     f"\n{'=' * 50}\n\n")
+                    count += 1
+                    if count % 500 == 0:
+                        # Let other updates run during a long export
+                        await asyncio.sleep(0)
+                if format_type == "json":
+                    output.write("\n}\n")
+            return path, count
+            
         except Exception as e:
             print(f"Error exporting articles: {e}")
-            return f"Export error: {e}"
+            os.remove(path)
+            return None
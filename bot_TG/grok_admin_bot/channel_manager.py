@@ -3,15 +3,19 @@ from typing import Dict, List, Optional, Tuple
 from telegram import Bot, Update, Message, ChatMember
 from telegram.ext import ContextTypes
 from config import ADMIN_CHANNEL_ID, PUBLIC_CHANNEL_ID, ERROR_MESSAGES, DEFAULT_LANGUAGE
+from scheduler import JobScheduler
 
 class ChannelManager:
     """Manages Telegram channel operations"""
     
-    def __init__(self, bot: Bot, language: str = DEFAULT_LANGUAGE):
+    def __init__(self, bot: Bot, language: str = DEFAULT_LANGUAGE, scheduler: JobScheduler = None):
         self.bot = bot
         self.language = language
         self.admin_channel_id = ADMIN_CHANNEL_ID
         self.public_channel_id = PUBLIC_CHANNEL_ID
+        self.scheduler = scheduler  # Persistent scheduled posts when set
+        if scheduler:
+            scheduler.register("channel_post", self._run_scheduled_post)
         
     async def get_channel_info(self, channel_id: str) -> Optional[Dict]:
         """Get information about a channel"""
@@ -183,13 +187,29 @@ class ChannelManager:
             return content
     
     async def schedule_post(self, channel_id: str, text: str, 
-                           schedule_time: int) -> bool:
-        """Schedule a post for later (simplified implementation)"""
+                           schedule_time: int) -> Optional[str]:
+        """Schedule a post in schedule_time seconds and return its job ID"""
         try:
-            # This is a simplified scheduling - in production you'd want a proper scheduler
+            if self.scheduler:
+                return self.scheduler.schedule("channel_post", {"channel_id": channel_id, "text": text},
+                                               delay=schedule_time)
+            
+            # Without a scheduler the post is only kept in this task
             await asyncio.sleep(schedule_time)
-            await self.post_message(channel_id, text)
-            return True
+            message = await self.post_message(channel_id, text)
+            return str(message.message_id) if message else None
         except Exception as e:
             print(f"Error scheduling post: {e}")
+            return None
+    
+    def cancel_scheduled_post(self, job_id: str) -> bool:
+        """Cancel a scheduled post"""
+        job = self.scheduler.get_job(job_id) if self.scheduler else None
+        if job is None or job["kind"] != "channel_post":
             return False
+        return self.scheduler.cancel(job_id)
+    
+    async def _run_scheduled_post(self, payload: Dict):
+        message = await self.post_message(payload["channel_id"], payload["text"])
+        if message is None:
+            raise RuntimeError(f"Scheduled post to {payload['channel_id']} failed")
@@ -1,11 +1,36 @@
-import requests
+import asyncio
 import json
+import threading
 import time
-from typing import Dict, List, Optional
-from config import OPENAI_API_KEY, OPENAI_API_URL, OPENAI_MODEL, ERROR_MESSAGES, DEFAULT_LANGUAGE
+import httpx
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from config import (
+    OPENAI_API_KEY, OPENAI_API_URL, OPENAI_MODEL, OPENAI_REQUEST_TIMEOUT, LLM_HEDGE_MAX_TOKENS,
+    OPENAI_EMBEDDINGS_URL, OPENAI_EMBEDDING_MODEL, HTTP_MAX_CONNECTIONS,
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+    CONNECTION_TEST_CACHE_TTL, ERROR_MESSAGES, DEFAULT_LANGUAGE,
+    CONTEXT_TOKEN_BUDGET, COMMENT_CONTEXT_TOKEN_BUDGET, MAX_ARTICLE_LENGTH,
+    CONVERSATION_TOKEN_BUDGET, TASK_PROFILES
+)
+from response_cache import ResponseCache
+from singleflight import SingleFlight
+from token_budget import TokenBudget
+from llm_router import LLMRouter, load_providers
+from rate_limiter import retry_delay
+
+class StreamInterrupted(Exception):
+    """A streamed response stopped before it was complete
+
+    cut_off means the model hit max_tokens, otherwise the connection failed
+    after text had already been yielded.
+    """
+
+    def __init__(self, message: str, cut_off: bool = False):
+        super().__init__(message)
+        self.cut_off = cut_off
 
 class ChatGPTAPIClient:
-    """Client for interacting with OpenAI ChatGPT API"""
+    """Async client for interacting with OpenAI ChatGPT API"""
     
     def __init__(self, api_key: str = None, language: str = DEFAULT_LANGUAGE):
         self.api_key = api_key or OPENAI_API_KEY
@@ -16,95 +41,276 @@ class ChatGPTAPIClient:
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
+        # Only OpenAI gets the OpenAI key: every request brings its own Authorization
+        self._http = None  # Shared pooled session, created on first use
+        self.router = LLMRouter(load_providers(), self._get_http)
+        self.singleflight = SingleFlight()
+        self.budget = TokenBudget(self.model)
+        self.cache = None
+        if RESPONSE_CACHE_ENABLED:
+            embed = self.embed if RESPONSE_CACHE_SIMILARITY_THRESHOLD > 0 else None
+            self.cache = ResponseCache(embed=embed)
     
-    def _make_request(self, endpoint: str, data: Dict) -> Optional[Dict]:
-        """Make a request to the OpenAI ChatGPT API"""
+    def _get_http(self) -> httpx.AsyncClient:
+        """Get the shared HTTP session (keep-alive connections are reused)"""
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                headers={"Content-Type": "application/json"},
+                timeout=httpx.Timeout(OPENAI_REQUEST_TIMEOUT, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_CONNECTIONS
+                )
+            )
+        return self._http
+    
+    async def close(self):
+        """Close the shared HTTP session"""
+        if self._http is not None and not self._http.is_closed:
+            await self._http.aclose()
+        if self.cache:
+            self.cache.close()
+    
+    async def embed(self, text: str) -> Optional[List[float]]:
+        """Get an embedding vector for a text"""
         try:
-            response = requests.post(
-                f"{self.base_url}{endpoint}",
-                headers=self.headers,
-                json=data,
-                timeout=60
+            response = await self._get_http().post(
+                OPENAI_EMBEDDINGS_URL,
+                json={"model": OPENAI_EMBEDDING_MODEL, "input": text},
+                headers=self.headers
             )
             response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            print(f"API request error: {e}")
-            return None
+            return response.json()["data"][0]["embedding"]
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            print(f"Embedding request error: {e}")
             return None
     
-    def generate_response(self, prompt: str, context: str = "", max_tokens: int = 1000) -> Optional[str]:
-        """Generate a response using OpenAI ChatGPT"""
+    async def generate_response(self, prompt: str, context: str = "", max_tokens: int = None,
+                                cache_ttl: int = None, task: str = "general",
+                                context_tokens: int = CONTEXT_TOKEN_BUDGET) -> Optional[str]:
+        """Generate a response using OpenAI ChatGPT
+        
+        cache_ttl overrides the response cache TTL; 0 bypasses the cache.
+        task selects the model, max_tokens, temperature and timeout from TASK_PROFILES
+        and labels the call in usage accounting; context is compacted to context_tokens.
+        """
         try:
-            # Prepare the prompt with context
-            full_prompt = f"{context}\n\n{prompt}" if context else prompt
+            full_prompt, data, prompt_tokens = self._build_request(prompt, context, max_tokens, context_tokens, task)
             
-            # Add language instruction
-            if self.language == "ru":
-                full_prompt += "\n\nОтвечай на русском языке."
-            else:
-                full_prompt += "\n\nAnswer in English."
-            
-            data = {
-                "model": self.model,
-                "messages": [
-                    {"role": "user", "content": full_prompt}
-                ],
-                "max_tokens": max_tokens,
-                "temperature": 0.7,
-                "top_p": 1.0,
-                "frequency_penalty": 0.0,
-                "presence_penalty": 0.0
-            }
-            
-            response = self._make_request("", data)
-            if response and "choices" in response:
-                return response["choices"][0]["message"]["content"]
-            return None
+            model = data["model"]
+            params = {key: value for key, value in data.items() if key not in ("model", "messages")}
+            if cache_ttl == 0:
+                # Caller wants a fresh completion: no cache and no sharing
+                return await self._complete(data, task, prompt_tokens)
+            
+            if self.cache:
+                cached = await self.cache.get(model, full_prompt, params)
+                if cached is not None:
+                    return cached
+            
+            async def complete_and_cache() -> Optional[str]:
+                content = await self._complete(data, task, prompt_tokens)
+                if self.cache and content:
+                    await self.cache.set(model, full_prompt, params, content, cache_ttl)
+                return content
+            
+            # Identical prompts in flight at the same time share one API call
+            key = ResponseCache.make_key(model, full_prompt, params)
+            return await self.singleflight.do(key, complete_and_cache)
             
         except Exception as e:
             print(f"Error generating response: {e}")
             return None
     
-    def generate_article(self, topic: str, language: str = None) -> Optional[str]:
-        """Generate an article on a specific topic"""
+    @staticmethod
+    def get_profile(task: str) -> Dict:
+        """Request profile of a task"""
+        return TASK_PROFILES.get(task, TASK_PROFILES["general"])
+    
+    def _build_request(self, prompt: str, context: str, max_tokens: int = None,
+                       context_tokens: int = CONTEXT_TOKEN_BUDGET, task: str = "general") -> Tuple[str, Dict, int]:
+        """Build the full prompt and the chat completion payload within the token budget
+        
+        Returns the prompt, the payload and the estimated prompt tokens.
+        """
+        profile = self.get_profile(task)
+        # Long context is compacted instead of being sent whole
+        if context and self.budget.count(context) > context_tokens:
+            context = self.budget.compact(context, context_tokens)
+        
+        # Prepare the prompt with context
+        full_prompt = f"{context}\n\n{prompt}" if context else prompt
+        
+        # Add language instruction
+        if self.language == "ru":
+            full_prompt += "\n\nОтвечай на русском языке."
+        else:
+            full_prompt += "\n\nAnswer in English."
+        
+        prompt_tokens = self.budget.count(full_prompt)
+        data = {
+            "model": profile["model"],
+            "messages": [
+                {"role": "user", "content": full_prompt}
+            ],
+            "max_tokens": self.budget.cap_max_tokens(prompt_tokens, max_tokens or profile["max_tokens"]),
+            "temperature": profile["temperature"],
+            "top_p": 1.0,
+            "frequency_penalty": 0.0,
+            "presence_penalty": 0.0
+        }
+        return full_prompt, data, prompt_tokens
+    
+    async def stream_response(self, prompt: str, context: str = "", max_tokens: int = None,
+                              task: str = "general") -> AsyncIterator[str]:
+        """Stream a response as text deltas (server-sent events, never cached)
+        
+        Raises StreamInterrupted if the response ends incomplete after text was
+        yielded, so callers never take a partial answer for a finished one.
+        """
+        _, data, prompt_tokens = self._build_request(prompt, context, max_tokens, task=task)
+        data["stream"] = True
+        data["stream_options"] = {"include_usage": True}  # usage arrives in the last chunk
+        profile = self.get_profile(task)
+        usage = None
+        model = data["model"]
+        started = time.monotonic()
         try:
-            lang = language or self.language
+            # A provider can be replaced only until it has sent the first delta
+            for provider in self.router.ranked():
+                streamed = False
+                completed = False
+                finish_reason = None
+                try:
+                    model = provider.model or data["model"]
+                    await provider.limiter.acquire(prompt_tokens + data["max_tokens"], profile["priority"])
+                    async with self._get_http().stream(
+                        "POST", provider.url, json={**data, "model": model}, headers=provider.headers,
+                        timeout=httpx.Timeout(min(provider.timeout, profile["timeout"]), connect=10.0)
+                    ) as response:
+                        provider.record_headers(response.headers)
+                        if response.status_code == 429:
+                            # Try the next provider; this one holds its queue for the time it asked for
+                            provider.limiter.penalize(retry_delay(response.headers, 0))
+                        response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[len("data:"):].strip()
+                            if payload == "[DONE]":
+                                completed = True
+                                break
+                            try:
+                                chunk = json.loads(payload)
+                            except ValueError:
+                                continue
+                            usage = chunk.get("usage") or usage
+                            choices = chunk.get("choices") or []
+                            if choices and choices[0].get("finish_reason"):
+                                finish_reason = choices[0]["finish_reason"]
+                            delta = choices[0].get("delta", {}).get("content") if choices else None
+                            if delta:
+                                streamed = True
+                                yield delta
+                    if finish_reason == "length":
+                        # The provider is fine, the answer is not
+                        provider.record_success(None)
+                        raise StreamInterrupted("response cut off at max_tokens", cut_off=True)
+                    if completed or finish_reason:
+                        provider.record_success(None)
+                        return
+                    error = "stream ended before [DONE]"
+                except httpx.HTTPError as e:
+                    error = e
+                provider.record_failure()
+                print(f"API streaming error ({provider.name}): {error}")
+                if streamed:
+                    raise StreamInterrupted(str(error))
+        finally:
+            self.budget.record(task, usage, prompt_tokens, model, time.monotonic() - started)
+    
+    async def _complete(self, data: Dict, task: str, prompt_tokens: int) -> Optional[str]:
+        """Send a chat completion request and return the message text"""
+        # Short answers have comparable latency, so they can be hedged against a slow provider
+        profile = self.get_profile(task)
+        started = time.monotonic()
+        
+        def abandoned(provider):
+            # The losing request of a hedge is billed at least for its prompt
+            self.budget.record_abandoned(task, prompt_tokens, provider.model or data["model"])
+        
+        result = await self.router.complete(data, hedge=data["max_tokens"] <= LLM_HEDGE_MAX_TOKENS,
+                                            timeout=profile["timeout"], tokens=prompt_tokens + data["max_tokens"],
+                                            priority=profile["priority"], on_abandoned=abandoned)
+        if result is None:
+            return None
+        response, provider = result
+        self.budget.record(task, response.get("usage"), prompt_tokens,
+                           response.get("model") or provider.model or data["model"], time.monotonic() - started)
+        return response["choices"][0]["message"]["content"]
+    
+    def _article_prompt(self, topic: str, language: str) -> str:
+        """Prompt for generating an article on a topic"""
+        if language == "ru":
+            return f"""Напиши интересную и информативную статью на тему "{topic}". 
+            Статья должна быть:
+            - Длиной 300-500 слов
+            - Интересной для широкой аудитории
+            - Содержать актуальную информацию
+            - Хорошо структурированной
             
-            if lang == "ru":
-                prompt = f"""Напиши интересную и информативную статью на тему "{topic}". 
-                Статья должна быть:
-                - Длиной 300-500 слов
-                - Интересной для широкой аудитории
-                - Содержать актуальную информацию
-                - Хорошо структурированной
-                
-                Начни с заголовка и напиши полную статью."""
-            else:
-                prompt = f"""Write an interesting and informative article about "{topic}". 
-                The article should be:
-                - 300-500 words long
-                - Engaging for a broad audience
-                - Contain current information
-                - Well-structured
-                
-                Start with a headline and write the complete article."""
+            Начни с заголовка и напиши полную статью."""
+        return f"""Write an interesting and informative article about "{topic}". 
+            The article should be:
+            - 300-500 words long
+            - Engaging for a broad audience
+            - Contain current information
+            - Well-structured
             
-            return self.generate_response(prompt, max_tokens=2000)
+            Start with a headline and write the complete article."""
+    
+    async def generate_article(self, topic: str, language: str = None) -> Optional[str]:
+        """Generate an article on a specific topic"""
+        try:
+            lang = language or self.language
+            prompt = self._article_prompt(topic, lang)
+            # Every request for an article should produce a new one
+            return await self.generate_response(prompt, max_tokens=self._article_max_tokens(lang),
+                                                cache_ttl=0, task="article")
             
         except Exception as e:
             print(f"Error generating article: {e}")
             return None
     
-    def answer_comment(self, comment: str, post_context: str = "", language: str = None) -> Optional[str]:
-        """Generate a response to a user comment"""
+    def stream_article(self, topic: str, language: str = None) -> AsyncIterator[str]:
+        """Stream an article on a specific topic as text deltas"""
+        lang = language or self.language
+        prompt = self._article_prompt(topic, lang)
+        return self.stream_response(prompt, max_tokens=self._article_max_tokens(lang), task="article")
+    
+    def _article_max_tokens(self, language: str) -> int:
+        """Output budget for an article: what fits into a channel post, nothing that gets cut off"""
+        return self.budget.tokens_for_chars(MAX_ARTICLE_LENGTH - 100, language)
+    
+    async def answer_comment(self, comment: str, post_context: str = "", language: str = None,
+                             history: List[Tuple[str, str]] = None) -> Optional[str]:
+        """Generate a response to a user comment
+        
+        history holds the user's earlier (comment, response) turns, oldest first.
+        """
         try:
             lang = language or self.language
             
+            # The post context is the part of the prompt that can grow, keep it in budget
+            if post_context and self.budget.count(post_context) > COMMENT_CONTEXT_TOKEN_BUDGET:
+                post_context = self.budget.compact(post_context, COMMENT_CONTEXT_TOKEN_BUDGET)
+            
+            # Earlier turns go before the request; without them the prompt stays
+            # identical across users and can be shared or served from the cache
+            conversation = self._format_conversation(history, lang) if history else ""
+            
             if lang == "ru":
-                prompt = f"""Пользователь оставил комментарий: "{comment}"
+                prompt = f"""{conversation}Пользователь оставил комментарий: "{comment}"
                 
                 Контекст поста: {post_context if post_context else "Общий контекст"}
                 
@@ -115,7 +321,7 @@ class ChatGPTAPIClient:
                 - Не более 100 слов
                 - На русском языке"""
             else:
-                prompt = f"""A user left a comment: "{comment}"
+                prompt = f"""{conversation}A user left a comment: "{comment}"
                 
                 Post context: {post_context if post_context else "General context"}
                 
@@ -126,30 +332,51 @@ class ChatGPTAPIClient:
                 - No more than 100 words
                 - In English"""
             
-            return self.generate_response(prompt, max_tokens=500)
+            return await self.generate_response(prompt, task="comment")
             
         except Exception as e:
             print(f"Error answering comment: {e}")
             return None
     
-    def get_trending_topics(self, language: str = None) -> List[str]:
-        """Get trending topics for article generation"""
+    def _format_conversation(self, history: List[Tuple[str, str]], language: str) -> str:
+        """Latest turns that fit into CONVERSATION_TOKEN_BUDGET, oldest first"""
+        if language == "ru":
+            title, user_label, bot_label = "Предыдущий разговор с пользователем:", "Пользователь", "Ты"
+        else:
+            title, user_label, bot_label = "Previous conversation with this user:", "User", "You"
+        
+        lines = []
+        used = self.budget.count(title)
+        for comment, response in reversed(history):
+            turn = f"{user_label}: {comment}\n{bot_label}: {response}"
+            tokens = self.budget.count(turn)
+            if used + tokens > CONVERSATION_TOKEN_BUDGET:
+                break
+            lines.insert(0, turn)
+            used += tokens
+        
+        return f"{title}\n" + "\n".join(lines) + "\n\n" if lines else ""
+    
+    async def get_trending_topics(self, language: str = None, count: int = 5) -> List[str]:
+        """Get up to count trending topics for article generation"""
         try:
             lang = language or self.language
             
             if lang == "ru":
-                prompt = """Предложи 5 актуальных тем для статей, которые сейчас популярны в интернете. 
+                prompt = f"""Предложи {count} актуальных тем для статей, которые сейчас популярны в интернете. 
                 Темы должны быть интересными и актуальными. 
                 Верни только список тем, каждую с новой строки."""
             else:
-                prompt = """Suggest 5 trending topics for articles that are currently popular on the internet.
+                prompt = f"""Suggest {count} trending topics for articles that are currently popular on the internet.
                 Topics should be interesting and relevant.
                 Return only the list of topics, each on a new line."""
             
-            response = self.generate_response(prompt, max_tokens=300)
+            # About 40 tokens per topic, in case the profile's budget is too small for a long list
+            max_tokens = max(self.get_profile("trending_topics")["max_tokens"], 40 * count)
+            response = await self.generate_response(prompt, max_tokens=max_tokens, task="trending_topics")
             if response:
                 topics = [topic.strip() for topic in response.split('\n') if topic.strip()]
-                return topics[:5]  # Return max 5 topics
+                return topics[:count]
             
             return []
             
@@ -157,12 +384,61 @@ class ChatGPTAPIClient:
             print(f"Error getting trending topics: {e}")
             return []
     
-    def test_connection(self) -> bool:
+    async def test_connection(self) -> bool:
         """Test the connection to OpenAI ChatGPT API"""
         try:
             test_prompt = "Hello, this is a test message. Please respond with 'Connection successful'."
-            response = self.generate_response(test_prompt, max_tokens=50)
+            response = await self.generate_response(test_prompt, cache_ttl=CONNECTION_TEST_CACHE_TTL,
+                                                    task="connection_test")
             return response is not None and "successful" in response.lower()
         except Exception as e:
             print(f"Connection test failed: {e}")
             return False
+
+
+class SyncChatGPTAPIClient:
+    """Blocking facade over ChatGPTAPIClient for scripts and legacy callers"""
+    
+    def __init__(self, api_key: str = None, language: str = DEFAULT_LANGUAGE):
+        self.client = ChatGPTAPIClient(api_key, language)
+        # The async client lives on its own loop thread, so its pool is shared by all calls
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+    
+    @property
+    def language(self) -> str:
+        return self.client.language
+    
+    @language.setter
+    def language(self, value: str):
+        self.client.language = value
+    
+    def _run(self, coro):
+        """Run a coroutine on the client loop and wait for the result"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+    
+    def generate_response(self, prompt: str, context: str = "", max_tokens: int = None,
+                          cache_ttl: int = None, task: str = "general") -> Optional[str]:
+        return self._run(self.client.generate_response(prompt, context, max_tokens, cache_ttl, task))
+    
+    def generate_article(self, topic: str, language: str = None) -> Optional[str]:
+        return self._run(self.client.generate_article(topic, language))
+    
+    def answer_comment(self, comment: str, post_context: str = "", language: str = None,
+                       history: List[Tuple[str, str]] = None) -> Optional[str]:
+        return self._run(self.client.answer_comment(comment, post_context, language, history))
+    
+    def get_trending_topics(self, language: str = None, count: int = 5) -> List[str]:
+        return self._run(self.client.get_trending_topics(language, count))
+    
+    def test_connection(self) -> bool:
+        return self._run(self.client.test_connection())
+    
+    def close(self):
+        """Close the HTTP session and stop the loop thread"""
+        try:
+            self._run(self.client.close())
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
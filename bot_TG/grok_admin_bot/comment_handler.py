@@ -1,19 +1,28 @@
 import asyncio
+import html
 from typing import Dict, List, Optional, Tuple
 from telegram import Bot, Update, Message, User
 from telegram.ext import ContextTypes
 from chatgpt_api import ChatGPTAPIClient
-from config import ERROR_MESSAGES, DEFAULT_LANGUAGE, MAX_COMMENT_LENGTH
+from config import ERROR_MESSAGES, DEFAULT_LANGUAGE, MAX_COMMENT_LENGTH, CONVERSATION_CONTEXT_TURNS
+from storage import Storage, CommentHistoryRepository
+from conversation_memory import ConversationMemory
+from moderation import LocalModerator, BatchModerator, APPROPRIATE, SPAM, OFFENSIVE
 
 class CommentHandler:
     """Handles user comments and generates AI-powered responses"""
     
-    def __init__(self, bot: Bot, chatgpt_client: ChatGPTAPIClient, language: str = DEFAULT_LANGUAGE):
+    def __init__(self, bot: Bot, chatgpt_client: ChatGPTAPIClient, language: str = DEFAULT_LANGUAGE,
+                 storage: Storage = None):
         self.bot = bot
         self.chatgpt_client = chatgpt_client
         self.language = language
+        storage = storage or Storage()
         self.pending_comments = {}  # Track comments being processed
-        self.comment_history = {}   # Store comment history for context
+        self.comment_history = CommentHistoryRepository(storage)  # Comment history for analytics
+        self.memory = ConversationMemory(storage)  # Recent turns per user for prompts
+        self.moderator = LocalModerator()  # First moderation tier, before the LLM
+        self.batch_moderator = BatchModerator(chatgpt_client)  # LLM tier, batched
         
     async def process_comment(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Process a new comment and generate a response"""
@@ -112,14 +121,14 @@ class CommentHandler:
             if len(comment) > MAX_COMMENT_LENGTH:
                 return self.get_error_message("comment_too_long")
             
-            # Add user context
-            user_context = f"User: {user.first_name} {user.last_name or ''} (ID: {user.id})"
-            full_context = f"{context}\n\n{user_context}"
-            
-            # Generate response using OpenAI ChatGPT
-            response = self.chatgpt_client.answer_comment(comment, full_context, self.language)
+            # The user is mentioned in the reply, not in the prompt: only the user's own
+            # earlier turns make a prompt user-specific
+            history = self.memory.get_turns(user.id, CONVERSATION_CONTEXT_TURNS)
+            response = await self.chatgpt_client.answer_comment(comment, context, self.language, history)
             
             if response:
+                self.memory.add(user.id, comment, response)
+                
                 # Format the response
                 formatted_response = self.format_comment_response(response, user)
                 return formatted_response
@@ -135,11 +144,12 @@ class CommentHandler:
         try:
             context_parts = []
             
+            # Full text: the API client compacts it to the comment context token budget
             if message.text:
-                context_parts.append(f"Post content: {message.text[:200]}...")
+                context_parts.append(f"Post content: {message.text}")
             
             if message.caption:
-                context_parts.append(f"Post caption: {message.caption[:200]}...")
+                context_parts.append(f"Post caption: {message.caption}")
             
             if message.photo:
                 context_parts.append("Post contains image")
@@ -178,12 +188,12 @@ class CommentHandler:
         """Format the AI response for better presentation"""
         try:
             # Add user mention if possible
-            user_mention = f"@{user.username}" if user.username else user.first_name
+            user_mention = html.escape(f"@{user.username}" if user.username else user.first_name)
             
             if self.language == "ru":
-                formatted = f"💬 <b>Ответ от бота:</b>\n\n{response}\n\n— <i>С уважением, команда канала</i>"
+                formatted = f"💬 <b>Ответ для {user_mention}:</b>\n\n{response}\n\n— <i>С уважением, команда канала</i>"
             else:
-                formatted = f"💬 <b>Bot response:</b>\n\n{response}\n\n— <i>Best regards, channel team</i>"
+                formatted = f"💬 <b>Reply to {user_mention}:</b>\n\n{response}\n\n— <i>Best regards, channel team</i>"
             
             return formatted
             
@@ -194,26 +204,19 @@ class CommentHandler:
     def store_comment_history(self, user_id: int, comment: str, response: str, context: str):
         """Store comment history for future reference"""
         try:
-            if user_id not in self.comment_history:
-                self.comment_history[user_id] = []
-            
-            self.comment_history[user_id].append({
-                "comment": comment,
-                "response": response,
-                "context": context,
-                "timestamp": asyncio.get_event_loop().time()
-            })
-            
-            # Keep only last 10 comments per user
-            if len(self.comment_history[user_id]) > 10:
-                self.comment_history[user_id] = self.comment_history[user_id][-10:]
+            self.comment_history.add(user_id, comment, response, context)
                 
         except Exception as e:
             print(f"Error storing comment history: {e}")
     
     def get_user_comment_history(self, user_id: int) -> List[Dict]:
         """Get comment history for a specific user"""
-        return self.comment_history.get(user_id, [])
+        return self.comment_history.get_user_history(user_id)
+    
+    async def close(self):
+        """Finish pending moderation and save conversation memory"""
+        await self.batch_moderator.close()
+        self.memory.close()
     
     def get_error_message(self, error_type: str) -> str:
         """Get localized error message"""
@@ -223,31 +226,22 @@ class CommentHandler:
             return "An error occurred"
     
     async def moderate_comment(self, comment: str, user: User) -> Tuple[bool, str]:
-        """Moderate a comment for inappropriate content"""
+        """Moderate a comment for inappropriate content
+        
+        Clear cases are decided locally; only ambiguous comments cost an LLM call.
+        """
         try:
-            # Basic moderation using Grok AI
-            moderation_prompt = f"""Please moderate this comment: "{comment}"
-            
-            Determine if this comment is:
-            1. Appropriate and respectful
-            2. Spam or promotional
-            3. Offensive or inappropriate
-            4. Relevant to the discussion
-            
-            Respond with only: APPROPRIATE, SPAM, OFFENSIVE, or IRRELEVANT"""
-            
-            moderation_result = self.chatgpt_client.generate_response(moderation_prompt, max_tokens=50)
-            
-            if moderation_result:
-                result = moderation_result.strip().upper()
-                if result in ["APPROPRIATE", "RELEVANT"]:
-                    return True, "Comment approved"
-                elif result == "SPAM":
-                    return False, "Comment flagged as spam"
-                elif result == "OFFENSIVE":
-                    return False, "Comment flagged as offensive"
-                else:
-                    return False, "Comment flagged as irrelevant"
+            local_result = self.moderator.classify(comment)
+            if local_result:
+                label, reason = local_result
+                approved, message = self.moderation_verdict(label)
+                return approved, f"{message} ({reason})"
+            
+            # Ambiguous comment: ask the LLM together with other comments arriving now
+            label = await self.batch_moderator.classify(comment)
+            
+            if label:
+                return self.moderation_verdict(label)
             
             # Default to approval if moderation fails
             return True, "Comment approved (moderation unavailable)"
@@ -256,15 +250,27 @@ class CommentHandler:
             print(f"Error moderating comment: {e}")
             return True, "Comment approved (moderation error)"
     
+    def moderation_verdict(self, label: str) -> Tuple[bool, str]:
+        """Map a moderation label to (approved, message)"""
+        if label in [APPROPRIATE, "RELEVANT"]:
+            return True, "Comment approved"
+        elif label == SPAM:
+            return False, "Comment flagged as spam"
+        elif label == OFFENSIVE:
+            return False, "Comment flagged as offensive"
+        else:
+            return False, "Comment flagged as irrelevant"
+    
     async def get_comment_analytics(self) -> Dict:
         """Get analytics about comment handling"""
         try:
-            total_comments = sum(len(history) for history in self.comment_history.values())
-            unique_users = len(self.comment_history.keys())
+            total_comments = self.comment_history.count()
+            unique_users = self.comment_history.count_users()
             
             return {
                 "total_comments_processed": total_comments,
                 "unique_users": unique_users,
+                "moderation": self.moderator.get_statistics(),
                 "average_response_time": "N/A",  # Could implement timing tracking
                 "success_rate": "N/A"  # Could implement success tracking
             }
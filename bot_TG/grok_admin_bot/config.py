@@ -1,4 +1,5 @@
 # Configuration file for ChatGPT Telegram Bot
+import json
 import os
 from dotenv import load_dotenv
 
@@ -8,10 +9,103 @@ load_dotenv()
 # Telegram Bot Token
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 
+# Update delivery: "polling" or "webhook"
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")  # public HTTPS base URL Telegram sends updates to
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "127.0.0.1")  # behind a reverse proxy
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_SECRET_TOKEN = os.getenv("WEBHOOK_SECRET_TOKEN", "")  # 1-256 chars of A-Z, a-z, 0-9, _ and -
+# Processes sharing the port; per-chat update order only holds within one process
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "1"))
+WEBHOOK_MAX_CONNECTIONS = 100  # parallel connections Telegram opens to the webhook
+
 # OpenAI ChatGPT API Configuration
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
 OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
 OPENAI_MODEL = "gpt-3.5-turbo"  # or "gpt-4" for better quality
+OPENAI_FAST_MODEL = os.getenv("OPENAI_FAST_MODEL", "gpt-4o-mini")  # short, latency-sensitive tasks
+OPENAI_ARTICLE_MODEL = os.getenv("OPENAI_ARTICLE_MODEL", OPENAI_MODEL)
+OPENAI_EMBEDDINGS_URL = "https://api.openai.com/v1/embeddings"
+OPENAI_EMBEDDING_MODEL = "text-embedding-3-small"
+OPENAI_REQUEST_TIMEOUT = 60  # seconds
+HTTP_MAX_CONNECTIONS = 20  # shared connection pool for all API calls
+
+# LLM routing: extra OpenAI-compatible endpoints (Grok, a local llama.cpp server, ...) as a JSON list of
+# {"name", "url", "model", "api_key" or "api_key_env", "timeout", "health_path"}; OPENAI_* is the first provider.
+# Without "model" a provider gets the model of the task profile; "health_path" is the endpoint the health
+# monitor probes (default "models", null for none)
+LLM_PROVIDERS = json.loads(os.getenv("LLM_PROVIDERS", "[]"))
+LLM_EWMA_ALPHA = 0.2  # weight of the newest sample in latency and error averages
+LLM_HEDGE_FACTOR = 2.0  # a request slower than this times the usual latency is also sent to the next provider
+LLM_HEDGE_MIN_DELAY = 1.0  # seconds
+LLM_HEDGE_MAX_TOKENS = 300  # longer generations are not hedged
+LLM_FAILURE_THRESHOLD = 3  # consecutive failures that take a provider out of rotation
+LLM_COOLDOWN = 30  # seconds a failing provider stays out
+LLM_MAX_RETRIES = 3  # retries of a request answered with 429 or 5xx
+LLM_RETRY_BASE_DELAY = 0.5  # seconds, doubled on every retry unless the API says how long to wait
+LLM_RETRY_MAX_DELAY = 20  # seconds
+# Rate limits assumed until the API reports its own in x-ratelimit-* headers
+RATE_LIMIT_REQUESTS_PER_MINUTE = 500
+RATE_LIMIT_TOKENS_PER_MINUTE = 200000
+LLM_LATENCY_SAMPLES = 200  # recent request latencies kept per provider for p50/p95
+HEALTH_CHECK_INTERVAL = 60  # seconds between background provider checks and /status refreshes
+
+# Token budgeting
+MODEL_CONTEXT_WINDOW = 16385  # tokens, gpt-3.5-turbo
+CONTEXT_TOKEN_BUDGET = 1000  # context longer than this is compacted before sending
+COMMENT_CONTEXT_TOKEN_BUDGET = 300  # post context sent with a comment
+COMMENT_RESPONSE_MAX_TOKENS = 250  # ~100 words
+
+# Response Cache
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+RESPONSE_CACHE_TTL = 3600  # seconds
+RESPONSE_CACHE_MAX_ENTRIES = 1000  # in memory
+RESPONSE_CACHE_MAX_DISK_ENTRIES = 20000
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB", "response_cache.db")  # empty = memory only
+# Cosine similarity for near-duplicate prompts, 0 disables embedding lookups
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0"))
+CONNECTION_TEST_CACHE_TTL = 60  # seconds
+
+# Storage: articles, schedules and comment history
+STORAGE_DB = os.getenv("STORAGE_DB", "bot_data.db")
+STORAGE_FLUSH_INTERVAL = 1.0  # seconds queued writes wait before commit
+STORAGE_BATCH_SIZE = 100  # queued writes that trigger an immediate commit
+ARTICLE_CACHE_SIZE = 200  # articles kept in memory
+COMMENT_HISTORY_LIMIT = 10  # comments per user returned as history
+COMMENT_HISTORY_RETENTION_DAYS = 90
+SEARCH_PAGE_SIZE = 5  # articles per /search page
+CALLBACK_STATE_TTL = 7 * 24 * 3600  # seconds inline keyboard buttons keep working
+CALLBACK_CACHE_SIZE = 1000  # button states kept in memory
+EXPORT_FORMATS = ("jsonl", "csv", "json", "text")  # /export formats, the first is the default
+EXPORT_MAX_DOCUMENT_SIZE = 50 * 1024 * 1024  # bytes, Telegram's limit for documents sent by bots
+
+# Conversation memory: recent turns per commenter fed back into comment answers
+CONVERSATION_MAX_TURNS = 10  # turns kept per user
+CONVERSATION_MAX_USERS = 5000  # users kept in memory, the rest are spilled to the database
+CONVERSATION_CONTEXT_TURNS = 3  # latest turns added to the prompt
+CONVERSATION_TOKEN_BUDGET = 300  # tokens the added turns may take
+
+# Moderation: local rules and classifier decide clear cases, the rest go to the LLM
+MODERATION_WEIGHTS_FILE = os.getenv("MODERATION_WEIGHTS_FILE", "moderation_weights.json")
+MODERATION_SPAM_THRESHOLD = 0.95  # spam probability above which a comment is rejected locally
+MODERATION_HAM_THRESHOLD = 0.05  # spam probability below which a comment is approved locally
+MODERATION_MAX_LINKS = 2  # more links than this is spam
+MODERATION_BATCH_WINDOW = 0.25  # seconds comments wait to be moderated by the LLM together
+MODERATION_BATCH_SIZE = 20  # comments that trigger an immediate LLM moderation request
+MODERATION_BLOCKED_WORDS = [
+    # word* also blocks every word starting with it
+    word.strip() for word in os.getenv(
+        "MODERATION_BLOCKED_WORDS", "идиот*,дебил*,ублюд*,idiot*,moron*,retard,retarded,retards"
+    ).split(",")
+    if word.strip()
+]
+
+# Scheduler for scheduled posts and article generation
+SCHEDULER_MAX_CONCURRENCY = 4  # jobs running at the same time
+SCHEDULER_MISFIRE_GRACE_TIME = 24 * 3600  # one-off jobs missed by longer are dropped
+SCHEDULER_JITTER = 60  # seconds of random delay added to recurring article generation
+SCHEDULER_SYNC_INTERVAL = 5  # seconds between job table reloads when several workers share it
 
 # Channel Management
 ADMIN_CHANNEL_ID = os.getenv("ADMIN_CHANNEL_ID", "")
@@ -21,7 +115,43 @@ PUBLIC_CHANNEL_ID = os.getenv("PUBLIC_CHANNEL_ID", "")
 MAX_COMMENT_LENGTH = 1000
 MAX_ARTICLE_LENGTH = 4000
 COMMENT_RESPONSE_TIMEOUT = 30  # seconds
-ARTICLE_GENERATION_TIMEOUT = 120  # seconds
+ARTICLE_GENERATION_TIMEOUT = 120  # seconds, deadline for a single article
+ARTICLE_BATCH_CONCURRENCY = 4  # articles generated in parallel by one batch
+MAX_BATCH_ARTICLES = 10  # at most len(DEFAULT_TOPICS), which fill up a short trending list
+MAX_CONCURRENT_UPDATES = 32  # updates handled in parallel by the Application
+MAX_PENDING_UPDATES = 1000  # updates running or waiting for a slot; more wait outside the processor
+COMMENT_LANE_MAX_CONCURRENCY = 24  # of those at most this many comments, the rest is kept for commands
+TELEGRAM_MESSAGE_LIMIT = 4096  # characters
+
+# Streaming: a streamed article is shown by editing one message, throttled to
+# stay under Telegram's edit rate limits
+STREAM_EDIT_INTERVAL = 1.0  # seconds between edits
+STREAM_EDIT_MIN_CHARS = 200  # new characters that allow an earlier edit
+
+# Per-task request profiles; tasks without a profile use "general".
+# priority orders requests waiting for the rate limit, lower first
+TASK_PROFILES = {
+    "general": {"model": OPENAI_MODEL, "max_tokens": 1000, "temperature": 0.7, "timeout": OPENAI_REQUEST_TIMEOUT,
+                "priority": 1},
+    "article": {"model": OPENAI_ARTICLE_MODEL, "max_tokens": 2000, "temperature": 0.8,
+                "timeout": ARTICLE_GENERATION_TIMEOUT, "priority": 2},
+    "comment": {"model": OPENAI_FAST_MODEL, "max_tokens": COMMENT_RESPONSE_MAX_TOKENS, "temperature": 0.7,
+                "timeout": COMMENT_RESPONSE_TIMEOUT, "priority": 0},
+    "moderation": {"model": OPENAI_FAST_MODEL, "max_tokens": 10, "temperature": 0.0, "timeout": 15, "priority": 0},
+    "trending_topics": {"model": OPENAI_FAST_MODEL, "max_tokens": 200, "temperature": 0.9, "timeout": 20,
+                        "priority": 1},
+    "connection_test": {"model": OPENAI_FAST_MODEL, "max_tokens": 10, "temperature": 0.0, "timeout": 10,
+                        "priority": 0}
+}
+
+# USD per 1M prompt and completion tokens, for cost accounting (dated model versions match by prefix)
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0)
+}
 
 # Popular Topics for Article Generation
 DEFAULT_TOPICS = [
@@ -32,7 +162,9 @@ DEFAULT_TOPICS = [
     "business insights",
     "health and wellness",
     "environmental news",
-    "space exploration"
+    "space exploration",
+    "education and learning",
+    "travel and culture"
 ]
 
 # Language Settings
@@ -0,0 +1,84 @@
+import json
+import time
+from collections import OrderedDict, deque
+from typing import Deque, List, Tuple
+from storage import Storage
+from config import CONVERSATION_MAX_TURNS, CONVERSATION_MAX_USERS
+
+class ConversationMemory:
+    """Recent comment/response turns per user, bounded in memory
+
+    Each user has a ring buffer of the last CONVERSATION_MAX_TURNS turns. At most
+    CONVERSATION_MAX_USERS users are kept in memory; the least recently active
+    ones are spilled to SQLite and loaded back when they comment again. With a
+    shared storage every change is written through and nothing is kept, since
+    the user's next comment may reach another process.
+    """
+
+    def __init__(self, storage: Storage = None, max_turns: int = CONVERSATION_MAX_TURNS,
+                 max_users: int = CONVERSATION_MAX_USERS):
+        self.storage = storage
+        self.shared = bool(storage and storage.shared)
+        self.max_turns = max_turns
+        self.max_users = 0 if self.shared else max_users
+        self._users: "OrderedDict[int, Deque[Tuple[str, str]]]" = OrderedDict()
+        self._dirty = set()  # users changed since they were last spilled
+
+    def get_turns(self, user_id: int, limit: int = None) -> List[Tuple[str, str]]:
+        """Latest (comment, response) turns of a user, oldest first"""
+        turns = list(self._get(user_id))
+        return turns[-limit:] if limit else turns
+
+    def add(self, user_id: int, comment: str, response: str):
+        turns = self._get(user_id)
+        turns.append((comment, response))
+        if self.shared:
+            self._spill(user_id, turns)
+        else:
+            self._dirty.add(user_id)
+
+    def _get(self, user_id: int) -> Deque[Tuple[str, str]]:
+        turns = self._users.get(user_id)
+        if turns is None:
+            turns = deque(self._load(user_id), maxlen=self.max_turns)
+            self._users[user_id] = turns
+            self._evict()
+        else:
+            self._users.move_to_end(user_id)
+        return turns
+
+    def _evict(self):
+        while len(self._users) > self.max_users:
+            user_id, turns = self._users.popitem(last=False)
+            if user_id in self._dirty:
+                self._spill(user_id, turns)
+
+    def _load(self, user_id: int) -> List[Tuple[str, str]]:
+        if not self.storage:
+            return []
+        try:
+            rows = self.storage.query("SELECT turns FROM conversation_memory WHERE user_id = ?", (user_id,))
+            return [tuple(turn) for turn in json.loads(rows[0]["turns"])] if rows else []
+        except Exception as e:
+            print(f"Error loading conversation memory: {e}")
+            return []
+
+    def _spill(self, user_id: int, turns: Deque[Tuple[str, str]]):
+        self._dirty.discard(user_id)
+        if not self.storage:
+            return
+        self.storage.write(
+            "INSERT OR REPLACE INTO conversation_memory (user_id, turns, updated_at) VALUES (?, ?, ?)",
+            (user_id, json.dumps(list(turns), ensure_ascii=False), time.time())
+        )
+
+    def close(self):
+        """Spill every changed user so the memory survives a restart"""
+        for user_id in list(self._dirty):
+            self._spill(user_id, self._users[user_id])
+
+    def get_statistics(self) -> dict:
+        return {
+            "users_in_memory": len(self._users),
+            "turns_in_memory": sum(len(turns) for turns in self._users.values())
+        }
@@ -0,0 +1,99 @@
+import asyncio
+import time
+from typing import Callable, Dict, List, Optional
+from chatgpt_api import ChatGPTAPIClient
+from llm_router import LLMProvider
+from config import HEALTH_CHECK_INTERVAL
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[round(fraction * (len(ordered) - 1))]
+
+class HealthMonitor:
+    """Keeps LLM provider health and bot statistics fresh in the background
+
+    Every HEALTH_CHECK_INTERVAL seconds each provider's health_path endpoint
+    (models by default; cheap, no tokens spent) is probed and the registered
+    collectors are run, so /status only reads the cached results. Probes are
+    only reported: rotation and cooldown follow real requests, since some
+    providers lack the probed endpoint.
+    """
+
+    def __init__(self, chatgpt_client: ChatGPTAPIClient, interval: float = HEALTH_CHECK_INTERVAL):
+        self.chatgpt_client = chatgpt_client
+        self.interval = interval
+        self._collectors: Dict[str, Callable] = {}
+        self._checks: Dict[str, Dict] = {}  # provider name -> latest probe
+        self._snapshot: Dict[str, Dict] = {}  # collector name -> latest result
+        self._task = None
+        self.updated_at = None
+
+    def add_collector(self, name: str, collector: Callable):
+        """Refresh a statistic (a function or coroutine function returning a dict) in the background"""
+        self._collectors[name] = collector
+
+    def get(self, name: str) -> Dict:
+        return self._snapshot.get(name, {})
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+
+    async def refresh(self):
+        """Probe every provider and run every collector once"""
+        providers = self.chatgpt_client.router.providers
+        await asyncio.gather(*(self._probe(provider) for provider in providers if provider.health_path))
+        for name, collector in self._collectors.items():
+            try:
+                result = collector()
+                self._snapshot[name] = await result if asyncio.iscoroutine(result) else result
+            except Exception as e:
+                print(f"Error collecting {name} statistics: {e}")
+        self.updated_at = time.time()
+
+    async def _probe(self, provider: LLMProvider):
+        started = time.monotonic()
+        check = {"checked_at": time.time(), "ok": False, "latency": None, "error": None}
+        try:
+            response = await self.chatgpt_client.router.get_http().get(
+                provider.url_for(provider.health_path), headers=provider.headers, timeout=10.0
+            )
+            check["latency"] = time.monotonic() - started
+            provider.record_headers(response.headers)
+            response.raise_for_status()
+            check["ok"] = True
+        except Exception as e:
+            check["error"] = str(e) or type(e).__name__
+        self._checks[provider.name] = check
+
+    def get_provider_health(self) -> List[Dict]:
+        """Cached health of every provider, with p50/p95 of its recent request latencies"""
+        health = []
+        for provider in self.chatgpt_client.router.providers:
+            samples = list(provider.samples)
+            health.append({
+                **provider.get_statistics(),
+                "check": self._checks.get(provider.name),
+                "p50": percentile(samples, 0.5),
+                "p95": percentile(samples, 0.95)
+            })
+        return health
+
+    def is_healthy(self) -> bool:
+        """At least one provider answered its latest probe or, if it isn't probed, is in rotation"""
+        return any(check["ok"] for check in self._checks.values()) or any(
+            provider.available for provider in self.chatgpt_client.router.providers if not provider.health_path
+        )
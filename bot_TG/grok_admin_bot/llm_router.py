@@ -0,0 +1,247 @@
+import asyncio
+import os
+import time
+from collections import deque
+import httpx
+from typing import Callable, Dict, List, Optional, Tuple
+from config import (
+    OPENAI_API_KEY, OPENAI_API_URL, OPENAI_REQUEST_TIMEOUT, LLM_PROVIDERS,
+    LLM_EWMA_ALPHA, LLM_HEDGE_FACTOR, LLM_HEDGE_MIN_DELAY, LLM_FAILURE_THRESHOLD, LLM_COOLDOWN,
+    LLM_LATENCY_SAMPLES, LLM_MAX_RETRIES, RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE
+)
+from rate_limiter import AdaptiveRateLimiter, retry_delay
+
+RATE_LIMIT_HEADERS = ("x-ratelimit-limit-requests", "x-ratelimit-remaining-requests", "x-ratelimit-reset-requests",
+                      "x-ratelimit-limit-tokens", "x-ratelimit-remaining-tokens", "x-ratelimit-reset-tokens")
+
+class LLMProvider:
+    """One OpenAI-compatible chat completions endpoint and its observed health"""
+
+    def __init__(self, name: str, url: str, model: Optional[str], api_key: str = "",
+                 timeout: float = OPENAI_REQUEST_TIMEOUT, requests_per_minute: float = RATE_LIMIT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = RATE_LIMIT_TOKENS_PER_MINUTE, health_path: Optional[str] = "models"):
+        self.name = name
+        self.url = url
+        self.model = model  # None: the model the task asks for
+        self.timeout = timeout
+        self.health_path = health_path  # endpoint the health monitor probes, None: not probed
+        # The complete header set: the shared HTTP client sends no credentials of its own
+        self.headers = {"Content-Type": "application/json"}
+        if api_key:
+            self.headers["Authorization"] = f"Bearer {api_key}"
+        self.limiter = AdaptiveRateLimiter(requests_per_minute, tokens_per_minute)
+        self.latency = None  # EWMA seconds of successful short requests
+        self.error_rate = 0.0  # EWMA of failures
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.samples = deque(maxlen=LLM_LATENCY_SAMPLES)  # recent latencies for percentiles
+        self.last_success = None  # unix time
+        self.rate_limits: Dict[str, str] = {}  # latest x-ratelimit-* headers
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "LLMProvider":
+        api_key = config.get("api_key") or os.getenv(config.get("api_key_env", ""), "")
+        return cls(config["name"], config["url"], config.get("model"), api_key,
+                   config.get("timeout", OPENAI_REQUEST_TIMEOUT),
+                   config.get("requests_per_minute", RATE_LIMIT_REQUESTS_PER_MINUTE),
+                   config.get("tokens_per_minute", RATE_LIMIT_TOKENS_PER_MINUTE),
+                   config.get("health_path", "models"))
+
+    @property
+    def available(self) -> bool:
+        return time.time() >= self.cooldown_until
+
+    def score(self) -> float:
+        """Expected cost of a request: latency inflated by the error rate"""
+        # Providers without measurements yet are tried as if they were fast
+        latency = self.latency if self.latency is not None else 0.0
+        return latency * (1.0 + 4.0 * self.error_rate) + self.error_rate
+
+    def record_success(self, latency: Optional[float]):
+        self.calls += 1
+        self.consecutive_failures = 0
+        self.last_success = time.time()
+        self.error_rate *= 1.0 - LLM_EWMA_ALPHA
+        if latency is not None:
+            self.record_latency(latency)
+            self.samples.append(latency)
+
+    def record_headers(self, headers):
+        """Keep the rate limit headers of the latest response and feed them to the limiter"""
+        rate_limits = {name: headers[name] for name in RATE_LIMIT_HEADERS if name in headers}
+        if rate_limits:
+            self.rate_limits = rate_limits
+            self.limiter.update(headers)
+
+    def url_for(self, endpoint: str) -> str:
+        """URL of another endpoint of the same API, e.g. models"""
+        return f"{self.url.rsplit('/chat/completions', 1)[0]}/{endpoint}"
+
+    def record_latency(self, latency: float):
+        self.latency = latency if self.latency is None else \
+            LLM_EWMA_ALPHA * latency + (1.0 - LLM_EWMA_ALPHA) * self.latency
+
+    def record_failure(self):
+        self.calls += 1
+        self.failures += 1
+        self.consecutive_failures += 1
+        self.error_rate = LLM_EWMA_ALPHA + (1.0 - LLM_EWMA_ALPHA) * self.error_rate
+        if self.consecutive_failures >= LLM_FAILURE_THRESHOLD:
+            self.cooldown_until = time.time() + LLM_COOLDOWN
+
+    def get_statistics(self) -> Dict:
+        return {
+            "name": self.name,
+            "model": self.model or "task",
+            "latency": round(self.latency, 2) if self.latency is not None else None,
+            "error_rate": round(self.error_rate, 3),
+            "calls": self.calls,
+            "failures": self.failures,
+            "available": self.available,
+            "probed": bool(self.health_path),
+            "last_success": self.last_success,
+            "rate_limits": dict(self.rate_limits),
+            "limiter": self.limiter.get_statistics()
+        }
+
+
+def load_providers() -> List[LLMProvider]:
+    """The OpenAI endpoint from OPENAI_* settings followed by LLM_PROVIDERS"""
+    providers = []
+    if OPENAI_API_KEY:
+        providers.append(LLMProvider("openai", OPENAI_API_URL, None, OPENAI_API_KEY))
+    for config in LLM_PROVIDERS:
+        try:
+            providers.append(LLMProvider.from_config(config))
+        except KeyError as e:
+            print(f"Error in LLM_PROVIDERS entry {config}: missing {e}")
+    return providers or [LLMProvider("openai", OPENAI_API_URL, None, OPENAI_API_KEY)]
+
+
+class LLMRouter:
+    """Sends chat completions to the fastest healthy provider
+
+    Providers are ranked by EWMA latency and error rate. A request that fails
+    moves on to the next provider right away; a hedged request that is still
+    running after LLM_HEDGE_FACTOR times the provider's usual latency is also
+    sent to the next one, and whichever answers first wins.
+    """
+
+    def __init__(self, providers: List[LLMProvider], get_http: Callable[[], httpx.AsyncClient]):
+        self.providers = providers
+        self.get_http = get_http
+        self.hedged = 0
+        self.fallbacks = 0
+        self.retries = 0
+
+    def ranked(self) -> List[LLMProvider]:
+        """Providers in the order they should be tried"""
+        available = [provider for provider in self.providers if provider.available]
+        cooling = [provider for provider in self.providers if not provider.available]
+        # Cooling down providers are a last resort, soonest back first
+        return sorted(available, key=LLMProvider.score) + sorted(cooling, key=lambda p: p.cooldown_until)
+
+    async def _send(self, provider: LLMProvider, data: Dict, measure: bool, timeout: float = None,
+                    tokens: float = 0, priority: int = 1, sent: set = None) -> Dict:
+        timeout = min(provider.timeout, timeout) if timeout else provider.timeout
+        started = None  # when the request left the rate limit queue
+        try:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                await provider.limiter.acquire(tokens, priority)
+                started = time.monotonic()
+                if sent is not None:
+                    sent.add(provider.name)
+                response = await self.get_http().post(
+                    provider.url, json={**data, "model": provider.model or data["model"]},
+                    headers=provider.headers, timeout=httpx.Timeout(timeout, connect=10.0)
+                )
+                provider.record_headers(response.headers)
+                if (response.status_code == 429 or response.status_code >= 500) and attempt < LLM_MAX_RETRIES:
+                    delay = retry_delay(response.headers, attempt)
+                    if response.status_code == 429:
+                        # Everyone waits, not just this request
+                        provider.limiter.penalize(delay)
+                    else:
+                        await asyncio.sleep(delay)
+                    self.retries += 1
+                    continue
+                response.raise_for_status()
+                result = response.json()
+                if "choices" not in result:
+                    raise ValueError("response has no choices")
+                break
+        except asyncio.CancelledError:
+            # Lost a hedge race: the time so far is a lower bound of its latency
+            if measure and started is not None:
+                provider.record_latency(time.monotonic() - started)
+            raise
+        except Exception:
+            provider.record_failure()
+            raise
+        provider.record_success(time.monotonic() - started if measure else None)
+        return result
+
+    def _hedge_delay(self, provider: LLMProvider) -> float:
+        if provider.latency is None:
+            return OPENAI_REQUEST_TIMEOUT
+        return max(LLM_HEDGE_MIN_DELAY, provider.latency * LLM_HEDGE_FACTOR)
+
+    async def complete(self, data: Dict, hedge: bool = True, timeout: float = None, tokens: float = 0,
+                       priority: int = 1, on_abandoned: Callable[[LLMProvider], None] = None
+                       ) -> Optional[Tuple[Dict, LLMProvider]]:
+        """Chat completion response and the provider that gave it, None if all failed
+
+        timeout caps each provider's own timeout for this request; tokens (prompt
+        plus max_tokens) and priority place it in the providers' rate limit queues.
+        hedge=False is for long generations: their latency says nothing about
+        provider health, so they are neither hedged nor counted in the EWMA.
+        on_abandoned is called for every provider whose request was already sent
+        when it was cancelled (a lost hedge race): it is billed all the same.
+        """
+        candidates = self.ranked()
+        running: Dict[asyncio.Task, LLMProvider] = {}
+        sent = set()  # names of providers whose request went out
+
+        def launch():
+            provider = candidates.pop(0)
+            running[asyncio.create_task(
+                self._send(provider, data, hedge, timeout, tokens, priority, sent)
+            )] = provider
+
+        launch()
+        try:
+            while running:
+                # How long to wait before hedging; timeout stays the request timeout launch() sends
+                wait_timeout = None
+                if hedge and candidates and len(running) == 1:
+                    wait_timeout = self._hedge_delay(next(iter(running.values())))
+                done, _ = await asyncio.wait(running, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # Slow answer: race it against the next provider
+                    self.hedged += 1
+                    launch()
+                    continue
+                for task in done:
+                    provider = running.pop(task)
+                    if task.exception() is None:
+                        return task.result(), provider
+                    print(f"LLM provider {provider.name} failed: {task.exception()}")
+                if not running and candidates:
+                    self.fallbacks += 1
+                    launch()
+            return None
+        finally:
+            for task, provider in running.items():
+                task.cancel()
+                if on_abandoned and provider.name in sent:
+                    on_abandoned(provider)
+
+    def get_statistics(self) -> Dict:
+        return {
+            "providers": [provider.get_statistics() for provider in self.providers],
+            "hedged": self.hedged,
+            "fallbacks": self.fallbacks,
+            "retries": self.retries
+        }
@@ -1,12 +1,27 @@
 import asyncio
+import html
 import logging
+import multiprocessing
+import os
+from datetime import datetime, timedelta
+from typing import Dict
 from telegram import Bot, Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
-from config import TELEGRAM_BOT_TOKEN, DEFAULT_LANGUAGE, ERROR_MESSAGES
+from config import (
+    TELEGRAM_BOT_TOKEN, DEFAULT_LANGUAGE, ERROR_MESSAGES, MAX_CONCURRENT_UPDATES, MAX_BATCH_ARTICLES,
+    SEARCH_PAGE_SIZE, BOT_MODE, WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET_TOKEN, WEBHOOK_WORKERS,
+    WEBHOOK_MAX_CONNECTIONS, SUPPORTED_LANGUAGES, EXPORT_FORMATS, EXPORT_MAX_DOCUMENT_SIZE
+)
 from chatgpt_api import ChatGPTAPIClient
 from channel_manager import ChannelManager
 from comment_handler import CommentHandler
 from article_generator import ArticleGenerator
+from stream_editor import StreamingMessageEditor
+from storage import Storage, CallbackStateRepository, SNIPPET_START, SNIPPET_END
+from scheduler import JobScheduler
+from update_processor import PriorityUpdateProcessor
+from webhook import WebhookServer
+from health_monitor import HealthMonitor
 
 # Configure logging
 logging.basicConfig(
@@ -18,19 +33,40 @@ logger = logging.getLogger(__name__)
 class GrokAdminBot:
     """Main Telegram bot class with Grok AI integration"""
     
-    def __init__(self, token: str, language: str = DEFAULT_LANGUAGE):
+    def __init__(self, token: str, language: str = DEFAULT_LANGUAGE, worker_id: int = 0, workers: int = 1):
         self.token = token
         self.language = language
         self.bot = Bot(token=token)
+        # Worker 0 registers the webhook and runs the scheduler; all workers handle updates
+        self.worker_id = worker_id
+        self.primary = worker_id == 0
+        self.workers = workers
+        self.webhook = None
         
-        # Initialize components
+        # Initialize components; several workers share one database
+        self.storage = Storage(shared=workers > 1)
+        self.scheduler = JobScheduler(self.storage)
+        self.callback_states = CallbackStateRepository(self.storage)  # what inline buttons do
         self.chatgpt_client = ChatGPTAPIClient(language=language)
-        self.channel_manager = ChannelManager(self.bot, language=language)
-        self.comment_handler = CommentHandler(self.bot, self.chatgpt_client, language=language)
-        self.article_generator = ArticleGenerator(self.bot, self.chatgpt_client, self.channel_manager, language=language)
+        self.channel_manager = ChannelManager(self.bot, language=language, scheduler=self.scheduler)
+        self.comment_handler = CommentHandler(self.bot, self.chatgpt_client, language=language,
+                                              storage=self.storage)
+        self.article_generator = ArticleGenerator(self.bot, self.chatgpt_client, self.channel_manager,
+                                                  language=language, storage=self.storage,
+                                                  scheduler=self.scheduler)
+        # /status reads provider health and statistics collected in the background
+        self.health_monitor = HealthMonitor(self.chatgpt_client)
+        self.health_monitor.add_collector("comments", self.comment_handler.get_comment_analytics)
+        self.health_monitor.add_collector("articles", self.article_generator.get_article_statistics)
         
-        # Initialize application
-        self.application = Application.builder().token(token).build()
+        # Initialize application; updates are processed concurrently so a slow
+        # completion does not hold up other chats, and commands go before comments
+        self.update_processor = PriorityUpdateProcessor(MAX_CONCURRENT_UPDATES)
+        builder = Application.builder().token(token).concurrent_updates(self.update_processor)
+        if BOT_MODE == "webhook":
+            # Updates come from our own webhook server, not from the updater
+            builder = builder.updater(None)
+        self.application = builder.build()
         self.setup_handlers()
         
     def setup_handlers(self):
@@ -41,11 +77,17 @@ class GrokAdminBot:
         self.application.add_handler(CommandHandler("status", self.status_command))
         self.application.add_handler(CommandHandler("generate_article", self.generate_article_command))
         self.application.add_handler(CommandHandler("generate_trending", self.generate_trending_command))
+        self.application.add_handler(CommandHandler("generate_multiple", self.generate_multiple_command))
         self.application.add_handler(CommandHandler("post_article", self.post_article_command))
         self.application.add_handler(CommandHandler("channel_info", self.channel_info_command))
         self.application.add_handler(CommandHandler("comment_stats", self.comment_stats_command))
         self.application.add_handler(CommandHandler("article_stats", self.article_stats_command))
+        self.application.add_handler(CommandHandler("search", self.search_command))
+        self.application.add_handler(CommandHandler("export", self.export_command))
         self.application.add_handler(CommandHandler("schedule_articles", self.schedule_articles_command))
+        self.application.add_handler(CommandHandler("schedule_post", self.schedule_post_command))
+        self.application.add_handler(CommandHandler("jobs", self.jobs_command))
+        self.application.add_handler(CommandHandler("cancel_job", self.cancel_job_command))
         self.application.add_handler(CommandHandler("language", self.language_command))
         self.application.add_handler(CommandHandler("test_chatgpt", self.test_chatgpt_command))
         
@@ -89,18 +131,44 @@ class GrokAdminBot:
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /status command"""
         try:
-            # Check OpenAI ChatGPT connection
-            chatgpt_status = self.chatgpt_client.test_connection()
-            
-            # Get basic statistics
-            comment_stats = self.comment_handler.get_comment_analytics()
-            article_stats = self.article_generator.get_article_statistics()
+            # Everything comes from the health monitor's cache, nothing is requested here
+            comment_stats = self.health_monitor.get("comments")
+            article_stats = self.health_monitor.get("articles")
             
             status_text = f"🤖 <b>Статус бота:</b>\n\n"
-            status_text += f"🔗 <b>Grok AI:</b> {'✅ Подключен' if grok_status else '❌ Ошибка подключения'}\n"
+            if self.health_monitor.updated_at is None:
+                ai_status = '⏳ Проверяется'
+            else:
+                ai_status = '✅ Подключен' if self.health_monitor.is_healthy() else '❌ Ошибка подключения'
+                ai_status += f" (проверено {datetime.fromtimestamp(self.health_monitor.updated_at).strftime('%H:%M:%S')})"
+            status_text += f"🔗 <b>Grok AI:</b> {ai_status}\n"
             status_text += f"💬 <b>Комментарии обработано:</b> {comment_stats.get('total_comments_processed', 0)}\n"
             status_text += f"📰 <b>Статей сгенерировано:</b> {article_stats.get('total_generated', 0)}\n"
             status_text += f"🌐 <b>Язык:</b> {self.language.upper()}\n"
+            if self.chatgpt_client.cache:
+                cache_stats = self.chatgpt_client.cache.get_statistics()
+                status_text += f"🗄️ <b>Кэш ответов:</b> {cache_stats['hit_rate']} попаданий " \
+                               f"({cache_stats['hits'] + cache_stats['similar_hits']}/{cache_stats['misses']})\n"
+            flight_stats = self.chatgpt_client.singleflight.get_statistics()
+            token_stats = self.chatgpt_client.budget.get_statistics()
+            status_text += f"🔢 <b>Токены:</b> {token_stats['prompt_tokens']} + {token_stats['completion_tokens']} " \
+                           f"за {token_stats['calls']} запросов (${token_stats['cost']})\n"
+            for task, stats in self.chatgpt_client.budget.get_task_statistics().items():
+                status_text += f"   • {task}: {stats['calls']} × {stats['average_latency']} с, ${stats['cost']}"
+                if stats['abandoned']:
+                    # Part of the cost went to the losing requests of hedges
+                    status_text += f" (дубли {stats['abandoned']}, ${stats['abandoned_cost']})"
+                status_text += "\n"
+            status_text += f"🔀 <b>Объединено запросов:</b> {flight_stats['coalesced']}\n"
+            router_stats = self.chatgpt_client.router.get_statistics()
+            status_text += f"🧭 <b>Провайдеры LLM</b> (дублировано {router_stats['hedged']}, " \
+                           f"переключений {router_stats['fallbacks']}, повторов {router_stats['retries']}):\n"
+            for provider in self.health_monitor.get_provider_health():
+                status_text += f"   • {self.format_provider_health(provider)}\n"
+            lanes = self.update_processor.get_statistics()
+            status_text += "📥 <b>Обновления (в работе/в очереди):</b> " + ", ".join(
+                f"{name} {lane['active']}/{lane['waiting']}" for name, lane in lanes.items()
+            ) + "\n"
             
             await update.message.reply_text(status_text, parse_mode='HTML')
             
@@ -116,30 +184,18 @@ class GrokAdminBot:
                 return
             
             topic = " ".join(context.args)
-            await update.message.reply_text(f"🔄 Генерирую статью на тему: {topic}")
+            message = await update.message.reply_text(f"🔄 Генерирую статью на тему: {topic}")
             
-            # Generate article
-            article_id = await self.article_generator.generate_article_on_topic(topic, self.language)
+            # Stream the article into the status message as it is generated
+            editor = StreamingMessageEditor(message, header=f"📝 {topic}\n\n")
+            article_id = await self.article_generator.stream_article_on_topic(topic, self.language, editor.update)
             
             if article_id:
                 article_data = self.article_generator.get_article_by_id(article_id)
-                content = article_data["content"]
-                
-                # Truncate if too long
-                if len(content) > 4000:
-                    content = content[:4000] + "..."
-                
-                keyboard = [
-                    [InlineKeyboardButton("📤 Опубликовать в канале", callback_data=f"post_{article_id}")],
-                    [InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_{article_id}")],
-                    [InlineKeyboardButton("🗑️ Удалить", callback_data=f"delete_{article_id}")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(f"📰 <b>Статья сгенерирована!</b>\n\n{content}", 
-                                              reply_markup=reply_markup, parse_mode='HTML')
+                await editor.finish(article_data["content"], header="📰 <b>Статья сгенерирована!</b>\n\n",
+                                    reply_markup=self.get_article_keyboard(article_id))
             else:
-                await update.message.reply_text("❌ Ошибка при генерации статьи. Попробуйте позже.")
+                await editor.finish("❌ Ошибка при генерации статьи. Попробуйте позже.", parse_mode=None)
                 
         except Exception as e:
             logger.error(f"Error in generate_article command: {e}")
@@ -148,35 +204,63 @@ class GrokAdminBot:
     async def generate_trending_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /generate_trending command"""
         try:
-            await update.message.reply_text("🔄 Генерирую статью на трендовую тему...")
+            message = await update.message.reply_text("🔄 Генерирую статью на трендовую тему...")
             
-            article_id = await self.article_generator.generate_trending_article(self.language)
+            editor = StreamingMessageEditor(message, header="🔥 Трендовая статья\n\n")
+            article_id = await self.article_generator.stream_trending_article(self.language, editor.update)
             
             if article_id:
                 article_data = self.article_generator.get_article_by_id(article_id)
-                content = article_data["content"]
                 topic = article_data["topic"]
-                
-                # Truncate if too long
-                if len(content) > 4000:
-                    content = content[:4000] + "..."
-                
-                keyboard = [
-                    [InlineKeyboardButton("📤 Опубликовать в канале", callback_data=f"post_{article_id}")],
-                    [InlineKeyboardButton("✏️ Редактировать", callback_data=f"edit_{article_id}")],
-                    [InlineKeyboardButton("🗑️ Удалить", callback_data=f"delete_{article_id}")]
-                ]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                
-                await update.message.reply_text(f"🔥 <b>Трендовая статья: {topic}</b>\n\n{content}", 
-                                              reply_markup=reply_markup, parse_mode='HTML')
+                await editor.finish(article_data["content"], header=f"🔥 <b>Трендовая статья: {html.escape(topic)}</b>\n\n",
+                                    reply_markup=self.get_article_keyboard(article_id))
             else:
-                await update.message.reply_text("❌ Ошибка при генерации трендовой статьи. Попробуйте позже.")
+                await editor.finish("❌ Ошибка при генерации трендовой статьи. Попробуйте позже.", parse_mode=None)
                 
         except Exception as e:
             logger.error(f"Error in generate_trending command: {e}")
             await update.message.reply_text(self.get_error_message("api_error"))
     
+    async def generate_multiple_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /generate_multiple command"""
+        try:
+            count = 3
+            if context.args:
+                try:
+                    count = int(context.args[0])
+                except ValueError:
+                    await update.message.reply_text("Количество статей должно быть числом")
+                    return
+                if count < 1 or count > MAX_BATCH_ARTICLES:
+                    await update.message.reply_text(f"Количество статей должно быть от 1 до {MAX_BATCH_ARTICLES}")
+                    return
+            
+            message = await update.message.reply_text(f"🔄 Генерирую статей: {count}...")
+            finished = []
+            
+            async def on_progress(done: int, total: int, topic: str, article_id: str):
+                mark = "✅" if article_id else "❌"
+                finished.append(f"{mark} {topic}")
+                await message.edit_text(f"🔄 Готово {done}/{total}\n\n" + "\n".join(finished))
+            
+            article_ids = await self.article_generator.generate_multiple_articles(
+                count, self.language, on_progress=on_progress
+            )
+            
+            if article_ids:
+                result_text = f"📰 <b>Сгенерировано статей: {len(article_ids)}</b>\n\n"
+                for article_id in article_ids:
+                    article_data = self.article_generator.get_article_by_id(article_id)
+                    result_text += f"• {html.escape(article_data['topic'])} - <code>{article_id}</code>\n"
+                result_text += "\nДля публикации используйте /post_article <ID_статьи> <ID_канала>"
+                await update.message.reply_text(result_text, parse_mode='HTML')
+            else:
+                await update.message.reply_text("❌ Не удалось сгенерировать ни одной статьи. Попробуйте позже.")
+                
+        except Exception as e:
+            logger.error(f"Error in generate_multiple command: {e}")
+            await update.message.reply_text(self.get_error_message("api_error"))
+    
     async def post_article_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /post_article command"""
         try:
@@ -216,9 +300,9 @@ class GrokAdminBot:
             
             if channel_info:
                 info_text = f"📊 <b>Информация о канале:</b>\n\n"
-                info_text += f"📝 <b>Название:</b> {channel_info['title']}\n"
-                info_text += f"🔗 <b>Username:</b> @{channel_info['username']}\n"
-                info_text += f"👥 <b>Тип:</b> {channel_info['type']}\n"
+                info_text += f"📝 <b>Название:</b> {html.escape(str(channel_info['title']))}\n"
+                info_text += f"🔗 <b>Username:</b> @{html.escape(str(channel_info['username']))}\n"
+                info_text += f"👥 <b>Тип:</b> {html.escape(str(channel_info['type']))}\n"
                 if channel_info['member_count']:
                     info_text += f"👤 <b>Участников:</b> {channel_info['member_count']}\n"
                 
@@ -233,11 +317,15 @@ class GrokAdminBot:
     async def comment_stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /comment_stats command"""
         try:
-            stats = self.comment_handler.get_comment_analytics()
+            stats = await self.comment_handler.get_comment_analytics()
             
             stats_text = f"💬 <b>Статистика комментариев:</b>\n\n"
             stats_text += f"📊 <b>Всего обработано:</b> {stats.get('total_comments_processed', 0)}\n"
             stats_text += f"👥 <b>Уникальных пользователей:</b> {stats.get('unique_users', 0)}\n"
+            moderation = stats.get('moderation')
+            if moderation:
+                stats_text += (f"🛡 <b>Модерация локально:</b> {moderation['local']} ({moderation['local_rate']}%), "
+                               f"через LLM: {moderation['escalated']}\n")
             
             await update.message.reply_text(stats_text, parse_mode='HTML')
             
@@ -262,6 +350,106 @@ class GrokAdminBot:
             logger.error(f"Error in article_stats command: {e}")
             await update.message.reply_text(self.get_error_message("api_error"))
     
+    async def search_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /search command"""
+        try:
+            if not context.args:
+                await update.message.reply_text("Пожалуйста, укажите запрос. Например: /search нейросет* 2")
+                return
+            
+            # A trailing number is the page
+            args = list(context.args)
+            page = 1
+            if len(args) > 1 and args[-1].isdigit():
+                page = max(1, int(args.pop()))
+            query = " ".join(args)
+            
+            total = self.article_generator.count_search_results(query)
+            results = self.article_generator.search_articles(query, SEARCH_PAGE_SIZE, (page - 1) * SEARCH_PAGE_SIZE)
+            
+            if not results:
+                await update.message.reply_text("🔍 Ничего не найдено")
+                return
+            
+            pages = (total + SEARCH_PAGE_SIZE - 1) // SEARCH_PAGE_SIZE
+            result_text = f"🔍 <b>Найдено статей: {total}</b> (страница {page}/{pages})\n\n"
+            for article_id, article_data in results:
+                result_text += f"📰 <b>{html.escape(article_data['topic'])}</b>\n"
+                result_text += f"{self.format_search_snippet(article_data)}\n"
+                result_text += f"<code>{article_id}</code>\n\n"
+            if page < pages:
+                result_text += f"Следующая страница: /search {html.escape(query)} {page + 1}"
+            
+            await update.message.reply_text(result_text, parse_mode='HTML')
+            
+        except Exception as e:
+            logger.error(f"Error in search command: {e}")
+            await update.message.reply_text(self.get_error_message("api_error"))
+    
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /export command"""
+        path = None
+        try:
+            usage = ("Использование: /export [jsonl|csv|json|text] [gz] [lang=ru] [posted|unposted] "
+                     "[from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД]")
+            options = {"format_type": EXPORT_FORMATS[0], "compress": False}
+            for arg in context.args or []:
+                arg = arg.lower()
+                if arg in EXPORT_FORMATS:
+                    options["format_type"] = arg
+                elif arg in ("gz", "gzip"):
+                    options["compress"] = True
+                elif arg in ("posted", "unposted"):
+                    options["posted"] = arg == "posted"
+                elif arg.startswith("lang=") and arg[5:] in SUPPORTED_LANGUAGES:
+                    options["language"] = arg[5:]
+                elif arg.startswith(("from=", "to=")):
+                    name, value = arg.split("=", 1)
+                    try:
+                        day = datetime.strptime(value, "%Y-%m-%d")
+                    except ValueError:
+                        await update.message.reply_text(f"Неверная дата: {value}\n{usage}")
+                        return
+                    # to= includes the whole day
+                    if name == "from":
+                        options["since"] = day
+                    else:
+                        options["until"] = day + timedelta(days=1)
+                else:
+                    await update.message.reply_text(usage)
+                    return
+            
+            await update.message.reply_text("📦 Выгружаю статьи...")
+            result = await self.article_generator.export_articles(**options)
+            if result is None:
+                await update.message.reply_text("❌ Ошибка при выгрузке статей")
+                return
+            
+            path, count = result
+            if count == 0:
+                await update.message.reply_text("📦 Нет статей, подходящих под фильтры")
+                return
+            if os.path.getsize(path) > EXPORT_MAX_DOCUMENT_SIZE:
+                await update.message.reply_text(f"❌ Файл больше {EXPORT_MAX_DOCUMENT_SIZE // (1024 * 1024)} МБ. Сузьте фильтры или добавьте gz")
+                return
+            
+            filename = f"articles_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{os.path.basename(path).split('.', 1)[1]}"
+            with open(path, "rb") as document:
+                await update.message.reply_document(document=document, filename=filename,
+                                                    caption=f"📦 Статей: {count}")
+            
+        except Exception as e:
+            logger.error(f"Error in export command: {e}")
+            await update.message.reply_text(self.get_error_message("api_error"))
+        finally:
+            if path:
+                os.remove(path)
+    
+    def format_search_snippet(self, article_data: dict) -> str:
+        """Search snippet with the matched words in bold"""
+        snippet = article_data.get("snippet") or article_data["content"][:150] + "..."
+        return html.escape(snippet).replace(SNIPPET_START, "<b>").replace(SNIPPET_END, "</b>")
+    
     async def schedule_articles_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /schedule_articles command"""
         try:
@@ -278,9 +466,12 @@ class GrokAdminBot:
                 await update.message.reply_text("Интервал должен быть числом")
                 return
             
+            # Optional channel to publish the generated articles to
+            channel_id = context.args[1] if len(context.args) > 1 else None
+            
             await update.message.reply_text(f"⏰ Настраиваю генерацию статей каждые {interval} часов...")
             
-            success = await self.article_generator.schedule_article_generation(interval)
+            success = await self.article_generator.schedule_article_generation(interval, channel_id)
             
             if success:
                 await update.message.reply_text(f"✅ Расписание настроено! Статьи будут генерироваться каждые {interval} часов")
@@ -291,6 +482,79 @@ class GrokAdminBot:
             logger.error(f"Error in schedule_articles command: {e}")
             await update.message.reply_text(self.get_error_message("api_error"))
     
+    async def schedule_post_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /schedule_post command"""
+        try:
+            if len(context.args) < 3:
+                await update.message.reply_text("Использование: /schedule_post <ID_канала> <минуты> <текст>")
+                return
+            
+            channel_id = context.args[0]
+            try:
+                minutes = float(context.args[1])
+            except ValueError:
+                await update.message.reply_text("Задержка должна быть числом минут")
+                return
+            if minutes < 0:
+                await update.message.reply_text("Задержка не может быть отрицательной")
+                return
+            
+            # Keep the original formatting of the text after the arguments
+            text = update.message.text.split(maxsplit=3)[3]
+            job_id = await self.channel_manager.schedule_post(channel_id, text, int(minutes * 60))
+            
+            if job_id:
+                await update.message.reply_text(f"✅ Пост запланирован через {minutes:g} мин.\n"
+                                              f"ID: <code>{job_id}</code>", parse_mode='HTML')
+            else:
+                await update.message.reply_text("❌ Не удалось запланировать пост")
+                
+        except Exception as e:
+            logger.error(f"Error in schedule_post command: {e}")
+            await update.message.reply_text(self.get_error_message("api_error"))
+    
+    async def jobs_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /jobs command"""
+        try:
+            jobs = self.scheduler.get_jobs()
+            if not jobs:
+                await update.message.reply_text("⏰ Запланированных задач нет")
+                return
+            
+            jobs_text = f"⏰ <b>Запланированные задачи: {len(jobs)}</b>\n\n"
+            for job in jobs[:20]:
+                run_at = datetime.fromtimestamp(job["run_at"]).strftime('%d.%m %H:%M')
+                kind = "📰 генерация статьи" if job["kind"] == "article_schedule" else "📤 пост"
+                jobs_text += f"{run_at} - {kind} - <code>{job['id']}</code>\n"
+            if len(jobs) > 20:
+                jobs_text += f"\n...и еще {len(jobs) - 20}"
+            
+            await update.message.reply_text(jobs_text, parse_mode='HTML')
+            
+        except Exception as e:
+            logger.error(f"Error in jobs command: {e}")
+            await update.message.reply_text(self.get_error_message("api_error"))
+    
+    async def cancel_job_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /cancel_job command"""
+        try:
+            if not context.args:
+                await update.message.reply_text("Пожалуйста, укажите ID задачи. Список задач: /jobs")
+                return
+            
+            job_id = context.args[0]
+            cancelled = (self.article_generator.cancel_schedule(job_id)
+                         or self.channel_manager.cancel_scheduled_post(job_id))
+            
+            if cancelled:
+                await update.message.reply_text("✅ Задача отменена")
+            else:
+                await update.message.reply_text("❌ Задача не найдена")
+                
+        except Exception as e:
+            logger.error(f"Error in cancel_job command: {e}")
+            await update.message.reply_text(self.get_error_message("api_error"))
+    
     async def language_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Handle /language command"""
         try:
@@ -324,7 +588,7 @@ class GrokAdminBot:
         try:
             await update.message.reply_text("🔗 Тестирую подключение к OpenAI ChatGPT...")
             
-            success = self.chatgpt_client.test_connection()
+            success = await self.chatgpt_client.test_connection()
             
             if success:
                 await update.message.reply_text("✅ Подключение к Grok AI успешно!")
@@ -364,17 +628,19 @@ class GrokAdminBot:
             elif data == "settings":
                 await query.edit_message_text("⚙️ Используйте команды:\n/language - изменить язык\n/status - статус бота")
                 
-            elif data.startswith("post_"):
-                article_id = data[5:]  # Remove "post_" prefix
-                await query.edit_message_text(f"📤 Для публикации статьи {article_id} используйте команду:\n/post_article {article_id} <ID_канала>")
-                
-            elif data.startswith("edit_"):
-                article_id = data[5:]  # Remove "edit_" prefix
-                await query.edit_message_text(f"✏️ Для редактирования статьи {article_id} используйте команду:\n/edit_article {article_id} <новый_текст>")
+            elif data.startswith("cb:"):
+                state = self.callback_states.get(data[3:])
+                if state is None:
+                    await query.edit_message_reply_markup(reply_markup=None)
+                    await query.message.reply_text("⌛ Кнопка устарела, сгенерируйте статью заново")
+                    return
+                action, payload = state
+                await self.handle_article_action(query, action, payload["article_id"])
                 
-            elif data.startswith("delete_"):
-                article_id = data[7:]  # Remove "delete_" prefix
-                await query.edit_message_text(f"🗑️ Статья {article_id} будет удалена при следующем перезапуске бота")
+            # Buttons sent before callback states existed carry the article id itself
+            elif data.startswith(("post_", "edit_", "delete_")):
+                action, article_id = data.split("_", 1)
+                await self.handle_article_action(query, action, article_id)
                 
         except Exception as e:
             logger.error(f"Error handling callback: {e}")
@@ -383,6 +649,40 @@ class GrokAdminBot:
             except:
                 pass
     
+    async def handle_article_action(self, query, action: str, article_id: str):
+        """Answer an article button"""
+        if self.article_generator.get_article_by_id(article_id) is None:
+            await query.edit_message_text(f"❌ Статья {article_id} не найдена")
+            
+        elif action == "post":
+            await query.edit_message_text(f"📤 Для публикации статьи {article_id} используйте команду:\n/post_article {article_id} <ID_канала>")
+            
+        elif action == "edit":
+            await query.edit_message_text(f"✏️ Для редактирования статьи {article_id} используйте команду:\n/edit_article {article_id} <новый_текст>")
+            
+        elif action == "delete":
+            if self.article_generator.delete_article(article_id):
+                await query.edit_message_text(f"🗑️ Статья {article_id} удалена")
+            else:
+                await query.edit_message_text(f"❌ Не удалось удалить статью {article_id}")
+    
+    def get_article_keyboard(self, article_id: str) -> InlineKeyboardMarkup:
+        """Action buttons shown under a generated article
+        
+        callback_data only carries a token of the stored button state, which
+        stays valid across restarts and workers for CALLBACK_STATE_TTL.
+        """
+        def button(text: str, action: str) -> InlineKeyboardButton:
+            token = self.callback_states.put(action, {"article_id": article_id})
+            return InlineKeyboardButton(text, callback_data=f"cb:{token}")
+        
+        keyboard = [
+            [button("📤 Опубликовать в канале", "post")],
+            [button("✏️ Редактировать", "edit")],
+            [button("🗑️ Удалить", "delete")]
+        ]
+        return InlineKeyboardMarkup(keyboard)
+    
     def get_welcome_message(self, user_name: str) -> str:
         """Get localized welcome message"""
         if self.language == "ru":
@@ -406,16 +706,22 @@ class GrokAdminBot:
 📰 <b>Генерация статей:</b>
 /generate_article <тема> - создать статью на заданную тему
 /generate_trending - создать статью на трендовую тему
-/schedule_articles <часы> - настроить регулярную генерацию
+/generate_multiple <количество> - создать несколько статей параллельно
+/schedule_articles <часы> [ID_канала] - настроить регулярную генерацию
 
 📤 <b>Публикация:</b>
 /post_article <ID_статьи> <ID_канала> - опубликовать статью
+/schedule_post <ID_канала> <минуты> <текст> - запланировать пост
+/jobs - запланированные задачи
+/cancel_job <ID> - отменить задачу
 
 📊 <b>Статистика:</b>
 /status - общий статус бота
 /comment_stats - статистика комментариев
 /article_stats - статистика статей
 /channel_info <ID_канала> - информация о канале
+/search <запрос> [страница] - поиск по статьям (слово* - по началу слова)
+/export [формат] [gz] [lang=ru] [posted] [from=ГГГГ-ММ-ДД] [to=ГГГГ-ММ-ДД] - выгрузить статьи файлом
 
 ⚙️ <b>Настройки:</b>
 /language <ru/en> - изменить язык
@@ -431,16 +737,22 @@ class GrokAdminBot:
 📰 <b>Article Generation:</b>
 /generate_article <topic> - create article on specific topic
 /generate_trending - create article on trending topic
-/schedule_articles <hours> - set up regular generation
+/generate_multiple <count> - create several articles in parallel
+/schedule_articles <hours> [channel_id] - set up regular generation
 
 📤 <b>Publishing:</b>
 /post_article <article_id> <channel_id> - publish article
+/schedule_post <channel_id> <minutes> <text> - schedule a post
+/jobs - scheduled jobs
+/cancel_job <id> - cancel a job
 
 📊 <b>Statistics:</b>
 /status - general bot status
 /comment_stats - comment statistics
 /article_stats - article statistics
 /channel_info <channel_id> - channel information
+/search <query> [page] - search articles (word* matches a prefix)
+/export [format] [gz] [lang=en] [posted] [from=YYYY-MM-DD] [to=YYYY-MM-DD] - export articles as a file
 
 ⚙️ <b>Settings:</b>
 /language <ru/en> - change language
@@ -451,6 +763,30 @@ class GrokAdminBot:
 • Content moderation
 • Channel management"""
     
+    def format_provider_health(self, provider: Dict) -> str:
+        """One /status line for an LLM provider"""
+        check = provider['check']
+        if check is None:
+            # Not probed yet, or never: then only real requests tell
+            state = '⏳' if provider['probed'] else ('✅' if provider['available'] else '❌')
+        else:
+            state = '✅' if check['ok'] and provider['available'] else '❌'
+        text = f"{state} {html.escape(provider['name'])}"
+        if provider['p50'] is not None:
+            text += f": p50 {provider['p50']:.2f} с, p95 {provider['p95']:.2f} с"
+        text += f", ошибки {provider['error_rate']:.0%}"
+        if provider['last_success']:
+            text += f", успех {datetime.fromtimestamp(provider['last_success']).strftime('%H:%M:%S')}"
+        remaining = provider['rate_limits'].get('x-ratelimit-remaining-requests')
+        if remaining is not None:
+            text += f", лимит {remaining} запр."
+        limiter = provider['limiter']
+        if limiter['waiting'] or limiter['throttled']:
+            text += f", в очереди {limiter['waiting']}, 429: {limiter['throttled']}"
+        if check and check['error']:
+            text += f" ({html.escape(check['error'][:60])})"
+        return text
+    
     def get_error_message(self, error_type: str) -> str:
         """Get localized error message"""
         try:
@@ -461,16 +797,27 @@ class GrokAdminBot:
     async def run(self):
         """Run the bot"""
         try:
-            logger.info("Starting ChatGPT Admin Bot...")
+            logger.info(f"Starting ChatGPT Admin Bot ({BOT_MODE}, worker {self.worker_id + 1}/{self.workers})...")
             
             # Test OpenAI ChatGPT connection
-            if not self.chatgpt_client.test_connection():
+            if self.primary and not await self.chatgpt_client.test_connection():
                 logger.warning("OpenAI ChatGPT connection test failed. Bot will start but some features may not work.")
             
             # Start the bot
             await self.application.initialize()
             await self.application.start()
-            await self.application.updater.start_polling()
+            if BOT_MODE == "webhook":
+                await self.start_webhook()
+            else:
+                await self.application.updater.start_polling()
+            
+            # Every worker answers /status, so every worker keeps its telemetry fresh
+            await self.health_monitor.start()
+            
+            # Scheduled posts and article generation, including runs missed while offline
+            if self.primary:
+                await self.scheduler.start()
+                self.article_generator.sync_schedules()
             
             logger.info("Bot started successfully!")
             
@@ -480,17 +827,67 @@ class GrokAdminBot:
         except Exception as e:
             logger.error(f"Error running bot: {e}")
         finally:
+            if self.webhook:
+                await self.webhook.stop()
+            await self.health_monitor.stop()
+            await self.scheduler.stop()
             await self.application.stop()
             await self.application.shutdown()
+            await self.chatgpt_client.close()
+            await self.comment_handler.close()
+            self.storage.close()
+    
+    async def start_webhook(self):
+        """Serve the webhook endpoint; the primary worker registers it with Telegram"""
+        self.webhook = WebhookServer(self.application, WEBHOOK_SECRET_TOKEN)
+        await self.webhook.start(reuse_port=self.workers > 1)
+        if self.primary:
+            await self.application.bot.set_webhook(
+                url=f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}",
+                secret_token=WEBHOOK_SECRET_TOKEN,
+                allowed_updates=Update.ALL_TYPES,
+                max_connections=WEBHOOK_MAX_CONNECTIONS
+            )
+            logger.info(f"Webhook set to {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}")
 
-async def main():
+async def main(worker_id: int = 0, workers: int = 1):
     """Main function"""
     if not TELEGRAM_BOT_TOKEN:
         print("❌ Error: TELEGRAM_BOT_TOKEN not set in environment variables")
         return
     
-    bot = GrokAdminBot(TELEGRAM_BOT_TOKEN)
+    bot = GrokAdminBot(TELEGRAM_BOT_TOKEN, worker_id=worker_id, workers=workers)
     await bot.run()
 
+def run_worker(worker_id: int, workers: int):
+    asyncio.run(main(worker_id, workers))
+
+def run():
+    """Start the bot: one process, or WEBHOOK_WORKERS processes in webhook mode"""
+    if BOT_MODE != "webhook":
+        asyncio.run(main())
+        return
+    
+    if not WEBHOOK_URL or not WEBHOOK_SECRET_TOKEN:
+        print("❌ Error: WEBHOOK_URL and WEBHOOK_SECRET_TOKEN must be set in webhook mode")
+        return
+    
+    if WEBHOOK_WORKERS <= 1:
+        asyncio.run(main())
+        return
+    
+    # Workers are separate processes listening on one port (SO_REUSEPORT)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(worker_id, WEBHOOK_WORKERS))
+                 for worker_id in range(WEBHOOK_WORKERS)]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()
@@ -0,0 +1,241 @@
+import asyncio
+import json
+import math
+import os
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+from chatgpt_api import ChatGPTAPIClient
+from config import (
+    MODERATION_WEIGHTS_FILE, MODERATION_SPAM_THRESHOLD, MODERATION_HAM_THRESHOLD,
+    MODERATION_MAX_LINKS, MODERATION_BLOCKED_WORDS, MODERATION_BATCH_WINDOW, MODERATION_BATCH_SIZE
+)
+
+# Moderation labels, the same ones the LLM answers with
+APPROPRIATE = "APPROPRIATE"
+SPAM = "SPAM"
+OFFENSIVE = "OFFENSIVE"
+IRRELEVANT = "IRRELEVANT"
+LABELS = (APPROPRIATE, SPAM, OFFENSIVE, IRRELEVANT)
+
+URL_RE = re.compile(r"(?:https?://|www\.|t\.me/)\S+|\b[\w-]+\.(?:com|ru|net|org|io|xyz|top|click)\b", re.IGNORECASE)
+INVITE_RE = re.compile(r"t\.me/(?:joinchat/|\+)|telegram\.me/joinchat", re.IGNORECASE)
+SPAM_PHRASES_RE = re.compile(
+    r"\b(?:free money|earn \$?\d+|make money|work from home|crypto signals?|airdrop|casino|betting|"
+    r"click (?:here|the link)|dm me|write (?:me|in) (?:dm|pm)|"
+    r"заработ\w*|доход от|пиши(?:те)? в (?:лс|личку)|казино|ставки|крипт\w* сигнал\w*|без вложений)\b",
+    re.IGNORECASE
+)
+REPEATED_CHARS_RE = re.compile(r"(.)\1{9,}")
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Hashed features: no vocabulary to keep, 2^18 buckets keep collisions rare for short comments
+HASH_BUCKETS = 1 << 18
+
+class LocalModerator:
+    """Fast first tier of comment moderation, run before the LLM
+
+    Compiled rules catch obvious spam (links, invites, promo phrases) and
+    blocked words; a hashed n-gram logistic regression scores the rest.
+    classify() returns a label only when it is confident and None otherwise,
+    so ambiguous comments are left to the LLM. Without a weights file only the
+    rules are used.
+    """
+
+    def __init__(self, weights_file: str = MODERATION_WEIGHTS_FILE,
+                 spam_threshold: float = MODERATION_SPAM_THRESHOLD,
+                 ham_threshold: float = MODERATION_HAM_THRESHOLD,
+                 max_links: int = MODERATION_MAX_LINKS, blocked_words: List[str] = None):
+        self.weights_file = weights_file
+        self.spam_threshold = spam_threshold
+        self.ham_threshold = ham_threshold
+        self.max_links = max_links
+        words = blocked_words if blocked_words is not None else MODERATION_BLOCKED_WORDS
+        # Whole words only; word* also matches every word starting with it (inflections)
+        self.blocked_re = re.compile(
+            r"\b(?:" + "|".join(
+                re.escape(word[:-1]) + r"\w*" if word.endswith("*") else re.escape(word) + r"\b" for word in words
+            ) + ")", re.IGNORECASE
+        ) if words else None
+        self.bias = 0.0
+        self.weights: Dict[int, float] = {}
+        self.load_weights()
+        self.stats = {"local": 0, "escalated": 0}
+
+    @property
+    def has_model(self) -> bool:
+        return bool(self.weights)
+
+    def load_weights(self):
+        """Load classifier weights saved by save_weights()"""
+        if not self.weights_file or not os.path.exists(self.weights_file):
+            return
+        try:
+            with open(self.weights_file, encoding="utf-8") as f:
+                data = json.load(f)
+            self.bias = data.get("bias", 0.0)
+            self.weights = {int(index): weight for index, weight in data.get("weights", {}).items()}
+        except Exception as e:
+            print(f"Error loading moderation weights: {e}")
+
+    def save_weights(self):
+        try:
+            with open(self.weights_file, "w", encoding="utf-8") as f:
+                json.dump({"bias": self.bias, "weights": self.weights}, f)
+        except Exception as e:
+            print(f"Error saving moderation weights: {e}")
+
+    def features(self, text: str) -> List[int]:
+        """Hashed word unigrams, bigrams and character trigrams"""
+        text = text.lower()
+        words = WORD_RE.findall(text)
+        grams = [f"w:{word}" for word in words]
+        grams += [f"b:{first} {second}" for first, second in zip(words, words[1:])]
+        padded = f" {' '.join(words)} "
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+        # crc32 is stable across runs, unlike hash()
+        return [zlib.crc32(gram.encode("utf-8")) % HASH_BUCKETS for gram in grams]
+
+    def spam_probability(self, text: str) -> float:
+        score = self.bias + sum(self.weights.get(index, 0.0) for index in self.features(text))
+        return 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0)))
+
+    def train(self, samples: List[Tuple[str, bool]], epochs: int = 5, learning_rate: float = 0.1,
+              l2: float = 1e-5):
+        """Fit the classifier with SGD on (text, is_spam) samples"""
+        encoded = [(self.features(text), 1.0 if is_spam else 0.0) for text, is_spam in samples]
+        for _ in range(epochs):
+            for indexes, target in encoded:
+                score = self.bias + sum(self.weights.get(index, 0.0) for index in indexes)
+                error = 1.0 / (1.0 + math.exp(-max(min(score, 30.0), -30.0))) - target
+                self.bias -= learning_rate * error
+                for index in indexes:
+                    weight = self.weights.get(index, 0.0)
+                    self.weights[index] = weight - learning_rate * (error + l2 * weight)
+
+    def check_rules(self, text: str) -> Optional[Tuple[str, str]]:
+        """Label and reason for comments the rules decide on their own"""
+        if self.blocked_re and self.blocked_re.search(text):
+            return OFFENSIVE, "blocked word"
+        if INVITE_RE.search(text):
+            return SPAM, "invite link"
+        links = len(URL_RE.findall(text))
+        if links > self.max_links:
+            return SPAM, f"{links} links"
+        if links and SPAM_PHRASES_RE.search(text):
+            return SPAM, "promotional link"
+        if REPEATED_CHARS_RE.search(text):
+            return SPAM, "repeated characters"
+        return None
+
+    def classify(self, text: str) -> Optional[Tuple[str, str]]:
+        """(label, reason) when the local stage is confident, None to escalate"""
+        result = self.check_rules(text)
+        if result is None and self.has_model:
+            probability = self.spam_probability(text)
+            if probability >= self.spam_threshold:
+                result = SPAM, f"classifier {probability:.2f}"
+            elif probability <= self.ham_threshold and not URL_RE.search(text):
+                result = APPROPRIATE, f"classifier {probability:.2f}"
+        self.stats["local" if result else "escalated"] += 1
+        return result
+
+    def get_statistics(self) -> Dict:
+        total = self.stats["local"] + self.stats["escalated"]
+        return {
+            **self.stats,
+            "local_rate": round(self.stats["local"] / total * 100, 1) if total else 0.0,
+            "has_model": self.has_model
+        }
+
+
+class BatchModerator:
+    """Second moderation tier: classifies comments with the LLM in batches
+
+    Comments arriving within MODERATION_BATCH_WINDOW seconds (or until
+    MODERATION_BATCH_SIZE are collected) go out as one request that returns a
+    JSON array of labels, so a burst of comments costs a few API calls instead
+    of one per comment.
+    """
+
+    def __init__(self, chatgpt_client: ChatGPTAPIClient, window: float = MODERATION_BATCH_WINDOW,
+                 max_batch: int = MODERATION_BATCH_SIZE):
+        self.chatgpt_client = chatgpt_client
+        self.window = window
+        self.max_batch = max_batch
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer = None
+        self._tasks = set()
+        self.stats = {"batches": 0, "comments": 0, "failed": 0}
+
+    async def classify(self, comment: str) -> Optional[str]:
+        """Moderation label of a comment, None if the LLM gave no usable answer"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((comment, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]):
+        labels = []
+        try:
+            comments = [comment for comment, _ in batch]
+            # Comments are passed as a JSON array so their text can't break the numbering
+            prompt = f"""Moderate each comment in this JSON array:
+{json.dumps(comments, ensure_ascii=False)}
+
+For every comment decide if it is APPROPRIATE (respectful and relevant), SPAM (spam or promotional),
+OFFENSIVE (offensive or inappropriate) or IRRELEVANT (unrelated to the discussion).
+Respond with only a JSON array of {len(comments)} labels in the same order, for example ["APPROPRIATE", "SPAM"]."""
+            result = await self.chatgpt_client.generate_response(
+                prompt, max_tokens=8 * len(comments) + 10, cache_ttl=0, task="moderation"
+            )
+            labels = self.parse_labels(result, len(comments))
+            self.stats["batches"] += 1
+            self.stats["comments"] += len(comments)
+        except Exception as e:
+            print(f"Error moderating comment batch: {e}")
+        finally:
+            if not labels:
+                self.stats["failed"] += len(batch)
+            for index, (_, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result(labels[index] if labels else None)
+
+    @staticmethod
+    def parse_labels(result: Optional[str], count: int) -> List[Optional[str]]:
+        """Labels from the model's JSON array; empty if it doesn't match the batch"""
+        if not result:
+            return []
+        start, end = result.find("["), result.rfind("]")
+        try:
+            labels = json.loads(result[start:end + 1]) if start != -1 and end > start else None
+        except ValueError:
+            labels = None
+        if not isinstance(labels, list) or len(labels) != count:
+            return []
+        labels = [str(label).strip().upper() for label in labels]
+        return [label if label in LABELS else None for label in labels]
+
+    async def close(self):
+        """Send the pending batch and wait for running ones"""
+        self._flush()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def get_statistics(self) -> Dict:
+        return {
+            **self.stats,
+            "average_batch": round(self.stats["comments"] / self.stats["batches"], 1) if self.stats["batches"] else 0
+        }
@@ -0,0 +1,170 @@
+import asyncio
+import heapq
+import itertools
+import random
+import re
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, List, Optional, Tuple
+from config import (
+    RATE_LIMIT_REQUESTS_PER_MINUTE, RATE_LIMIT_TOKENS_PER_MINUTE, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+)
+
+DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+def parse_duration(value: str) -> Optional[float]:
+    """Seconds in an x-ratelimit-reset-* value such as 20ms, 1s or 6m0s"""
+    parts = DURATION_RE.findall(value or "")
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+def retry_delay(headers, attempt: int) -> float:
+    """How long to wait before retrying: what the API asks for, else exponential backoff"""
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_RETRY_MAX_DELAY)
+        except ValueError:
+            try:
+                return min(max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0), LLM_RETRY_MAX_DELAY)
+            except (TypeError, ValueError):
+                pass
+    resets = [parse_duration(headers.get(name, "")) for name in ("x-ratelimit-reset-requests",
+                                                                 "x-ratelimit-reset-tokens")]
+    resets = [reset for reset in resets if reset is not None]
+    if resets:
+        return min(max(resets), LLM_RETRY_MAX_DELAY)
+    # Full jitter keeps retrying clients from hitting the API in lockstep
+    return random.uniform(0, min(LLM_RETRY_BASE_DELAY * 2 ** attempt, LLM_RETRY_MAX_DELAY))
+
+class TokenBucket:
+    """Per-minute budget that refills continuously"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+        self.synced = False
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until cost fits (a cost above capacity waits for a full bucket)"""
+        self._refill()
+        need = min(cost, self.capacity)
+        return 0.0 if self.level >= need else (need - self.level) / self.rate
+
+    def take(self, cost: float):
+        self._refill()
+        self.level -= cost
+
+    def sync(self, limit: Optional[float], remaining: Optional[float], reset: Optional[float]):
+        """Adjust to the limit, remaining budget and reset time the API reported"""
+        self._refill()
+        if limit:
+            self.capacity = limit
+            self.rate = limit / 60.0
+        if remaining is not None:
+            if limit and reset and remaining < limit:
+                # Refills to the limit in reset seconds
+                self.rate = max((limit - remaining) / reset, self.rate)
+            # Our own view already counts requests the API hasn't answered yet
+            self.level = remaining if not self.synced else min(self.level, remaining)
+            self.synced = True
+
+class AdaptiveRateLimiter:
+    """Request and token buckets for one API, fed by its x-ratelimit-* headers
+
+    Callers wait in a priority queue (lower first, FIFO within a priority) until
+    both buckets allow their request, so a burst is spread out at the API's
+    limit instead of being answered with 429s. A 429 blocks the queue for the
+    time the API asks for.
+    """
+
+    def __init__(self, requests_per_minute: float = RATE_LIMIT_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = RATE_LIMIT_TOKENS_PER_MINUTE):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.blocked_until = 0.0
+        self._waiters: List[Tuple[int, int, float, asyncio.Future]] = []  # (priority, seq, tokens, future)
+        self._seq = itertools.count()
+        self._changed = asyncio.Event()
+        self._dispatcher = None
+        self.stats = {"queued": 0, "wait_time": 0.0, "throttled": 0}
+
+    def _wait_time(self, tokens: float) -> float:
+        return max(self.blocked_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def _take(self, tokens: float):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    async def acquire(self, tokens: float = 0, priority: int = 1):
+        """Wait until a request of about that many tokens may be sent"""
+        if not self._waiters and self._wait_time(tokens) <= 0:
+            self._take(tokens)
+            return
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), tokens, future))
+        self.stats["queued"] += 1
+        self._changed.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+        self.stats["wait_time"] += time.monotonic() - started
+
+    async def _dispatch(self):
+        while self._waiters:
+            _, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            wait = self._wait_time(tokens)
+            if wait <= 0:
+                heapq.heappop(self._waiters)
+                self._take(tokens)
+                future.set_result(None)
+                continue
+            # New waiters, fresh headers or a 429 change what to wait for
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+
+    def update(self, headers):
+        """Sync the buckets with a response's rate limit headers"""
+        def number(name: str) -> Optional[float]:
+            try:
+                return float(headers[name]) if name in headers else None
+            except ValueError:
+                return None
+
+        self.requests.sync(number("x-ratelimit-limit-requests"), number("x-ratelimit-remaining-requests"),
+                           parse_duration(headers.get("x-ratelimit-reset-requests", "")))
+        self.tokens.sync(number("x-ratelimit-limit-tokens"), number("x-ratelimit-remaining-tokens"),
+                         parse_duration(headers.get("x-ratelimit-reset-tokens", "")))
+        self._changed.set()
+
+    def penalize(self, delay: float):
+        """Hold every request for delay seconds after a 429"""
+        self.stats["throttled"] += 1
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        self._changed.set()
+
+    def get_statistics(self) -> Dict:
+        return {
+            **self.stats,
+            "wait_time": round(self.stats["wait_time"], 2),
+            "waiting": sum(1 for *_, future in self._waiters if not future.done()),
+            "requests_left": int(self.requests.level),
+            "tokens_left": int(self.tokens.level)
+        }
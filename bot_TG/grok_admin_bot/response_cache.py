@@ -0,0 +1,219 @@
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional
+from config import (
+    RESPONSE_CACHE_TTL, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_DISK_ENTRIES,
+    RESPONSE_CACHE_DB, RESPONSE_CACHE_SIMILARITY_THRESHOLD
+)
+
+class ResponseCache:
+    """LRU + TTL cache for LLM responses with optional SQLite backing and similarity lookup"""
+
+    PRUNE_EVERY = 100  # disk writes between prunes of expired and surplus rows
+
+    def __init__(self, ttl: int = RESPONSE_CACHE_TTL, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 db_path: str = RESPONSE_CACHE_DB,
+                 similarity_threshold: float = RESPONSE_CACHE_SIMILARITY_THRESHOLD,
+                 embed: Callable[[str], Awaitable[Optional[List[float]]]] = None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed  # async text -> vector, enables similarity lookup
+        self._entries = OrderedDict()  # key -> entry dict, most recently used last
+        self._pending_embeddings = {}  # key -> vector computed on a miss, reused by set()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._writes = 0
+        self.conn = None
+        if db_path:
+            self._init_db(db_path)
+
+    def _init_db(self, db_path: str):
+        """Open the on-disk cache"""
+        try:
+            self.conn = sqlite3.connect(db_path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    embedding TEXT,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache(expires_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_created ON response_cache(created_at)")
+            self.conn.commit()
+        except Exception as e:
+            print(f"Error opening response cache database: {e}")
+            self.conn = None
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize a prompt so trivial differences share a cache entry"""
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    @staticmethod
+    def make_scope(model: str, params: Dict) -> str:
+        """Entries are only comparable within the same model and sampling params"""
+        return hashlib.sha256(json.dumps([model, params], sort_keys=True).encode("utf-8")).hexdigest()
+
+    @classmethod
+    def make_key(cls, model: str, prompt: str, params: Dict) -> str:
+        scope = cls.make_scope(model, params)
+        return hashlib.sha256(f"{scope}:{cls.normalize(prompt)}".encode("utf-8")).hexdigest()
+
+    async def get(self, model: str, prompt: str, params: Dict) -> Optional[str]:
+        """Look up a cached response by exact key, then by embedding similarity"""
+        key = self.make_key(model, prompt, params)
+        now = time.time()
+
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._load(key, now)
+        if entry is not None and entry["expires_at"] > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry["response"]
+        if entry is not None:
+            self._evict(key)
+
+        if self.embed and self.similarity_threshold > 0:
+            response = await self._get_similar(key, self.make_scope(model, params), prompt, now)
+            if response is not None:
+                self.similar_hits += 1
+                return response
+
+        self.misses += 1
+        return None
+
+    async def set(self, model: str, prompt: str, params: Dict, response: str, ttl: int = None):
+        """Store a response"""
+        key = self.make_key(model, prompt, params)
+        now = time.time()
+        entry = {
+            "scope": self.make_scope(model, params),
+            "response": response,
+            "embedding": self._pending_embeddings.pop(key, None),
+            "expires_at": now + (ttl or self.ttl)
+        }
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._save(key, entry, now)
+
+    async def _get_similar(self, key: str, scope: str, prompt: str, now: float) -> Optional[str]:
+        """Find a cached response whose prompt embedding is close enough"""
+        try:
+            vector = await self.embed(self.normalize(prompt))
+        except Exception as e:
+            print(f"Error computing prompt embedding: {e}")
+            return None
+        if not vector:
+            return None
+
+        self._pending_embeddings[key] = vector
+        if len(self._pending_embeddings) > self.max_entries:
+            self._pending_embeddings.pop(next(iter(self._pending_embeddings)))
+
+        best_key, best_score = None, self.similarity_threshold
+        for candidate_key, entry in self._entries.items():
+            if entry["scope"] != scope or not entry["embedding"] or entry["expires_at"] <= now:
+                continue
+            score = self.cosine(vector, entry["embedding"])
+            if score >= best_score:
+                best_key, best_score = candidate_key, score
+
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]["response"]
+
+    @staticmethod
+    def cosine(a: List[float], b: List[float]) -> float:
+        dot = sum(x * y for x, y in zip(a, b))
+        norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return dot / norm if norm else 0.0
+
+    def _load(self, key: str, now: float) -> Optional[Dict]:
+        """Promote an entry from disk into memory"""
+        if not self.conn:
+            return None
+        try:
+            row = self.conn.execute(
+                "SELECT scope, response, embedding, expires_at FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if not row or row[3] <= now:
+                return None
+            entry = {
+                "scope": row[0],
+                "response": row[1],
+                "embedding": json.loads(row[2]) if row[2] else None,
+                "expires_at": row[3]
+            }
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry
+        except Exception as e:
+            print(f"Error reading response cache: {e}")
+            return None
+
+    def _save(self, key: str, entry: Dict, now: float):
+        if not self.conn:
+            return
+        try:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, scope, response, embedding, created_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, entry["scope"], entry["response"],
+                 json.dumps(entry["embedding"]) if entry["embedding"] else None,
+                 now, entry["expires_at"])
+            )
+            self._writes += 1
+            if self._writes % self.PRUNE_EVERY == 0:
+                # Keep the disk cache bounded (up to PRUNE_EVERY rows over between prunes):
+                # drop expired rows, then the oldest ones
+                self.conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (now,))
+                self.conn.execute(
+                    "DELETE FROM response_cache WHERE key IN ("
+                    "SELECT key FROM response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                    (RESPONSE_CACHE_MAX_DISK_ENTRIES,)
+                )
+            self.conn.commit()
+        except Exception as e:
+            print(f"Error writing response cache: {e}")
+
+    def _evict(self, key: str):
+        self._entries.pop(key, None)
+        if self.conn:
+            try:
+                self.conn.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                self.conn.commit()
+            except Exception as e:
+                print(f"Error evicting response cache entry: {e}")
+
+    def get_statistics(self) -> Dict:
+        """Hit/miss metrics"""
+        lookups = self.hits + self.similar_hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": f"{((self.hits + self.similar_hits) / lookups * 100):.1f}%" if lookups else "0%",
+            "entries": len(self._entries)
+        }
+
+    def close(self):
+        if self.conn:
+            self.conn.close()
+            self.conn = None
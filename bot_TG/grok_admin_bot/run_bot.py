@@ -5,7 +5,6 @@ Simple launcher script for Grok AI Telegram Bot
 
 import os
 import sys
-import asyncio
 from dotenv import load_dotenv
 
 def check_environment():
@@ -45,8 +44,8 @@ def main():
     
     try:
         # Import and run the bot
-        from main_bot import main as run_bot
-        asyncio.run(run_bot())
+        from main_bot import run as run_bot
+        run_bot()
     except KeyboardInterrupt:
         print("\n🛑 Bot stopped by user")
     except Exception as e:
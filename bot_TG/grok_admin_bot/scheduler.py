@@ -0,0 +1,255 @@
+import asyncio
+import heapq
+import itertools
+import json
+import random
+import time
+import uuid
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from storage import Storage
+from config import SCHEDULER_MAX_CONCURRENCY, SCHEDULER_MISFIRE_GRACE_TIME, SCHEDULER_SYNC_INTERVAL
+
+JOB_FIELDS = ("kind", "payload", "run_at", "interval", "jitter", "base_run_at")  # what makes two versions of a job differ
+
+class JobScheduler:
+    """Persistent job scheduler running on the bot's event loop
+
+    Jobs live in a heap ordered by run time, so scheduling and cancelling cost
+    O(log n); cancelled entries are dropped lazily when they reach the top.
+    Every job is stored in the jobs table and reloaded on start: one-off jobs
+    missed while the bot was down run right away (unless older than
+    SCHEDULER_MISFIRE_GRACE_TIME), missed runs of a recurring job are
+    coalesced into one.
+    With a shared storage other processes add and cancel jobs in the table;
+    the running scheduler picks those changes up every SCHEDULER_SYNC_INTERVAL
+    seconds.
+    """
+
+    def __init__(self, storage: Storage, max_concurrency: int = SCHEDULER_MAX_CONCURRENCY,
+                 misfire_grace_time: float = SCHEDULER_MISFIRE_GRACE_TIME):
+        self.storage = storage
+        self.misfire_grace_time = misfire_grace_time
+        self._handlers: Dict[str, Callable[[Dict], Awaitable[None]]] = {}
+        self._jobs: Dict[str, Dict] = {}  # job_id -> job
+        self._heap: List[Tuple[float, int, str]] = []  # (run_at, seq, job_id)
+        self._seq = itertools.count()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._loop_task = None
+        self._running = set()
+        self._running_ids = set()
+        self._next_reload = 0.0
+
+    def register(self, kind: str, handler: Callable[[Dict], Awaitable[None]]):
+        """Register the coroutine that runs jobs of a kind; it gets the job payload"""
+        self._handlers[kind] = handler
+
+    def schedule(self, kind: str, payload: Dict = None, delay: float = 0, run_at: float = None,
+                 interval: float = None, jitter: float = 0, job_id: str = None) -> str:
+        """Schedule a job after delay seconds or at run_at (unix time)
+
+        interval makes the job recurring; jitter adds up to that many random
+        seconds to every run so recurring jobs don't fire in lockstep. Runs
+        follow the un-jittered base_run_at, so the jitter doesn't add up.
+        Scheduling an existing job_id replaces that job.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        base_run_at = run_at if run_at is not None else time.time() + delay
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "payload": payload or {},
+            "run_at": base_run_at + random.uniform(0, jitter),
+            "interval": interval,
+            "jitter": jitter,
+            "base_run_at": base_run_at
+        }
+        self._save(job)
+        self._push(job)
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job; its heap entry is skipped when it comes up"""
+        if self.storage.shared:
+            self.reload()
+        if self._jobs.pop(job_id, None) is None:
+            return False
+        self.storage.write("DELETE FROM jobs WHERE id = ?", (job_id,))
+        return True
+
+    def get_job(self, job_id: str) -> Optional[Dict]:
+        if self.storage.shared:
+            self.reload()
+        return self._jobs.get(job_id)
+
+    def get_jobs(self, kind: str = None) -> List[Dict]:
+        """Pending jobs, soonest first"""
+        if self.storage.shared:
+            self.reload()
+        jobs = [job for job in self._jobs.values() if kind is None or job["kind"] == kind]
+        return sorted(jobs, key=lambda job: job["run_at"])
+
+    def _push(self, job: Dict):
+        job["seq"] = next(self._seq)
+        self._jobs[job["id"]] = job
+        heapq.heappush(self._heap, (job["run_at"], job["seq"], job["id"]))
+        if self._heap[0][2] == job["id"]:
+            # New earliest job: let the loop recompute its sleep
+            self._wakeup.set()
+
+    def _save(self, job: Dict):
+        self.storage.write(
+            "INSERT OR REPLACE INTO jobs (id, kind, payload, run_at, interval, jitter, base_run_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job["id"], job["kind"], json.dumps(job["payload"], ensure_ascii=False),
+             job["run_at"], job["interval"], job["jitter"], job["base_run_at"])
+        )
+
+    @staticmethod
+    def _same_job(job: Dict, other: Dict) -> bool:
+        return all(job[field] == other[field] for field in JOB_FIELDS)
+
+    def _read_job(self, job_id: str) -> Optional[Dict]:
+        """The stored version of a job"""
+        rows = self.storage.query("SELECT id, kind, payload, run_at, interval, jitter, base_run_at FROM jobs WHERE id = ?",
+                                  (job_id,))
+        return self._row_to_job(rows[0]) if rows else None
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "payload": json.loads(row["payload"]),
+            "run_at": row["run_at"],
+            "interval": row["interval"],
+            "jitter": row["jitter"] or 0,
+            # Jobs stored before base times were kept start from their run time
+            "base_run_at": row["base_run_at"] if row["base_run_at"] is not None else row["run_at"]
+        }
+
+    def _load(self):
+        """Load stored jobs into the heap"""
+        now = time.time()
+        for row in self.storage.query("SELECT id, kind, payload, run_at, interval, jitter, base_run_at FROM jobs"):
+            job = self._row_to_job(row)
+            if not job["interval"] and now - job["run_at"] > self.misfire_grace_time:
+                print(f"Dropping job {job['id']} ({job['kind']}): missed by more than the grace time")
+                self.storage.write("DELETE FROM jobs WHERE id = ?", (job["id"],))
+                continue
+            job["seq"] = next(self._seq)
+            self._jobs[job["id"]] = job
+            self._heap.append((job["run_at"], job["seq"], job["id"]))
+        heapq.heapify(self._heap)
+
+    def reload(self):
+        """Pick up jobs added, replaced or cancelled by other processes"""
+        stored = {}
+        for row in self.storage.query("SELECT id, kind, payload, run_at, interval, jitter, base_run_at FROM jobs"):
+            stored[row["id"]] = self._row_to_job(row)
+        for job_id, job in stored.items():
+            current = self._jobs.get(job_id)
+            if current is None or (job_id not in self._running_ids and not self._same_job(current, job)):
+                self._push(job)
+        for job_id in list(self._jobs):
+            if job_id not in stored and job_id not in self._running_ids:
+                del self._jobs[job_id]
+
+    async def start(self):
+        """Load persisted jobs and start dispatching"""
+        if self._loop_task is None:
+            self._load()
+            self._loop_task = asyncio.create_task(self._run_loop())
+            print(f"Scheduler started with {len(self._jobs)} pending jobs")
+
+    async def stop(self):
+        """Stop dispatching and cancel running jobs"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            await asyncio.gather(self._loop_task, return_exceptions=True)
+            self._loop_task = None
+        for task in list(self._running):
+            task.cancel()
+        await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run_loop(self):
+        while True:
+            if self.storage.shared and time.time() >= self._next_reload:
+                self.reload()
+                self._next_reload = time.time() + SCHEDULER_SYNC_INTERVAL
+
+            # Drop cancelled and replaced entries
+            while self._heap:
+                _, seq, job_id = self._heap[0]
+                job = self._jobs.get(job_id)
+                if job is not None and job["seq"] == seq:
+                    break
+                heapq.heappop(self._heap)
+
+            self._wakeup.clear()
+            delay = self._heap[0][0] - time.time() if self._heap else None
+            if delay is None or delay > 0:
+                timeout = delay
+                if self.storage.shared:
+                    # Wake up in time for the next reload
+                    sync_delay = max(self._next_reload - time.time(), 0)
+                    timeout = sync_delay if timeout is None else min(timeout, sync_delay)
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Waiting for a free slot here keeps due jobs in order under load
+            await self._semaphore.acquire()
+            _, seq, job_id = heapq.heappop(self._heap)
+            job = self._jobs.get(job_id)
+            if job is None or job["seq"] != seq:
+                self._semaphore.release()
+                continue
+            self._running_ids.add(job_id)
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, job: Dict):
+        try:
+            handler = self._handlers.get(job["kind"])
+            if handler is None:
+                print(f"No handler for job kind '{job['kind']}', skipping job {job['id']}")
+            else:
+                await handler(job["payload"])
+        except Exception as e:
+            print(f"Error running job {job['id']} ({job['kind']}): {e}")
+        finally:
+            self._semaphore.release()
+            self._running_ids.discard(job["id"])
+            self._finish(job)
+
+    def _finish(self, job: Dict):
+        """Schedule the next run of a job that has run, or remove it"""
+        if self._jobs.get(job["id"]) is not job:
+            # Cancelled or replaced here while it was running
+            return
+        if self.storage.shared:
+            # Another process may have cancelled or replaced it while it was running
+            stored = self._read_job(job["id"])
+            if stored is None:
+                del self._jobs[job["id"]]
+                return
+            if not self._same_job(stored, job):
+                self._push(stored)
+                return
+        if job["interval"]:
+            # Missed runs are coalesced: an overdue job runs once, then keeps its interval.
+            # The next run follows the base time; fresh jitter goes on top of it
+            next_run = job["base_run_at"] + job["interval"]
+            if next_run <= time.time():
+                next_run = time.time() + job["interval"]
+            job["base_run_at"] = next_run
+            job["run_at"] = next_run + random.uniform(0, job["jitter"])
+            self._save(job)
+            self._push(job)
+        else:
+            self._jobs.pop(job["id"], None)
+            self.storage.write("DELETE FROM jobs WHERE id = ?", (job["id"],))
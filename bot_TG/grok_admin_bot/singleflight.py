@@ -0,0 +1,39 @@
+import asyncio
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same exact key into one upstream call"""
+
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        """Run func once per key; callers arriving while it is in flight share the result"""
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.create_task(self._run(key, func))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+
+        # shield: a cancelled caller must not cancel the call other callers wait on
+        return await asyncio.shield(task)
+
+    async def _run(self, key: str, func: Callable[[], Awaitable[T]]) -> T:
+        try:
+            # The leader dispatches at once; duplicates attach while the call is in flight
+            return await func()
+        finally:
+            self._inflight.pop(key, None)
+
+    def get_statistics(self) -> Dict:
+        return {
+            "upstream_calls": self.calls,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._inflight)
+        }
@@ -0,0 +1,582 @@
+import asyncio
+import json
+import os
+import re
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+from config import (
+    STORAGE_DB, STORAGE_FLUSH_INTERVAL, STORAGE_BATCH_SIZE, ARTICLE_CACHE_SIZE,
+    COMMENT_HISTORY_LIMIT, COMMENT_HISTORY_RETENTION_DAYS, CALLBACK_STATE_TTL, CALLBACK_CACHE_SIZE
+)
+
+CROCKFORD_BASE32 = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+
+def new_id() -> str:
+    """ULID: 26 characters, millisecond timestamp then 80 random bits
+
+    Ids sort by creation time and don't collide across processes, however
+    many are made in the same millisecond.
+    """
+    value = (int(time.time() * 1000) << 80) | int.from_bytes(os.urandom(10), "big")
+    chars = []
+    for _ in range(26):
+        value, index = divmod(value, 32)
+        chars.append(CROCKFORD_BASE32[index])
+    return "".join(reversed(chars))
+
+class Storage:
+    """SQLite (WAL) database shared by the repositories, with batched write-behind
+
+    Writes are queued and committed together in one transaction, either after
+    STORAGE_FLUSH_INTERVAL seconds or once STORAGE_BATCH_SIZE writes are queued.
+    Every read flushes the queue first, so reads always see earlier writes.
+    shared means several bot processes use the database, so components must
+    not rely on in-memory copies of its rows.
+    """
+
+    def __init__(self, db_path: str = STORAGE_DB, flush_interval: float = STORAGE_FLUSH_INTERVAL,
+                 batch_size: int = STORAGE_BATCH_SIZE, shared: bool = False):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.shared = shared
+        self._pending: List[Tuple[str, tuple]] = []
+        self._flush_handle = None
+        # Other processes may hold the write lock for a while
+        self.conn = sqlite3.connect(db_path, timeout=30 if shared else 5)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.create_tables()
+
+    def create_tables(self):
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS articles (
+                id TEXT PRIMARY KEY,
+                topic TEXT NOT NULL,
+                content TEXT NOT NULL,
+                language TEXT NOT NULL,
+                generated_at TEXT NOT NULL,
+                posted INTEGER NOT NULL DEFAULT 0,
+                posted_at TEXT,
+                channel_id TEXT,
+                message_id INTEGER,
+                edited_at TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_articles_topic ON articles(topic);
+            CREATE INDEX IF NOT EXISTS idx_articles_language ON articles(language);
+            CREATE INDEX IF NOT EXISTS idx_articles_posted ON articles(posted, generated_at);
+            CREATE INDEX IF NOT EXISTS idx_articles_generated_at ON articles(generated_at);
+
+            CREATE TABLE IF NOT EXISTS article_schedules (
+                id TEXT PRIMARY KEY,
+                interval_hours INTEGER NOT NULL,
+                channel_id TEXT,
+                active INTEGER NOT NULL DEFAULT 1,
+                next_generation TEXT NOT NULL,
+                last_generated TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_article_schedules_due ON article_schedules(active, next_generation);
+
+            CREATE TABLE IF NOT EXISTS comment_history (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                comment TEXT NOT NULL,
+                response TEXT NOT NULL,
+                context TEXT,
+                timestamp REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_comment_history_user ON comment_history(user_id, id);
+            CREATE INDEX IF NOT EXISTS idx_comment_history_timestamp ON comment_history(timestamp);
+
+            CREATE TABLE IF NOT EXISTS conversation_memory (
+                user_id INTEGER PRIMARY KEY,
+                turns TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                run_at REAL NOT NULL,
+                interval REAL,
+                jitter REAL,
+                base_run_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_run_at ON jobs(run_at);
+
+            CREATE TABLE IF NOT EXISTS callback_state (
+                token TEXT PRIMARY KEY,
+                action TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_callback_state_expires_at ON callback_state(expires_at);
+        """)
+        self._add_missing_columns()
+        self.conn.commit()
+        self.fts_enabled = self._create_search_index()
+
+    def _add_missing_columns(self):
+        """Add columns introduced after a database was created"""
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if "base_run_at" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN base_run_at REAL")
+
+    def _create_search_index(self) -> bool:
+        """Full-text index over article topics and content, kept in sync by triggers"""
+        try:
+            exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'articles_fts'"
+            ).fetchone()
+            self.conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+                    topic, content,
+                    content='articles', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+                );
+                CREATE TRIGGER IF NOT EXISTS articles_fts_insert AFTER INSERT ON articles BEGIN
+                    INSERT INTO articles_fts(rowid, topic, content) VALUES (new.rowid, new.topic, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS articles_fts_delete AFTER DELETE ON articles BEGIN
+                    INSERT INTO articles_fts(articles_fts, rowid, topic, content)
+                    VALUES ('delete', old.rowid, old.topic, old.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS articles_fts_update AFTER UPDATE OF topic, content ON articles BEGIN
+                    INSERT INTO articles_fts(articles_fts, rowid, topic, content)
+                    VALUES ('delete', old.rowid, old.topic, old.content);
+                    INSERT INTO articles_fts(rowid, topic, content) VALUES (new.rowid, new.topic, new.content);
+                END;
+            """)
+            if not exists:
+                # Index articles stored before the index existed
+                self.conn.execute("INSERT INTO articles_fts(articles_fts) VALUES ('rebuild')")
+            self.conn.commit()
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search unavailable, falling back to LIKE: {e}")
+            return False
+
+    def write(self, sql: str, params: tuple = ()):
+        """Queue a write statement"""
+        self._pending.append((sql, params))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+            return
+        if self._flush_handle is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                # No event loop (scripts): write through
+                self.flush()
+                return
+            self._flush_handle = loop.call_later(self.flush_interval, self.flush)
+
+    def flush(self):
+        """Commit all queued writes in one transaction"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self.conn:
+                for sql, params in pending:
+                    self.conn.execute(sql, params)
+        except Exception as e:
+            print(f"Error flushing storage batch, retrying one by one: {e}")
+            # One bad statement must not drop the rest of the batch
+            for sql, params in pending:
+                try:
+                    with self.conn:
+                        self.conn.execute(sql, params)
+                except Exception as e:
+                    print(f"Error writing to storage: {e}")
+
+    def query(self, sql: str, params: tuple = ()) -> List[sqlite3.Row]:
+        """Run a read query"""
+        self.flush()
+        return self.conn.execute(sql, params).fetchall()
+
+    def close(self):
+        """Flush queued writes and close the database"""
+        if self.conn:
+            self.flush()
+            self.conn.close()
+            self.conn = None
+
+
+class LRUCache:
+    """Bounded mapping that drops the least recently used entries"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key):
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# Markers around matched words in search snippets (escaped text can't contain them)
+SNIPPET_START = "\x02"
+SNIPPET_END = "\x03"
+
+ARTICLE_FIELDS = ("topic", "content", "language", "generated_at", "posted",
+                  "posted_at", "channel_id", "message_id", "edited_at")
+
+class ArticleRepository:
+    """Generated articles, with the most recently used ones cached in memory"""
+
+    def __init__(self, storage: Storage, cache_size: int = ARTICLE_CACHE_SIZE):
+        self.storage = storage
+        # Another process may change an article, so a shared database is always read
+        self.cache = LRUCache(0 if storage.shared else cache_size)
+
+    @staticmethod
+    def _row_to_article(row: sqlite3.Row) -> Dict:
+        article = {field: row[field] for field in ARTICLE_FIELDS if row[field] is not None}
+        article["posted"] = bool(row["posted"])
+        return article
+
+    def get(self, article_id: str) -> Optional[Dict]:
+        """Get a copy of an article (callers save changes through save/update)"""
+        article = self.cache.get(article_id)
+        if article is None:
+            rows = self.storage.query("SELECT * FROM articles WHERE id = ?", (article_id,))
+            if not rows:
+                return None
+            article = self._row_to_article(rows[0])
+            self.cache.put(article_id, article)
+        return dict(article)
+
+    def __contains__(self, article_id: str) -> bool:
+        return self.get(article_id) is not None
+
+    def save(self, article_id: str, article: Dict):
+        """Insert or replace an article"""
+        article = dict(article)
+        self.cache.put(article_id, article)
+        # Upsert keeps the rowid, so iteration order stays the insertion order
+        self.storage.write(
+            f"INSERT INTO articles (id, {', '.join(ARTICLE_FIELDS)}) "
+            f"VALUES (?, {', '.join('?' for _ in ARTICLE_FIELDS)}) "
+            f"ON CONFLICT(id) DO UPDATE SET "
+            f"{', '.join(f'{field} = excluded.{field}' for field in ARTICLE_FIELDS)}",
+            (article_id,) + tuple(
+                int(article.get("posted", False)) if field == "posted" else article.get(field)
+                for field in ARTICLE_FIELDS
+            )
+        )
+
+    def update(self, article_id: str, **fields) -> bool:
+        """Change some fields of a stored article"""
+        article = self.get(article_id)
+        if article is None:
+            return False
+        article.update(fields)
+        self.save(article_id, article)
+        return True
+
+    def delete(self, article_id: str):
+        self.cache.pop(article_id)
+        self.storage.write("DELETE FROM articles WHERE id = ?", (article_id,))
+
+    def find(self, topic: str = None, language: str = None, posted: bool = None,
+             limit: int = 50, offset: int = 0) -> List[Tuple[str, Dict]]:
+        """Articles matching the filters, newest first"""
+        conditions = []
+        params = []
+        if topic is not None:
+            conditions.append("topic = ?")
+            params.append(topic)
+        if language is not None:
+            conditions.append("language = ?")
+            params.append(language)
+        if posted is not None:
+            conditions.append("posted = ?")
+            params.append(int(posted))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.storage.query(
+            f"SELECT * FROM articles {where} ORDER BY generated_at DESC LIMIT ? OFFSET ?",
+            tuple(params) + (limit, offset)
+        )
+        return [(row["id"], self._row_to_article(row)) for row in rows]
+
+    @staticmethod
+    def make_match_query(query: str) -> str:
+        """Turn user input into an FTS5 query: all words must match, word* is a prefix"""
+        terms = []
+        for word, prefix in re.findall(r"(\w+)(\*?)", query.lower()):
+            terms.append(f'"{word}"{prefix}')
+        return " ".join(terms)
+
+    def search(self, query: str, limit: int = 50, offset: int = 0) -> List[Tuple[str, Dict]]:
+        """Articles matching the query, best matches first
+        
+        With the full-text index each result gets a "snippet" with the matched
+        words wrapped in SNIPPET_START/SNIPPET_END markers.
+        """
+        if not self.storage.fts_enabled:
+            return self._search_like(query, limit, offset)
+        match = self.make_match_query(query)
+        if not match:
+            return []
+        # Rank inside FTS (bm25, a match in the topic weighs more than one in the
+        # content) and join only the requested page
+        rows = self.storage.query(
+            "SELECT articles.*, page.snippet FROM ("
+            "  SELECT rowid, rank, snippet(articles_fts, 1, ?, ?, '…', 16) AS snippet FROM articles_fts"
+            "  WHERE articles_fts MATCH ? AND rank MATCH 'bm25(5.0, 1.0)'"
+            "  ORDER BY rank LIMIT ? OFFSET ?"
+            ") AS page JOIN articles ON articles.rowid = page.rowid ORDER BY page.rank",
+            (SNIPPET_START, SNIPPET_END, match, limit, offset)
+        )
+        results = []
+        for row in rows:
+            article = self._row_to_article(row)
+            article["snippet"] = row["snippet"]
+            results.append((row["id"], article))
+        return results
+
+    def count_search(self, query: str) -> int:
+        """Number of articles matching the query"""
+        if not self.storage.fts_enabled:
+            pattern = self._like_pattern(query)
+            return self.storage.query(
+                "SELECT COUNT(*) FROM articles WHERE topic LIKE ? ESCAPE '\\' OR content LIKE ? ESCAPE '\\'",
+                (pattern, pattern)
+            )[0][0]
+        match = self.make_match_query(query)
+        if not match:
+            return 0
+        return self.storage.query("SELECT COUNT(*) FROM articles_fts WHERE articles_fts MATCH ?", (match,))[0][0]
+
+    @staticmethod
+    def _like_pattern(query: str) -> str:
+        return "%" + query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+    def _search_like(self, query: str, limit: int, offset: int) -> List[Tuple[str, Dict]]:
+        """Substring search for SQLite builds without FTS5"""
+        pattern = self._like_pattern(query)
+        rows = self.storage.query(
+            "SELECT * FROM articles WHERE topic LIKE ? ESCAPE '\\' OR content LIKE ? ESCAPE '\\' "
+            "ORDER BY generated_at DESC LIMIT ? OFFSET ?",
+            (pattern, pattern, limit, offset)
+        )
+        return [(row["id"], self._row_to_article(row)) for row in rows]
+
+    def iter_all(self, page_size: int = 500, language: str = None, posted: bool = None,
+                 since: datetime = None, until: datetime = None) -> Iterator[Tuple[str, Dict]]:
+        """Iterate over articles in insertion order without loading them at once
+
+        The filters keep articles in that language, posted or not, and generated
+        from since up to (not including) until.
+        """
+        conditions = ["rowid > ?"]
+        params = []
+        if language is not None:
+            conditions.append("language = ?")
+            params.append(language)
+        if posted is not None:
+            conditions.append("posted = ?")
+            params.append(int(posted))
+        if since is not None:
+            conditions.append("generated_at >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append("generated_at < ?")
+            params.append(until.isoformat())
+        last_rowid = 0
+        while True:
+            rows = self.storage.query(
+                f"SELECT rowid, * FROM articles WHERE {' AND '.join(conditions)} ORDER BY rowid LIMIT ?",
+                (last_rowid, *params, page_size)
+            )
+            if not rows:
+                return
+            for row in rows:
+                yield row["id"], self._row_to_article(row)
+            last_rowid = rows[-1]["rowid"]
+
+    def count(self, posted: bool = None) -> int:
+        if posted is None:
+            rows = self.storage.query("SELECT COUNT(*) FROM articles")
+        else:
+            rows = self.storage.query("SELECT COUNT(*) FROM articles WHERE posted = ?", (int(posted),))
+        return rows[0][0]
+
+    def count_by(self, field: str) -> Dict[str, int]:
+        """Number of articles per language or topic"""
+        if field not in ("language", "topic"):
+            raise ValueError(f"Unsupported field: {field}")
+        rows = self.storage.query(f"SELECT {field}, COUNT(*) FROM articles GROUP BY {field}")
+        return {row[0]: row[1] for row in rows}
+
+
+class ScheduleRepository:
+    """Article generation schedules"""
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+
+    @staticmethod
+    def _row_to_schedule(row: sqlite3.Row) -> Dict:
+        return {
+            "interval_hours": row["interval_hours"],
+            "channel_id": row["channel_id"],
+            "active": bool(row["active"]),
+            "next_generation": datetime.fromisoformat(row["next_generation"]),
+            "last_generated": row["last_generated"]
+        }
+
+    def save(self, schedule_id: str, schedule: Dict):
+        self.storage.write(
+            "INSERT OR REPLACE INTO article_schedules "
+            "(id, interval_hours, channel_id, active, next_generation, last_generated) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (schedule_id, schedule["interval_hours"], schedule.get("channel_id"),
+             int(schedule.get("active", True)), schedule["next_generation"].isoformat(),
+             schedule.get("last_generated"))
+        )
+
+    def get(self, schedule_id: str) -> Optional[Dict]:
+        rows = self.storage.query("SELECT * FROM article_schedules WHERE id = ?", (schedule_id,))
+        return self._row_to_schedule(rows[0]) if rows else None
+
+    def get_active(self) -> List[Tuple[str, Dict]]:
+        rows = self.storage.query(
+            "SELECT * FROM article_schedules WHERE active = 1 ORDER BY next_generation"
+        )
+        return [(row["id"], self._row_to_schedule(row)) for row in rows]
+
+    def get_due(self, now: datetime) -> List[Tuple[str, Dict]]:
+        """Active schedules whose next generation time has come"""
+        rows = self.storage.query(
+            "SELECT * FROM article_schedules WHERE active = 1 AND next_generation <= ? "
+            "ORDER BY next_generation",
+            (now.isoformat(),)
+        )
+        return [(row["id"], self._row_to_schedule(row)) for row in rows]
+
+    def set_active(self, schedule_id: str, active: bool):
+        self.storage.write("UPDATE article_schedules SET active = ? WHERE id = ?", (int(active), schedule_id))
+
+    def count_active(self) -> int:
+        return self.storage.query("SELECT COUNT(*) FROM article_schedules WHERE active = 1")[0][0]
+
+
+class CommentHistoryRepository:
+    """Answered comments; old entries are pruned after COMMENT_HISTORY_RETENTION_DAYS"""
+
+    PRUNE_EVERY = 1000  # writes between prunes
+
+    def __init__(self, storage: Storage, retention_days: int = COMMENT_HISTORY_RETENTION_DAYS):
+        self.storage = storage
+        self.retention_days = retention_days
+        self._writes = 0
+
+    def add(self, user_id: int, comment: str, response: str, context: str):
+        now = time.time()
+        self.storage.write(
+            "INSERT INTO comment_history (user_id, comment, response, context, timestamp) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user_id, comment, response, context, now)
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.storage.write("DELETE FROM comment_history WHERE timestamp < ?",
+                               (now - self.retention_days * 86400,))
+
+    def get_user_history(self, user_id: int, limit: int = COMMENT_HISTORY_LIMIT) -> List[Dict]:
+        """Latest comments of a user, oldest first"""
+        rows = self.storage.query(
+            "SELECT comment, response, context, timestamp FROM comment_history "
+            "WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_id, limit)
+        )
+        return [dict(row) for row in reversed(rows)]
+
+    def count(self) -> int:
+        return self.storage.query("SELECT COUNT(*) FROM comment_history")[0][0]
+
+    def count_users(self) -> int:
+        return self.storage.query("SELECT COUNT(DISTINCT user_id) FROM comment_history")[0][0]
+
+
+class CallbackStateRepository:
+    """What inline keyboard buttons do, stored behind short tokens
+
+    A button's callback_data (at most 64 bytes) carries only a token; the
+    action and its payload live in the database, so buttons keep working
+    after a restart and in every worker, until they expire after ttl seconds.
+    """
+
+    PRUNE_EVERY = 1000  # puts between prunes of expired states
+
+    def __init__(self, storage: Storage, ttl: float = CALLBACK_STATE_TTL, cache_size: int = CALLBACK_CACHE_SIZE):
+        self.storage = storage
+        self.ttl = ttl
+        # States never change, but another worker may have made them
+        self.cache = LRUCache(cache_size)
+        self._puts = 0
+
+    def put(self, action: str, payload: Dict = None) -> str:
+        """Store a state and return its token"""
+        token = secrets.token_urlsafe(9)  # 12 characters, 72 random bits
+        now = time.time()
+        state = (action, dict(payload or {}), now + self.ttl)
+        self.cache.put(token, state)
+        self.storage.write(
+            "INSERT INTO callback_state (token, action, payload, expires_at) VALUES (?, ?, ?, ?)",
+            (token, action, json.dumps(state[1], ensure_ascii=False), state[2])
+        )
+        if self.storage.shared:
+            # The button may be pressed in another worker before the batch is committed
+            self.storage.flush()
+        self._puts += 1
+        if self._puts % self.PRUNE_EVERY == 0:
+            self.storage.write("DELETE FROM callback_state WHERE expires_at < ?", (now,))
+        return token
+
+    def get(self, token: str) -> Optional[Tuple[str, Dict]]:
+        """Action and payload of a token, None if it is unknown or expired"""
+        state = self.cache.get(token)
+        if state is None:
+            rows = self.storage.query(
+                "SELECT action, payload, expires_at FROM callback_state WHERE token = ?", (token,)
+            )
+            if not rows:
+                return None
+            state = (rows[0]["action"], json.loads(rows[0]["payload"]), rows[0]["expires_at"])
+            self.cache.put(token, state)
+        action, payload, expires_at = state
+        if expires_at < time.time():
+            return None
+        return action, dict(payload)
+
+    def delete(self, token: str):
+        self.cache.pop(token)
+        self.storage.write("DELETE FROM callback_state WHERE token = ?", (token,))
+
+    def count(self) -> int:
+        return self.storage.query("SELECT COUNT(*) FROM callback_state WHERE expires_at >= ?", (time.time(),))[0][0]
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from telegram import InlineKeyboardMarkup, Message
+from telegram.error import BadRequest, RetryAfter
+from config import STREAM_EDIT_INTERVAL, STREAM_EDIT_MIN_CHARS, TELEGRAM_MESSAGE_LIMIT
+
+class StreamingMessageEditor:
+    """Shows streamed text in a Telegram message with throttled edits"""
+
+    def __init__(self, message: Message, header: str = "",
+                 interval: float = STREAM_EDIT_INTERVAL, min_chars: int = STREAM_EDIT_MIN_CHARS):
+        self.message = message
+        self.header = header
+        self.interval = interval
+        self.min_chars = min_chars
+        self._last_edit = 0.0
+        self._shown_length = 0
+        self._next_allowed = 0.0  # set from RetryAfter
+
+    @staticmethod
+    def _fit(text: str, header: str = "", suffix: str = "") -> str:
+        """Trim text so the header, text and suffix fit into one message"""
+        limit = TELEGRAM_MESSAGE_LIMIT - len(header) - len(suffix)
+        if len(text) > limit:
+            text = text[:limit - 3] + "..."
+        return header + text + suffix
+
+    async def update(self, text: str):
+        """Edit the message once per interval or once enough new text arrived"""
+        now = time.monotonic()
+        if now < self._next_allowed:
+            return
+        grown = len(text) - self._shown_length
+        if grown <= 0:
+            return
+        # The first tokens are shown right away, later edits are throttled
+        if self._shown_length and now - self._last_edit < self.interval and grown < self.min_chars:
+            return
+        if self._shown_length >= TELEGRAM_MESSAGE_LIMIT:
+            return  # Nothing more fits, wait for the final edit
+
+        # Plain text while streaming: a half-received tag would break HTML parsing
+        await self._edit(self._fit(text, self.header, " ▌"))
+        self._last_edit = time.monotonic()
+        self._shown_length = len(text)
+
+    async def finish(self, text: str, header: str = "", reply_markup: InlineKeyboardMarkup = None,
+                     parse_mode: str = 'HTML') -> bool:
+        """Replace the streamed preview with the final text"""
+        return await self._edit(self._fit(text, header), reply_markup, parse_mode, final=True)
+
+    async def _edit(self, text: str, reply_markup: InlineKeyboardMarkup = None,
+                    parse_mode: str = None, final: bool = False) -> bool:
+        try:
+            await self.message.edit_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+            return True
+        except RetryAfter as e:
+            retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+            if not final:
+                self._next_allowed = time.monotonic() + retry_after
+                return False
+            # The final text must arrive, wait as long as Telegram asks
+            await asyncio.sleep(retry_after)
+            return await self._edit(text, reply_markup, parse_mode, final)
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                return True
+            print(f"Error editing streamed message: {e}")
+            return False
+        except Exception as e:
+            print(f"Error editing streamed message: {e}")
+            return False
@@ -0,0 +1,49 @@
+import asyncio
+import unittest
+from llm_router import LLMProvider, LLMRouter
+
+
+class FakeResponse:
+    status_code = 200
+    headers = {}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"choices": [{"message": {"content": "ok"}}]}
+
+
+class FakeHTTP:
+    """Records the timeout every request is sent with; provider "slow" takes delay seconds"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.sent = []
+
+    async def post(self, url, json=None, headers=None, timeout=None):
+        self.sent.append((url, timeout))
+        await asyncio.sleep(self.delay if "slow" in url else 0.01)
+        return FakeResponse()
+
+
+class RequestTimeoutTest(unittest.TestCase):
+    def test_hedged_and_fallback_requests_keep_the_request_timeout(self):
+        http = FakeHTTP(delay=1.5)
+        slow = LLMProvider("slow", "http://slow/v1/chat/completions", "m", timeout=60)
+        fast = LLMProvider("fast", "http://fast/v1/chat/completions", "m", timeout=60)
+        # Ranked first by its past latency, hedged after LLM_HEDGE_MIN_DELAY
+        slow.latency, fast.latency = 0.01, 0.02
+        router = LLMRouter([slow, fast], lambda: http)
+
+        result = asyncio.run(router.complete({"model": "m", "messages": []}, hedge=True, timeout=30))
+
+        self.assertIsNotNone(result)
+        self.assertEqual(router.hedged, 1)
+        self.assertEqual([url for url, _ in http.sent], [slow.url, fast.url])
+        for _, timeout in http.sent:
+            self.assertEqual(timeout.read, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import logging
+import math
+import re
+from typing import Dict, Optional
+from config import OPENAI_MODEL, MODEL_CONTEXT_WINDOW, MODEL_PRICES
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Average characters per token when tiktoken is not installed
+CHARS_PER_TOKEN_LATIN = 4.0
+CHARS_PER_TOKEN_CYRILLIC = 2.5
+
+def model_price(model: str) -> Optional[tuple]:
+    """(prompt, completion) USD per 1M tokens; dated versions match their base model"""
+    matches = [name for name in MODEL_PRICES if model == name or model.startswith(f"{name}-")]
+    return MODEL_PRICES[max(matches, key=len)] if matches else None
+
+class TokenBudget:
+    """Counts tokens, fits prompts into a budget and tracks token usage, latency and cost per task"""
+
+    def __init__(self, model: str = OPENAI_MODEL, context_window: int = MODEL_CONTEXT_WINDOW):
+        self.context_window = context_window
+        self.encoding = None
+        if tiktoken is not None:
+            try:
+                self.encoding = tiktoken.encoding_for_model(model)
+            except KeyError:
+                self.encoding = tiktoken.get_encoding("cl100k_base")
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.tasks: Dict[str, Dict] = {}
+
+    def count(self, text: str) -> int:
+        """Number of tokens in a text (estimated without tiktoken)"""
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text))
+        cyrillic = sum(1 for char in text if "\u0400" <= char <= "\u04ff")
+        return math.ceil((len(text) - cyrillic) / CHARS_PER_TOKEN_LATIN + cyrillic / CHARS_PER_TOKEN_CYRILLIC)
+
+    def tokens_for_chars(self, chars: int, language: str) -> int:
+        """Tokens needed for an output of about that many characters"""
+        per_token = CHARS_PER_TOKEN_CYRILLIC if language == "ru" else CHARS_PER_TOKEN_LATIN
+        return math.ceil(chars / per_token)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut a text down to max_tokens"""
+        if self.count(text) <= max_tokens:
+            return text
+        if self.encoding is not None:
+            return self.encoding.decode(self.encoding.encode(text)[:max_tokens]) + "…"
+        # Shrink proportionally; the estimate is close enough for a budget
+        ratio = max_tokens / self.count(text)
+        return text[:int(len(text) * ratio)] + "…"
+
+    def compact(self, text: str, max_tokens: int) -> str:
+        """Fit context into max_tokens, keeping its beginning and end"""
+        # Whitespace and repeated lines cost tokens and carry nothing
+        lines = []
+        for line in text.splitlines():
+            line = re.sub(r"\s+", " ", line).strip()
+            if line and line not in lines:
+                lines.append(line)
+        text = "\n".join(lines)
+        if self.count(text) <= max_tokens:
+            return text
+
+        # The start of a post usually carries its topic, the end the latest details
+        head = self.truncate(text, max_tokens * 2 // 3)
+        tail_budget = max_tokens - self.count(head) - 1
+        if tail_budget <= 0:
+            return head
+        tail = text[-int(len(text) * tail_budget / self.count(text)):]
+        return f"{head} {tail.lstrip()}"
+
+    def cap_max_tokens(self, prompt_tokens: int, max_tokens: int) -> int:
+        """Limit max_tokens to what fits into the context window after the prompt"""
+        return max(1, min(max_tokens, self.context_window - prompt_tokens))
+
+    def record(self, task: str, usage: Optional[Dict], estimated_prompt_tokens: int = 0,
+               model: str = None, latency: float = None):
+        """Log and accumulate the token usage, latency and cost of one API call"""
+        usage = usage or {}
+        prompt_tokens = usage.get("prompt_tokens", estimated_prompt_tokens)
+        completion_tokens = usage.get("completion_tokens", 0)
+        price = model_price(model) if model else None
+        cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000 if price else 0.0
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cost += cost
+        
+        stats = self._task_stats(task)
+        stats["calls"] += 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["latency"] += latency or 0.0
+        stats["cost"] += cost
+        logger.info(f"LLM call ({task}, {model}): prompt {prompt_tokens} tokens "
+                    f"(estimated {estimated_prompt_tokens}), completion {completion_tokens} tokens, "
+                    f"{latency or 0:.2f} s, ${cost:.5f}")
+
+    def _task_stats(self, task: str) -> Dict:
+        return self.tasks.setdefault(task, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                                            "latency": 0.0, "cost": 0.0, "abandoned": 0, "abandoned_cost": 0.0})
+
+    def record_abandoned(self, task: str, estimated_prompt_tokens: int, model: str = None):
+        """Account for a request cancelled after it was sent (a lost hedge race)
+
+        Only the estimated prompt is counted: the partial completion is unknown.
+        """
+        price = model_price(model) if model else None
+        cost = estimated_prompt_tokens * price[0] / 1_000_000 if price else 0.0
+        self.prompt_tokens += estimated_prompt_tokens
+        self.cost += cost
+        stats = self._task_stats(task)
+        stats["prompt_tokens"] += estimated_prompt_tokens
+        stats["cost"] += cost
+        stats["abandoned"] += 1
+        stats["abandoned_cost"] += cost
+        logger.info(f"LLM call abandoned ({task}, {model}): prompt ~{estimated_prompt_tokens} tokens, ${cost:.5f}")
+
+    def get_statistics(self) -> Dict:
+        return {
+            "calls": self.calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "average_tokens": round((self.prompt_tokens + self.completion_tokens) / self.calls) if self.calls else 0,
+            "cost": round(self.cost, 6)
+        }
+
+    def get_task_statistics(self) -> Dict[str, Dict]:
+        """Calls, tokens, average latency and cost per task"""
+        return {
+            task: {
+                "calls": stats["calls"],
+                "prompt_tokens": stats["prompt_tokens"],
+                "completion_tokens": stats["completion_tokens"],
+                "average_latency": round(stats["latency"] / stats["calls"], 2) if stats["calls"] else 0.0,
+                "cost": round(stats["cost"], 6),
+                "abandoned": stats["abandoned"],
+                "abandoned_cost": round(stats["abandoned_cost"], 6)
+            }
+            for task, stats in self.tasks.items()
+        }
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Train the local moderation classifier and save its weights
+
+Samples are a CSV file with "text" and "label" columns or a JSONL file with
+"text" and "label" keys; labels spam/1/true/yes mark spam, anything else is
+a normal comment. The weights go to MODERATION_WEIGHTS_FILE, which the bot
+loads on start.
+"""
+
+import argparse
+import csv
+import json
+import random
+from typing import List, Tuple
+
+from config import MODERATION_WEIGHTS_FILE
+from moderation import LocalModerator
+
+SPAM_LABELS = {"spam", "1", "true", "yes"}
+
+def load_samples(path: str) -> List[Tuple[str, bool]]:
+    """(text, is_spam) pairs from a CSV or JSONL file"""
+    with open(path, encoding="utf-8", newline="") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [(row["text"], str(row["label"]).strip().lower() in SPAM_LABELS) for row in rows if row.get("text")]
+
+def evaluate(moderator: LocalModerator, samples: List[Tuple[str, bool]]):
+    """Print how the confident verdicts of the classifier do on held-out samples"""
+    decided = correct = 0
+    for text, is_spam in samples:
+        probability = moderator.spam_probability(text)
+        if probability >= moderator.spam_threshold or probability <= moderator.ham_threshold:
+            decided += 1
+            correct += (probability >= moderator.spam_threshold) == is_spam
+    print(f"Held-out samples: {len(samples)}, decided locally: {decided}, "
+          f"correct: {correct / decided * 100 if decided else 0:.1f}%")
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the local moderation classifier")
+    parser.add_argument("samples", help="CSV (text,label) or JSONL file with labelled comments")
+    parser.add_argument("--output", default=MODERATION_WEIGHTS_FILE, help="weights file to write")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--holdout", type=float, default=0.1, help="share of samples kept for evaluation")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    random.Random(0).shuffle(samples)
+    split = int(len(samples) * (1 - args.holdout))
+    train, held_out = samples[:split], samples[split:]
+    print(f"Training on {len(train)} samples ({sum(is_spam for _, is_spam in train)} spam)")
+
+    # Start from scratch, not from the weights currently in use
+    moderator = LocalModerator(weights_file=None)
+    moderator.train(train, epochs=args.epochs)
+    if held_out:
+        evaluate(moderator, held_out)
+    moderator.weights_file = args.output
+    moderator.save_weights()
+    print(f"Saved {len(moderator.weights)} weights to {args.output}")
+
+if __name__ == "__main__":
+    main()
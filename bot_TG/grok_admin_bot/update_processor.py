@@ -0,0 +1,139 @@
+import asyncio
+import heapq
+import itertools
+from typing import Awaitable, Dict, List, Optional, Tuple
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from config import MAX_CONCURRENT_UPDATES, MAX_PENDING_UPDATES, COMMENT_LANE_MAX_CONCURRENCY
+
+# Lanes in priority order, lower runs first
+COMMAND_LANE = 0
+CALLBACK_LANE = 1
+COMMENT_LANE = 2
+LANE_NAMES = {COMMAND_LANE: "commands", CALLBACK_LANE: "callbacks", COMMENT_LANE: "comments"}
+
+class PriorityUpdateProcessor(BaseUpdateProcessor):
+    """Processes updates concurrently with priority lanes
+
+    Commands go before button callbacks, which go before comments: when all
+    max_concurrent_updates slots are busy, the next free slot goes to the
+    highest-priority waiting update. Comments never take more than
+    comment_lane_limit slots, so commands stay responsive during a comment
+    flood. Commands and callbacks of the same chat run one at a time, in the
+    order they arrived; so do comments of the same user in a chat, while
+    different users' comments in one discussion group run in parallel.
+
+    The base class semaphore (max_pending_updates) only bounds how many
+    updates are running or queued here: if it were the running limit, queued
+    comments would hold its slots and commands could not get ahead of them.
+    """
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES,
+                 comment_lane_limit: int = COMMENT_LANE_MAX_CONCURRENCY,
+                 max_pending_updates: int = MAX_PENDING_UPDATES):
+        super().__init__(max(max_pending_updates, max_concurrent_updates))
+        self.max_running_updates = max_concurrent_updates
+        self.comment_lane_limit = min(comment_lane_limit, max_concurrent_updates)
+        self._active = {lane: 0 for lane in LANE_NAMES}
+        self._processed = {lane: 0 for lane in LANE_NAMES}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []  # (lane, seq, future)
+        self._seq = itertools.count()
+        self._chat_locks: Dict[Tuple, List] = {}  # ordering key -> [lock, users]
+
+    @staticmethod
+    def get_lane(update: object) -> int:
+        if isinstance(update, Update):
+            if update.callback_query:
+                return CALLBACK_LANE
+            message = update.effective_message
+            if message and message.text and message.text.startswith("/"):
+                return COMMAND_LANE
+        return COMMENT_LANE
+
+    @staticmethod
+    def get_order_key(update: object, lane: int) -> Optional[Tuple]:
+        """Updates with the same key run in arrival order, None: no ordering needed"""
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            return None
+        if lane != COMMENT_LANE:
+            return chat.id, lane
+        # A discussion group gets every comment of the channel: only one user's comments need order
+        message = update.effective_message
+        sender = update.effective_user or (message.sender_chat if message else None)
+        if sender is None:
+            return None
+        return chat.id, lane, sender.id
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        lane = self.get_lane(update)
+        key = self.get_order_key(update, lane)
+        if key is None:
+            await self._run(lane, coroutine)
+            return
+
+        entry = self._chat_locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, which keeps the chat's updates in order
+            async with entry[0]:
+                await self._run(lane, coroutine)
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._chat_locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def _run(self, lane: int, coroutine: Awaitable):
+        await self._acquire(lane)
+        try:
+            await coroutine
+        finally:
+            self._release(lane)
+
+    def _can_start(self, lane: int) -> bool:
+        if sum(self._active.values()) >= self.max_running_updates:
+            return False
+        return lane != COMMENT_LANE or self._active[COMMENT_LANE] < self.comment_lane_limit
+
+    async def _acquire(self, lane: int):
+        # Updates waiting in the same or a higher lane go first
+        if self._can_start(lane) and not (self._waiters and self._waiters[0][0] <= lane):
+            self._active[lane] += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as we were cancelled
+                self._release(lane)
+            raise
+
+    def _release(self, lane: int):
+        self._active[lane] -= 1
+        self._processed[lane] += 1
+        # Waiters are ordered by lane, so a blocked comment means only comments are left
+        while self._waiters and self._can_start(self._waiters[0][0]):
+            waiter_lane, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._active[waiter_lane] += 1
+            future.set_result(None)
+
+    def get_statistics(self) -> Dict:
+        waiting = {lane: 0 for lane in LANE_NAMES}
+        for lane, _, future in self._waiters:
+            if not future.done():
+                waiting[lane] += 1
+        return {
+            name: {"active": self._active[lane], "waiting": waiting[lane], "processed": self._processed[lane]}
+            for lane, name in LANE_NAMES.items()
+        }
@@ -0,0 +1,69 @@
+import hmac
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+from config import WEBHOOK_PATH, WEBHOOK_HOST, WEBHOOK_PORT
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class WebhookServer:
+    """aiohttp endpoint that receives updates from Telegram
+
+    Requests without the right secret token are rejected. Accepted updates go
+    into the application's update queue and are answered right away, so
+    Telegram never waits for a handler. With reuse_port several processes
+    can listen on the same port and the kernel spreads connections among them.
+    The kernel doesn't route by chat, so one chat's updates may land in
+    different processes: per-chat ordering, request coalescing, rate limit
+    buckets and in-memory caches only hold within one process.
+    """
+
+    def __init__(self, application: Application, secret_token: str, path: str = WEBHOOK_PATH,
+                 host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT):
+        self.application = application
+        self.secret_token = secret_token.encode()
+        self.path = path
+        self.host = host
+        self.port = port
+        self.runner = None
+        self.received = 0
+        self.rejected = 0
+
+    async def start(self, reuse_port: bool = False):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get("/healthz", self.handle_health)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port, reuse_port=reuse_port or None)
+        await site.start()
+        print(f"Webhook server listening on {self.host}:{self.port}{self.path}")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_TOKEN_HEADER, "").encode()
+        if not hmac.compare_digest(token, self.secret_token):
+            self.rejected += 1
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            if not isinstance(data, dict):
+                raise ValueError(f"expected an object, got {type(data).__name__}")
+            update = Update.de_json(data, self.application.bot)
+        except (ValueError, TypeError, AttributeError, KeyError) as e:
+            # A malformed body answered with 500 would be retried by Telegram forever
+            print(f"Error decoding webhook update: {e}")
+            return web.Response(status=400)
+
+        if update is not None:
+            self.received += 1
+            await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.json_response({"received": self.received, "rejected": self.rejected})
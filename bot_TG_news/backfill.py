@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Загрузка архива новостей 013info.rs в базу данных
+Страницы скачиваются асинхронно, HTML разбирается в пуле процессов
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import aiohttp
+
+from config.settings import NEWS_URL, REQUEST_TIMEOUT, LOG_LEVEL, LOG_FILE, SNAPSHOTS_ENABLED
+from database.models import NewsDatabase
+from database.snapshots import SnapshotStore
+from services.news_parser import NewsParser, parse_news_html, NEWS_FIELDS
+from utils.helpers import setup_logging, validate_news_data
+
+setup_logging(LOG_LEVEL, LOG_FILE)
+logger = logging.getLogger(__name__)
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+
+def filter_valid(rows: List[Tuple]) -> List[Tuple]:
+    """Отбрасывает новости, не прошедшие validate_news_data"""
+    return [row for row in rows if validate_news_data(dict(zip(NEWS_FIELDS, row)))]
+
+async def fetch_page(session: aiohttp.ClientSession, semaphore: asyncio.Semaphore,
+                     url: str, retries: int = 3) -> bytes:
+    """Скачивает страницу и возвращает сырые байты (пустые для отсутствующих страниц)"""
+    for attempt in range(retries):
+        try:
+            async with semaphore:
+                async with session.get(url) as response:
+                    if response.status == 404:
+                        logger.info(f"Страница не найдена: {url}")
+                        return b''
+                    response.raise_for_status()
+                    return await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if attempt == retries - 1:
+                logger.error(f"Не удалось загрузить {url}: {e}")
+                return b''
+            logger.warning(f"Попытка {attempt + 1} для {url} не удалась: {e}")
+            await asyncio.sleep(2 ** attempt)
+    return b''
+
+async def fetch_and_parse(session, semaphore, pool, url: str, snapshots=None) -> List[Tuple]:
+    """Скачивает страницу в цикле событий и разбирает ее в отдельном процессе"""
+    html = await fetch_page(session, semaphore, url)
+    if not html:
+        return []
+    if snapshots:
+        snapshots.save(url, html)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool, parse_news_html, html)
+
+async def backfill(database: NewsDatabase, start_page: int, end_page: int,
+                   concurrency: int, workers: int, batch_size: int,
+                   mark_as_sent: bool, snapshots: SnapshotStore = None) -> Tuple[int, int]:
+    """Загружает страницы архива и пакетно сохраняет новости"""
+    parser = NewsParser(NEWS_URL)
+    urls = [parser.get_page_url(page) for page in range(start_page, end_page + 1)]
+    parser.close()
+
+    semaphore = asyncio.Semaphore(concurrency)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    connector = aiohttp.TCPConnector(limit=concurrency)
+
+    found = 0
+    inserted = 0
+    pending_rows = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector,
+                                         headers={'User-Agent': USER_AGENT}) as session:
+            tasks = [fetch_and_parse(session, semaphore, pool, url, snapshots) for url in urls]
+
+            for done, task in enumerate(asyncio.as_completed(tasks), 1):
+                rows = filter_valid(await task)
+                found += len(rows)
+                pending_rows.extend(rows)
+
+                if len(pending_rows) >= batch_size:
+                    inserted += database.add_news_bulk(pending_rows, mark_as_sent)
+                    pending_rows = []
+
+                if done % 50 == 0:
+                    logger.info(f"Обработано страниц: {done}/{len(urls)}, новостей: {found}")
+
+    if pending_rows:
+        inserted += database.add_news_bulk(pending_rows, mark_as_sent)
+
+    return found, inserted
+
+def main():
+    """Главная функция"""
+    arg_parser = argparse.ArgumentParser(description='Загрузка архива новостей в базу данных')
+    arg_parser.add_argument('--pages', type=int, default=100, help='последняя страница архива')
+    arg_parser.add_argument('--start', type=int, default=1, help='первая страница архива')
+    arg_parser.add_argument('--concurrency', type=int, default=8, help='одновременных HTTP запросов')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='процессов для парсинга')
+    arg_parser.add_argument('--batch-size', type=int, default=500, help='новостей в одной вставке')
+    arg_parser.add_argument('--no-snapshots', action='store_true',
+                            help='не сохранять снимки страниц')
+    arg_parser.add_argument('--send', action='store_true',
+                            help='поставить новости в очередь отправки (по умолчанию считаются отправленными)')
+    args = arg_parser.parse_args()
+
+    logger.info(f"Загрузка архива: страницы {args.start}-{args.pages}, "
+                f"{args.concurrency} запросов, {args.workers} процессов")
+
+    start_time = time.time()
+    snapshots = SnapshotStore() if SNAPSHOTS_ENABLED and not args.no_snapshots else None
+    try:
+        with NewsDatabase() as database:
+            found, inserted = asyncio.run(backfill(
+                database, args.start, args.pages, args.concurrency,
+                args.workers, args.batch_size, mark_as_sent=not args.send,
+                snapshots=snapshots
+            ))
+    finally:
+        if snapshots:
+            snapshots.close()
+
+    duration = time.time() - start_time
+    logger.info(f"Загрузка архива завершена за {duration:.1f} сек: "
+                f"найдено {found}, добавлено {inserted} новостей")
+
+if __name__ == '__main__':
+    main()
@@ -36,6 +36,43 @@ EXCLUDED_KEYWORDS = os.getenv('EXCLUDED_KEYWORDS', 'reklama,oglas,sponzor,reklam
 # Настройки базы данных
 DATABASE_FILE = os.getenv('DATABASE_FILE', 'news.db')
 
+# Настройки маршрутизации по каналам
+def _parse_routes(value: str) -> dict:
+    """Разбирает строку вида 'sport:-1001,-1002;hronika:-1003'"""
+    routes = {}
+    for rule in value.split(';'):
+        if ':' not in rule:
+            continue
+        key, chats = rule.split(':', 1)
+        chat_ids = [chat.strip() for chat in chats.split(',') if chat.strip()]
+        if key.strip() and chat_ids:
+            routes[key.strip().lower()] = chat_ids
+    return routes
+
+CATEGORY_ROUTES = _parse_routes(os.getenv('CATEGORY_ROUTES', ''))
+KEYWORD_ROUTES = _parse_routes(os.getenv('KEYWORD_ROUTES', ''))
+ARCHIVE_CHAT_ID = os.getenv('ARCHIVE_CHAT_ID', '')
+CHANNEL_MESSAGES_PER_MINUTE = int(os.getenv('CHANNEL_MESSAGES_PER_MINUTE', 20))
+DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', 8))
+
+# Настройки очереди отправки
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 10))
+OUTBOX_INTERVAL = int(os.getenv('OUTBOX_INTERVAL', 30))  # секунды
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 5))
+
+# Настройки изображений
+IMAGE_PREFETCH_WORKERS = int(os.getenv('IMAGE_PREFETCH_WORKERS', 4))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))  # Лимит Telegram для фото
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.getenv('IMAGE_MAX_DOWNLOAD_BYTES', 20 * 1024 * 1024))
+IMAGE_MAX_SIDE = int(os.getenv('IMAGE_MAX_SIDE', 1280))
+IMAGE_DOWNSCALE = os.getenv('IMAGE_DOWNSCALE', 'true').lower() == 'true'
+IMAGE_REJECT_TTL = int(os.getenv('IMAGE_REJECT_TTL', 24 * 3600))  # секунды, для неподходящих изображений
+IMAGE_RETRY_TTL = int(os.getenv('IMAGE_RETRY_TTL', 300))  # секунды, после ошибок загрузки
+
+# Настройки хранилища снимков страниц
+SNAPSHOTS_ENABLED = os.getenv('SNAPSHOTS_ENABLED', 'true').lower() == 'true'
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', 'snapshots')
+
 # Настройки Telegram
 TELEGRAM_PARSE_MODE = 'Markdown'
 TELEGRAM_DISABLE_WEB_PAGE_PREVIEW = True
@@ -2,8 +2,8 @@ import sqlite3
 import hashlib
 import logging
 from datetime import datetime
-from typing import Optional, List, Tuple
-from config.settings import DATABASE_FILE
+from typing import Optional, List, Tuple, Dict, Set
+from config.settings import DATABASE_FILE, OUTBOX_MAX_ATTEMPTS
 
 logger = logging.getLogger(__name__)
 
@@ -40,7 +40,8 @@ class NewsDatabase:
                     hash TEXT UNIQUE NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     sent_at TIMESTAMP,
-                    is_sent BOOLEAN DEFAULT FALSE
+                    is_sent BOOLEAN DEFAULT FALSE,
+                    send_attempts INTEGER DEFAULT 0
                 )
             ''')
             
@@ -50,12 +51,54 @@ class NewsDatabase:
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_sent ON news(is_sent)')
             self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_created_at ON news(created_at)')
             
+            # Доставка новостей по каналам
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    news_id INTEGER NOT NULL,
+                    chat_id TEXT NOT NULL,
+                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    PRIMARY KEY (news_id, chat_id)
+                )
+            ''')
+            
+            # Кэш file_id загруженных в Telegram изображений
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS image_cache (
+                    image_url TEXT PRIMARY KEY,
+                    file_id TEXT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            
+            self.migrate_schema()
+            
             self.conn.commit()
             logger.info("Таблицы созданы успешно")
         except Exception as e:
             logger.error(f"Ошибка создания таблиц: {e}")
             raise
     
+    def migrate_schema(self):
+        """Обновляет схему существующей базы данных"""
+        self.cursor.execute('PRAGMA user_version')
+        version = self.cursor.fetchone()[0]
+        
+        if version < 1:
+            columns = [row[1] for row in self.cursor.execute('PRAGMA table_info(news)')]
+            if 'send_attempts' not in columns:
+                self.cursor.execute('ALTER TABLE news ADD COLUMN send_attempts INTEGER DEFAULT 0')
+            
+            # Раньше новости отправлялись сразу после вставки и флаг is_sent не ставился.
+            # Считаем их отправленными, чтобы очередь отправки не повторила весь архив.
+            self.cursor.execute('''
+                UPDATE news 
+                SET is_sent = TRUE, sent_at = COALESCE(sent_at, created_at) 
+                WHERE is_sent = FALSE
+            ''')
+            if self.cursor.rowcount:
+                logger.info(f"Миграция: {self.cursor.rowcount} старых новостей отмечены как отправленные")
+            self.cursor.execute('PRAGMA user_version = 1')
+    
     def generate_news_hash(self, title: str, content: str, link: str) -> str:
         """Генерирует хеш для новости"""
         content_to_hash = f"{title}{content}{link}"
@@ -93,16 +136,72 @@ class NewsDatabase:
             logger.error(f"Ошибка добавления новости: {e}")
             return False
     
-    def get_unsent_news(self, limit: int = 10) -> List[Tuple]:
-        """Получает неотправленные новости"""
+    def add_news_bulk(self, news_rows: List[Tuple], mark_as_sent: bool = True) -> int:
+        """Добавляет пачку новостей (title, link, content, date, category, image_url) одной транзакцией"""
+        try:
+            rows = [
+                (title, link, content, date, category, image_url,
+                 self.generate_news_hash(title, content, link), mark_as_sent)
+                for title, link, content, date, category, image_url in news_rows
+            ]
+            before = self.conn.total_changes
+            self.cursor.executemany('''
+                INSERT OR IGNORE INTO news 
+                    (title, link, content, date, category, image_url, hash, is_sent, sent_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END)
+            ''', [row + (row[-1],) for row in rows])
+            self.conn.commit()
+            
+            inserted = self.conn.total_changes - before
+            logger.info(f"Пакетно добавлено {inserted} из {len(rows)} новостей")
+            return inserted
+        except Exception as e:
+            logger.error(f"Ошибка пакетного добавления новостей: {e}")
+            self.conn.rollback()
+            return 0
+    
+    def upsert_news_bulk(self, news_rows: List[Tuple]) -> int:
+        """Добавляет или обновляет новости по ссылке (для перепарсинга снимков)"""
+        try:
+            rows = [
+                (title, link, content, date, category, image_url,
+                 self.generate_news_hash(title, content, link))
+                for title, link, content, date, category, image_url in news_rows
+            ]
+            before = self.conn.total_changes
+            # Новые строки считаются отправленными: перепарсинг не должен ничего рассылать
+            self.cursor.executemany('''
+                INSERT INTO news 
+                    (title, link, content, date, category, image_url, hash, is_sent, sent_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, TRUE, CURRENT_TIMESTAMP)
+                ON CONFLICT(link) DO UPDATE SET
+                    title = excluded.title,
+                    content = excluded.content,
+                    date = excluded.date,
+                    category = excluded.category,
+                    image_url = excluded.image_url,
+                    hash = excluded.hash
+            ''', rows)
+            self.conn.commit()
+            
+            changed = self.conn.total_changes - before
+            logger.info(f"Перепарсинг: обновлено {changed} из {len(rows)} новостей")
+            return changed
+        except Exception as e:
+            logger.error(f"Ошибка пакетного обновления новостей: {e}")
+            self.conn.rollback()
+            return 0
+    
+    def get_unsent_news(self, limit: int = 10, max_attempts: int = OUTBOX_MAX_ATTEMPTS) -> List[Tuple]:
+        """Получает неотправленные новости, начиная с самых старых"""
         try:
             self.cursor.execute('''
                 SELECT id, title, link, content, date, category, image_url, hash
                 FROM news 
-                WHERE is_sent = FALSE 
-                ORDER BY created_at DESC 
+                WHERE is_sent = FALSE AND send_attempts < ? 
+                ORDER BY id ASC 
                 LIMIT ?
-            ''', (limit,))
+            ''', (max_attempts, limit))
             return self.cursor.fetchall()
         except Exception as e:
             logger.error(f"Ошибка получения неотправленных новостей: {e}")
@@ -121,6 +220,90 @@ class NewsDatabase:
         except Exception as e:
             logger.error(f"Ошибка отметки новости как отправленной: {e}")
     
+    def mark_as_sent_bulk(self, news_ids: List[int]):
+        """Отмечает пачку новостей как отправленные одним запросом"""
+        if not news_ids:
+            return
+        try:
+            placeholders = ','.join('?' * len(news_ids))
+            self.cursor.execute(f'''
+                UPDATE news 
+                SET is_sent = TRUE, sent_at = CURRENT_TIMESTAMP 
+                WHERE id IN ({placeholders})
+            ''', list(news_ids))
+            self.conn.commit()
+            logger.info(f"Отмечено как отправленные: {len(news_ids)} новостей")
+        except Exception as e:
+            logger.error(f"Ошибка отметки новостей как отправленных: {e}")
+    
+    def get_delivered_chats(self, news_ids: List[int]) -> Dict[int, Set[str]]:
+        """Возвращает каналы, в которые новости уже доставлены"""
+        delivered = {news_id: set() for news_id in news_ids}
+        if not news_ids:
+            return delivered
+        try:
+            placeholders = ','.join('?' * len(news_ids))
+            self.cursor.execute(f'''
+                SELECT news_id, chat_id FROM deliveries 
+                WHERE news_id IN ({placeholders})
+            ''', list(news_ids))
+            for news_id, chat_id in self.cursor.fetchall():
+                delivered[news_id].add(chat_id)
+        except Exception as e:
+            logger.error(f"Ошибка получения доставок: {e}")
+        return delivered
+    
+    def record_deliveries(self, deliveries: List[Tuple[int, str]]):
+        """Сохраняет доставленные пары (новость, канал) одной транзакцией"""
+        if not deliveries:
+            return
+        try:
+            self.cursor.executemany('''
+                INSERT OR IGNORE INTO deliveries (news_id, chat_id)
+                VALUES (?, ?)
+            ''', deliveries)
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения доставок: {e}")
+    
+    def increment_send_attempts(self, news_ids: List[int]):
+        """Увеличивает счетчик неудачных попыток отправки"""
+        if not news_ids:
+            return
+        try:
+            placeholders = ','.join('?' * len(news_ids))
+            self.cursor.execute(f'''
+                UPDATE news 
+                SET send_attempts = send_attempts + 1 
+                WHERE id IN ({placeholders})
+            ''', list(news_ids))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка обновления счетчика попыток отправки: {e}")
+    
+    def get_image_file_id(self, image_url: str) -> Optional[str]:
+        """Получает сохраненный file_id изображения"""
+        try:
+            self.cursor.execute('SELECT file_id FROM image_cache WHERE image_url = ?', (image_url,))
+            row = self.cursor.fetchone()
+            return row[0] if row else None
+        except Exception as e:
+            logger.error(f"Ошибка получения file_id изображения: {e}")
+            return None
+    
+    def save_image_file_ids(self, file_ids: Dict[str, str]):
+        """Сохраняет file_id изображений, загруженных в Telegram"""
+        if not file_ids:
+            return
+        try:
+            self.cursor.executemany('''
+                INSERT OR REPLACE INTO image_cache (image_url, file_id)
+                VALUES (?, ?)
+            ''', list(file_ids.items()))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Ошибка сохранения file_id изображения: {e}")
+    
     def get_statistics(self) -> dict:
         """Получает статистику по новостям"""
         try:
@@ -155,7 +338,7 @@ class NewsDatabase:
                 SELECT category, COUNT(*) as count, 
                        GROUP_CONCAT(title, ' | ') as titles
                 FROM news 
-                WHERE DATE(created_at) = DATE('now') AND is_sent = FALSE
+                WHERE DATE(created_at) = DATE('now')
                 GROUP BY category
             ''')
             return self.cursor.fetchall()
@@ -172,6 +355,7 @@ class NewsDatabase:
             '''.format(days))
             
             deleted_count = self.cursor.rowcount
+            self.cursor.execute('DELETE FROM deliveries WHERE news_id NOT IN (SELECT id FROM news)')
             self.conn.commit()
             logger.info(f"Удалено {deleted_count} старых новостей")
         except Exception as e:
@@ -0,0 +1,170 @@
+import gzip
+import hashlib
+import logging
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+from config.settings import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+def compress(data: bytes) -> Tuple[bytes, str]:
+    """Сжимает данные zstd, а если модуль не установлен - gzip"""
+    if zstandard is not None:
+        return zstandard.ZstdCompressor(level=10).compress(data), 'zst'
+    return gzip.compress(data), 'gz'
+
+def decompress(data: bytes, codec: str) -> bytes:
+    """Распаковывает данные снимка"""
+    if codec == 'zst':
+        if zstandard is None:
+            raise RuntimeError("Для чтения снимков .zst установите пакет zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def object_path(root: str, digest: str, codec: str) -> Path:
+    """Путь к файлу снимка по его хешу"""
+    return Path(root) / 'objects' / digest[:2] / f"{digest}.{codec}"
+
+def read_snapshot(root: str, digest: str, codec: str) -> bytes:
+    """Читает снимок с диска (можно вызывать из других процессов)"""
+    with open(object_path(root, digest, codec), 'rb') as f:
+        return decompress(f.read(), codec)
+
+class SnapshotStore:
+    """Хранилище сжатых HTML страниц с адресацией по содержимому"""
+
+    def __init__(self, root: str = SNAPSHOT_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, 'index.db'))
+        self.cursor = self.conn.cursor()
+        self.create_tables()
+
+    def create_tables(self):
+        """Создает индекс снимков"""
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT NOT NULL,
+                fetched_at TIMESTAMP NOT NULL,
+                digest TEXT NOT NULL,
+                codec TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                compressed_size INTEGER NOT NULL
+            )
+        ''')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_url ON snapshots(url, fetched_at)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_fetched_at ON snapshots(fetched_at)')
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_snapshots_digest ON snapshots(digest)')
+        self.conn.commit()
+
+    def save(self, url: str, content: bytes, fetched_at: datetime = None) -> Optional[str]:
+        """Сохраняет страницу; одинаковое содержимое хранится на диске один раз"""
+        try:
+            digest = hashlib.sha256(content).hexdigest()
+            fetched_at = (fetched_at or datetime.now()).isoformat(sep=' ', timespec='seconds')
+
+            self.cursor.execute('SELECT codec, compressed_size FROM snapshots WHERE digest = ? LIMIT 1', (digest,))
+            existing = self.cursor.fetchone()
+            if existing:
+                codec, compressed_size = existing
+            else:
+                data, codec = compress(content)
+                compressed_size = len(data)
+                path = object_path(self.root, digest, codec)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                # Пишем через временный файл, чтобы не оставить битый снимок
+                tmp_path = path.with_suffix(path.suffix + '.tmp')
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+
+            self.cursor.execute('''
+                INSERT INTO snapshots (url, fetched_at, digest, codec, size, compressed_size)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (url, fetched_at, digest, codec, len(content), compressed_size))
+            self.conn.commit()
+            return digest
+
+        except Exception as e:
+            logger.error(f"Ошибка сохранения снимка {url}: {e}")
+            return None
+
+    def load(self, digest: str) -> Optional[bytes]:
+        """Загружает содержимое снимка по хешу"""
+        try:
+            self.cursor.execute('SELECT codec FROM snapshots WHERE digest = ? LIMIT 1', (digest,))
+            row = self.cursor.fetchone()
+            if not row:
+                return None
+            return read_snapshot(self.root, digest, row[0])
+        except Exception as e:
+            logger.error(f"Ошибка чтения снимка {digest}: {e}")
+            return None
+
+    def list_snapshots(self, url: str = None, since: str = None,
+                       latest_only: bool = True) -> List[Tuple[str, str, str, str]]:
+        """Возвращает (url, fetched_at, digest, codec), от старых к новым"""
+        conditions = []
+        params = []
+        if url:
+            conditions.append('url = ?')
+            params.append(url)
+        if since:
+            conditions.append('fetched_at >= ?')
+            params.append(since)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+
+        if latest_only:
+            query = f'''
+                SELECT url, fetched_at, digest, codec FROM snapshots
+                WHERE id IN (SELECT MAX(id) FROM snapshots {where} GROUP BY url)
+                ORDER BY fetched_at, id
+            '''
+        else:
+            query = f'''
+                SELECT url, fetched_at, digest, codec FROM snapshots {where}
+                ORDER BY fetched_at, id
+            '''
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
+
+    def get_statistics(self) -> dict:
+        """Статистика хранилища"""
+        self.cursor.execute('''
+            SELECT COUNT(*), COUNT(DISTINCT url), COUNT(DISTINCT digest), SUM(size)
+            FROM snapshots
+        ''')
+        total, urls, objects, raw_size = self.cursor.fetchone()
+        self.cursor.execute('''
+            SELECT SUM(compressed_size) FROM
+                (SELECT compressed_size FROM snapshots GROUP BY digest)
+        ''')
+        stored_size = self.cursor.fetchone()[0]
+        return {
+            'snapshots': total,
+            'urls': urls,
+            'objects': objects,
+            'raw_size': raw_size or 0,
+            'stored_size': stored_size or 0
+        }
+
+    def close(self):
+        """Закрывает индекс снимков"""
+        if self.conn:
+            self.conn.close()
+            logger.info("Хранилище снимков закрыто")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
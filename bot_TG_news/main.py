@@ -13,11 +13,15 @@ from typing import List, Dict
 # Импорты наших модулей
 from config.settings import (
     TELEGRAM_TOKEN, CHAT_ID, NEWS_URL, PARSING_INTERVAL,
-    LOG_LEVEL, LOG_FILE
+    LOG_LEVEL, LOG_FILE, OUTBOX_INTERVAL, SNAPSHOTS_ENABLED
 )
 from database.models import NewsDatabase
+from database.snapshots import SnapshotStore
 from services.news_parser import NewsParser
 from services.telegram_service import TelegramService
+from services.image_service import ImageService
+from services.outbox import NewsOutbox
+from services.router import NewsRouter
 from utils.helpers import (
     setup_logging, health_check, cleanup_old_data,
     get_performance_metrics, validate_news_data
@@ -32,7 +36,10 @@ class NewsBot:
         """Инициализация бота"""
         self.database = None
         self.parser = None
+        self.snapshots = None
         self.telegram = None
+        self.images = None
+        self.outbox = None
         self.is_running = False
         
         logger.info("Инициализация новостного бота")
@@ -55,14 +62,27 @@ class NewsBot:
             self.database = NewsDatabase()
             logger.info("База данных инициализирована")
             
+            # Хранилище снимков страниц
+            if SNAPSHOTS_ENABLED:
+                self.snapshots = SnapshotStore()
+                logger.info("Хранилище снимков инициализировано")
+            
             # Парсер новостей
-            self.parser = NewsParser(NEWS_URL)
+            self.parser = NewsParser(NEWS_URL, self.snapshots)
             logger.info("Парсер новостей инициализирован")
             
+            # Сервис изображений с кэшем file_id
+            self.images = ImageService(self.database)
+            logger.info("Сервис изображений инициализирован")
+            
             # Telegram сервис
-            self.telegram = TelegramService(TELEGRAM_TOKEN)
+            self.telegram = TelegramService(TELEGRAM_TOKEN, self.images)
             logger.info("Telegram сервис инициализирован")
             
+            # Очередь отправки с маршрутизацией по каналам
+            self.outbox = NewsOutbox(self.database, self.telegram, NewsRouter(), self.images)
+            logger.info("Очередь отправки инициализирована")
+            
         except Exception as e:
             logger.error(f"Ошибка инициализации компонентов: {e}")
             raise
@@ -87,9 +107,8 @@ class NewsBot:
             
             logger.info(f"Найдено {len(news_list)} новостей")
             
-            # Обрабатываем каждую новость
+            # Сохраняем новые новости в базу данных, отправкой занимается очередь
             new_news_count = 0
-            sent_news_count = 0
             
             for news_data in news_list:
                 try:
@@ -108,18 +127,14 @@ class NewsBot:
                         image_url=news_data.get('image_url')
                     ):
                         new_news_count += 1
-                        
-                        # Отправляем новость в Telegram
-                        if self.telegram.send_news(CHAT_ID, news_data):
-                            sent_news_count += 1
-                            logger.info(f"Новость отправлена: {news_data['title']}")
-                        else:
-                            logger.error(f"Не удалось отправить новость: {news_data['title']}")
                     
                 except Exception as e:
                     logger.error(f"Ошибка обработки новости: {e}")
                     continue
             
+            # Сразу отправляем то, что накопилось в очереди
+            sent_news_count = self.deliver_news()
+            
             logger.info(f"Цикл завершен: {new_news_count} новых, {sent_news_count} отправлено")
             
         except Exception as e:
@@ -130,6 +145,14 @@ class NewsBot:
             except:
                 pass
     
+    def deliver_news(self) -> int:
+        """Отправляет неотправленные новости из базы данных"""
+        try:
+            return self.outbox.deliver_pending()
+        except Exception as e:
+            logger.error(f"Ошибка очереди отправки: {e}")
+            return 0
+    
     def send_daily_digest(self):
         """Отправляет ежедневный дайджест"""
         try:
@@ -172,6 +195,9 @@ class NewsBot:
             # Основной цикл парсинга
             schedule.every(PARSING_INTERVAL).minutes.do(self.parse_and_send_news)
             
+            # Повторная отправка новостей, которые не ушли с первого раза
+            schedule.every(OUTBOX_INTERVAL).seconds.do(self.deliver_news)
+            
             # Ежедневный дайджест в 9:00
             schedule.every().day.at("09:00").do(self.send_daily_digest)
             
@@ -203,6 +229,9 @@ class NewsBot:
             
             self.is_running = True
             
+            # Досылаем новости, оставшиеся в очереди до перезапуска
+            self.deliver_news()
+            
             # Основной цикл
             while self.is_running:
                 try:
@@ -242,6 +271,10 @@ class NewsBot:
                 self.database.close()
             if self.parser:
                 self.parser.close()
+            if self.snapshots:
+                self.snapshots.close()
+            if self.images:
+                self.images.close()
             
             logger.info("Бот остановлен")
             
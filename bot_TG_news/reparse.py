@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Перепарсинг сохраненных снимков страниц без обращения к сайту
+Пересобирает строки таблицы news после изменения парсера или схемы
+"""
+
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+from config.settings import LOG_LEVEL, LOG_FILE, SNAPSHOT_DIR
+from database.models import NewsDatabase
+from database.snapshots import SnapshotStore, read_snapshot
+from services.news_parser import parse_news_html, NEWS_FIELDS
+from utils.helpers import setup_logging, validate_news_data
+
+setup_logging(LOG_LEVEL, LOG_FILE)
+logger = logging.getLogger(__name__)
+
+def parse_snapshot(snapshot: Tuple[str, str, str, str]) -> List[Tuple]:
+    """Читает снимок с диска и парсит его (выполняется в пуле процессов)"""
+    root, url, digest, codec = snapshot
+    try:
+        return parse_news_html(read_snapshot(root, digest, codec))
+    except Exception as e:
+        logger.error(f"Ошибка перепарсинга снимка {url} ({digest}): {e}")
+        return []
+
+def main():
+    """Главная функция"""
+    arg_parser = argparse.ArgumentParser(description='Перепарсинг сохраненных снимков страниц')
+    arg_parser.add_argument('--url', help='только снимки указанной страницы')
+    arg_parser.add_argument('--since', help='только снимки не старше даты (YYYY-MM-DD)')
+    arg_parser.add_argument('--all-versions', action='store_true',
+                            help='перепарсить все версии страниц, а не только последние')
+    arg_parser.add_argument('--workers', type=int, default=os.cpu_count(), help='процессов для парсинга')
+    arg_parser.add_argument('--batch-size', type=int, default=500, help='новостей в одной записи в базу')
+    args = arg_parser.parse_args()
+
+    start_time = time.time()
+
+    with SnapshotStore(SNAPSHOT_DIR) as store:
+        snapshots = store.list_snapshots(args.url, args.since, latest_only=not args.all_versions)
+
+    logger.info(f"Перепарсинг {len(snapshots)} снимков в {args.workers} процессах")
+
+    # Только ссылки на файлы уходят в процессы, HTML читается на месте
+    tasks = [(SNAPSHOT_DIR, url, digest, codec) for url, _fetched_at, digest, codec in snapshots]
+
+    found = 0
+    updated = 0
+    pending_rows = []
+
+    with NewsDatabase() as database, ProcessPoolExecutor(max_workers=args.workers) as pool:
+        # map сохраняет порядок: более свежие снимки записываются последними
+        for rows in pool.map(parse_snapshot, tasks, chunksize=8):
+            rows = [row for row in rows if validate_news_data(dict(zip(NEWS_FIELDS, row)))]
+            found += len(rows)
+            pending_rows.extend(rows)
+
+            if len(pending_rows) >= args.batch_size:
+                updated += database.upsert_news_bulk(pending_rows)
+                pending_rows = []
+
+        if pending_rows:
+            updated += database.upsert_news_bulk(pending_rows)
+
+    duration = time.time() - start_time
+    logger.info(f"Перепарсинг завершен за {duration:.1f} сек: "
+                f"найдено {found}, записано {updated} новостей")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import io
+import logging
+import threading
+import time
+import requests
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Union
+from config.settings import (
+    REQUEST_TIMEOUT, IMAGE_PREFETCH_WORKERS, IMAGE_MAX_BYTES,
+    IMAGE_MAX_DOWNLOAD_BYTES, IMAGE_MAX_SIDE, IMAGE_DOWNSCALE,
+    IMAGE_REJECT_TTL, IMAGE_RETRY_TTL
+)
+
+logger = logging.getLogger(__name__)
+
+# Ограничения Telegram для send_photo
+TELEGRAM_MAX_DIMENSIONS_SUM = 10000
+TELEGRAM_MAX_ASPECT_RATIO = 20
+
+class ImageService:
+    """Предзагрузка, проверка и кэширование изображений новостей"""
+
+    def __init__(self, database=None, max_workers: int = IMAGE_PREFETCH_WORKERS,
+                 max_bytes: int = IMAGE_MAX_BYTES, downscale: bool = IMAGE_DOWNSCALE):
+        self.database = database
+        self.max_workers = max_workers
+        self.max_bytes = max_bytes
+        self.downscale = downscale
+        self.session = requests.Session()
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        })
+        self._prepared = {}    # image_url -> готовые к отправке байты
+        self._rejected = {}    # image_url -> время, до которого URL не загружается повторно
+        self._file_ids = {}    # image_url -> file_id (кэш в памяти)
+        self._new_file_ids = {}  # file_id, еще не сохраненные в базу
+        self._lock = threading.Lock()
+        self._upload_locks = {}
+
+    def get_cached_file_id(self, image_url: str) -> Optional[str]:
+        """Возвращает file_id, если изображение уже загружалось в Telegram"""
+        if not image_url:
+            return None
+        with self._lock:
+            file_id = self._file_ids.get(image_url)
+        if file_id or not self.database:
+            return file_id
+
+        # База данных используется только из основного потока
+        if threading.current_thread() is not threading.main_thread():
+            return None
+
+        file_id = self.database.get_image_file_id(image_url)
+        if file_id:
+            with self._lock:
+                self._file_ids[image_url] = file_id
+        return file_id
+
+    def prefetch(self, image_urls: List[str]) -> int:
+        """Параллельно загружает и проверяет изображения, которых нет в кэше"""
+        urls = []
+        for url in dict.fromkeys(u for u in image_urls if u):
+            if url in self._prepared or self._is_rejected(url):
+                continue
+            if self.get_cached_file_id(url):
+                continue
+            urls.append(url)
+
+        if not urls:
+            return 0
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(self._download_and_prepare, urls))
+
+        prepared_count = 0
+        for url, data in zip(urls, results):
+            if data is not None:
+                self._prepared[url] = data
+                prepared_count += 1
+
+        logger.info(f"Предзагружено изображений: {prepared_count} из {len(urls)}")
+        return prepared_count
+
+    def get_photo(self, image_url: str) -> Optional[Union[str, bytes]]:
+        """Возвращает file_id или проверенные байты изображения для send_photo"""
+        file_id = self.get_cached_file_id(image_url)
+        if file_id:
+            return file_id
+
+        if self._is_rejected(image_url):
+            return None
+
+        data = self._prepared.get(image_url)
+        if data is None:
+            data = self._download_and_prepare(image_url)
+            if data is not None:
+                self._prepared[image_url] = data
+        return data
+
+    @contextmanager
+    def photo(self, image_url: str):
+        """Выдает фото для отправки; первая загрузка одного URL идет только в одном потоке"""
+        file_id = self.get_cached_file_id(image_url)
+        if file_id:
+            yield file_id
+            return
+
+        with self._lock:
+            upload_lock = self._upload_locks.setdefault(image_url, threading.RLock())
+
+        # Остальные каналы ждут, пока первый получит file_id, и не загружают файл повторно
+        try:
+            with upload_lock:
+                yield self.get_photo(image_url)
+        finally:
+            # Убираем блокировку и при ошибке отправки, иначе она останется навсегда
+            with self._lock:
+                if self._upload_locks.get(image_url) is upload_lock:
+                    del self._upload_locks[image_url]
+
+    def remember_file_id(self, image_url: str, message) -> None:
+        """Запоминает file_id из ответа Telegram для повторного использования"""
+        try:
+            if not message or not message.photo:
+                return
+            # Последний элемент - вариант с максимальным разрешением
+            file_id = message.photo[-1].file_id
+            with self._lock:
+                self._file_ids[image_url] = file_id
+                self._new_file_ids[image_url] = file_id
+            # После успешной загрузки байты больше не нужны
+            self._prepared.pop(image_url, None)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения file_id для {image_url}: {e}")
+
+    def flush(self):
+        """Сохраняет новые file_id в базу данных (вызывается из основного потока)"""
+        with self._lock:
+            new_file_ids, self._new_file_ids = self._new_file_ids, {}
+        if self.database and new_file_ids:
+            self.database.save_image_file_ids(new_file_ids)
+
+    def _is_rejected(self, image_url: str) -> bool:
+        """Проверяет, отклонен ли URL и не истек ли срок отказа"""
+        with self._lock:
+            expires_at = self._rejected.get(image_url)
+            if expires_at is None:
+                return False
+            if expires_at > time.monotonic():
+                return True
+            del self._rejected[image_url]
+            return False
+
+    def _reject(self, image_url: str, ttl: int):
+        """Запоминает отказ на ttl секунд и удаляет истекшие записи"""
+        now = time.monotonic()
+        with self._lock:
+            self._rejected = {url: expires_at for url, expires_at in self._rejected.items()
+                              if expires_at > now}
+            self._rejected[image_url] = now + ttl
+
+    def _download_and_prepare(self, image_url: str) -> Optional[bytes]:
+        """Загружает изображение и приводит его к ограничениям Telegram"""
+        try:
+            data = self._download(image_url)
+            if data is not None:
+                data = self._prepare(image_url, data)
+        except Exception as e:
+            # Сетевые ошибки могут быть временными - повторяем попытку раньше
+            logger.error(f"Ошибка предзагрузки изображения {image_url}: {e}")
+            self._reject(image_url, IMAGE_RETRY_TTL)
+            return None
+
+        if data is None:
+            # Изображение не подходит для Telegram - долго не загружаем его снова
+            self._reject(image_url, IMAGE_REJECT_TTL)
+        return data
+
+    def _download(self, image_url: str) -> Optional[bytes]:
+        """Загружает изображение с ограничением по размеру"""
+        with self.session.get(image_url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+            response.raise_for_status()
+
+            content_type = response.headers.get('Content-Type', '')
+            if content_type and not content_type.startswith('image/'):
+                logger.warning(f"Не изображение ({content_type}): {image_url}")
+                return None
+
+            content_length = int(response.headers.get('Content-Length') or 0)
+            if content_length > IMAGE_MAX_DOWNLOAD_BYTES:
+                logger.warning(f"Изображение слишком большое ({content_length} байт): {image_url}")
+                return None
+
+            buffer = io.BytesIO()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                buffer.write(chunk)
+                if buffer.tell() > IMAGE_MAX_DOWNLOAD_BYTES:
+                    logger.warning(f"Изображение превышает лимит загрузки: {image_url}")
+                    return None
+            return buffer.getvalue()
+
+    def _prepare(self, image_url: str, data: bytes) -> Optional[bytes]:
+        """Проверяет размеры изображения и при необходимости уменьшает его"""
+        try:
+            from PIL import Image
+        except ImportError:
+            # Без Pillow проверяем только размер файла
+            if len(data) > self.max_bytes:
+                logger.warning(f"Изображение больше {self.max_bytes} байт: {image_url}")
+                return None
+            return data
+
+        image = Image.open(io.BytesIO(data))
+        width, height = image.size
+
+        if max(width, height) / max(min(width, height), 1) > TELEGRAM_MAX_ASPECT_RATIO:
+            logger.warning(f"Недопустимые пропорции изображения {width}x{height}: {image_url}")
+            return None
+
+        too_large = (len(data) > self.max_bytes
+                     or width + height > TELEGRAM_MAX_DIMENSIONS_SUM
+                     or max(width, height) > IMAGE_MAX_SIDE)
+        if not too_large:
+            return data
+
+        if not self.downscale:
+            if len(data) > self.max_bytes or width + height > TELEGRAM_MAX_DIMENSIONS_SUM:
+                logger.warning(f"Изображение не подходит для Telegram: {image_url}")
+                return None
+            return data
+
+        image.thumbnail((IMAGE_MAX_SIDE, IMAGE_MAX_SIDE))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        output = io.BytesIO()
+        image.save(output, format='JPEG', quality=85, optimize=True)
+        result = output.getvalue()
+
+        if len(result) > self.max_bytes:
+            logger.warning(f"Не удалось уменьшить изображение: {image_url}")
+            return None
+
+        logger.info(f"Изображение уменьшено {width}x{height} -> {image.size[0]}x{image.size[1]}: {image_url}")
+        return result
+
+    def close(self):
+        """Закрывает сессию"""
+        if self.session:
+            self.session.close()
+            logger.info("Сессия загрузки изображений закрыта")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
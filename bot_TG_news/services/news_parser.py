@@ -6,11 +6,23 @@ from bs4 import BeautifulSoup
 from functools import wraps
 from config.settings import (
     REQUEST_TIMEOUT, REQUEST_DELAY, MAX_PAGES, 
-    EXCLUDED_CATEGORIES, EXCLUDED_KEYWORDS
+    EXCLUDED_CATEGORIES, EXCLUDED_KEYWORDS, NEWS_URL
 )
 
 logger = logging.getLogger(__name__)
 
+# Порядок полей в компактном кортеже новости
+NEWS_FIELDS = ('title', 'link', 'content', 'date', 'category', 'image_url')
+
+_worker_parser = None
+
+def parse_news_html(html: bytes) -> List[Tuple]:
+    """Парсит HTML страницы в компактные кортежи (для ProcessPoolExecutor)"""
+    global _worker_parser
+    if _worker_parser is None:
+        _worker_parser = NewsParser(NEWS_URL)
+    return [tuple(news[field] for field in NEWS_FIELDS) for news in _worker_parser.parse_html(html)]
+
 def retry_on_failure(max_retries=3, delay=5):
     """Декоратор для повторных попыток при ошибках"""
     def decorator(func):
@@ -30,8 +42,9 @@ def retry_on_failure(max_retries=3, delay=5):
     return decorator
 
 class NewsParser:
-    def __init__(self, base_url: str):
+    def __init__(self, base_url: str, snapshots=None):
         self.base_url = base_url
+        self.snapshots = snapshots
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -134,6 +147,25 @@ class NewsParser:
             logger.error(f"Ошибка парсинга новости: {e}")
             return None
     
+    def parse_html(self, html: bytes) -> List[Dict]:
+        """Извлекает новости из HTML страницы"""
+        soup = BeautifulSoup(html, 'html.parser')
+        
+        # Находим все новости на странице
+        parsed_news = []
+        for news in soup.find_all('article', class_='post'):
+            news_data = self.parse_news_item(news)
+            if news_data:
+                parsed_news.append(news_data)
+        
+        return parsed_news
+    
+    def get_page_url(self, page: int) -> str:
+        """Возвращает URL страницы архива"""
+        if page == 1:
+            return self.base_url
+        return f"{self.base_url}strana/{page}/"
+    
     @retry_on_failure(max_retries=3, delay=5)
     def parse_page(self, url: str) -> List[Dict]:
         """Парсит одну страницу новостей"""
@@ -143,21 +175,15 @@ class NewsParser:
             response = self.session.get(url, timeout=REQUEST_TIMEOUT)
             response.raise_for_status()
             
-            soup = BeautifulSoup(response.text, 'html.parser')
+            # Сохраняем сырой HTML для последующего перепарсинга
+            if self.snapshots:
+                self.snapshots.save(url, response.content)
             
-            # Находим все новости на странице
-            news_items = soup.find_all('article', class_='post')
-            
-            if not news_items:
+            parsed_news = self.parse_html(response.content)
+            if not parsed_news:
                 logger.warning(f"На странице {url} не найдено новостей")
                 return []
             
-            parsed_news = []
-            for news in news_items:
-                news_data = self.parse_news_item(news)
-                if news_data:
-                    parsed_news.append(news_data)
-            
             logger.info(f"Страница {url}: найдено {len(parsed_news)} новостей")
             return parsed_news
             
@@ -174,10 +200,7 @@ class NewsParser:
         
         for page in range(1, max_pages + 1):
             try:
-                if page == 1:
-                    url = self.base_url
-                else:
-                    url = f"{self.base_url}strana/{page}/"
+                url = self.get_page_url(page)
                 
                 page_news = self.parse_page(url)
                 all_news.extend(page_news)
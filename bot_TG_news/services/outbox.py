@@ -0,0 +1,121 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from config.settings import (
+    OUTBOX_BATCH_SIZE, CHANNEL_MESSAGES_PER_MINUTE, DELIVERY_WORKERS
+)
+from utils.helpers import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+def row_to_news_data(row: Tuple) -> Dict:
+    """Преобразует строку из get_unsent_news в словарь для TelegramService"""
+    news_id, title, link, content, date, category, image_url, _hash = row
+    return {
+        'id': news_id,
+        'title': title,
+        'link': link,
+        'content': content or '',
+        'date': date or '',
+        'category': category or 'general',
+        'image_url': image_url or ''
+    }
+
+class NewsOutbox:
+    """Очередь отправки новостей поверх таблицы news (флаг is_sent)"""
+
+    def __init__(self, database, telegram, router, images=None,
+                 batch_size: int = OUTBOX_BATCH_SIZE,
+                 max_workers: int = DELIVERY_WORKERS):
+        self.database = database
+        self.telegram = telegram
+        self.router = router
+        self.images = images
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.limiters = {}  # chat_id -> RateLimiter, живут между пачками
+
+    def deliver_pending(self) -> int:
+        """Отправляет все неотправленные новости пачками, возвращает число отправленных"""
+        total_sent = 0
+
+        while True:
+            rows = self.database.get_unsent_news(limit=self.batch_size)
+            if not rows:
+                break
+
+            sent_ids, failed_ids = self.deliver_batch([row_to_news_data(row) for row in rows])
+
+            # Одна запись в базу на пачку
+            self.database.mark_as_sent_bulk(sent_ids)
+            self.database.increment_send_attempts(failed_ids)
+            total_sent += len(sent_ids)
+
+            if failed_ids:
+                # Не долбим Telegram дальше - остаток уйдет в следующем цикле
+                logger.warning(f"Не удалось отправить {len(failed_ids)} новостей, повтор в следующем цикле")
+                break
+
+        if total_sent:
+            logger.info(f"Очередь отправки: отправлено {total_sent} новостей")
+        return total_sent
+
+    def deliver_batch(self, batch: List[Dict]) -> Tuple[List[int], List[int]]:
+        """Рассылает пачку новостей по каналам, возвращает списки отправленных и неотправленных id"""
+        if self.images:
+            self.images.prefetch([news_data['image_url'] for news_data in batch])
+
+        delivered = self.database.get_delivered_chats([news_data['id'] for news_data in batch])
+
+        # Раскладываем новости по каналам, форматируя каждую один раз
+        per_chat = {}
+        pending = {}
+        for news_data in batch:
+            targets = [chat_id for chat_id in self.router.get_targets(news_data)
+                       if chat_id not in delivered[news_data['id']]]
+            pending[news_data['id']] = set(targets)
+            if not targets:
+                continue
+
+            news_data['message'] = self.telegram.format_news_message(
+                news_data['title'], news_data['content'], news_data['link'],
+                news_data['date'], news_data['category']
+            )
+            for chat_id in targets:
+                per_chat.setdefault(chat_id, []).append(news_data)
+
+        new_deliveries = []
+        if per_chat:
+            workers = min(self.max_workers, len(per_chat))
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(lambda item: self.deliver_to_chat(*item), per_chat.items())
+                for chat_id, sent_ids in results:
+                    for news_id in sent_ids:
+                        new_deliveries.append((news_id, chat_id))
+                        pending[news_id].discard(chat_id)
+
+        self.database.record_deliveries(new_deliveries)
+        if self.images:
+            self.images.flush()
+
+        sent_ids = [news_id for news_id, chats in pending.items() if not chats]
+        failed_ids = [news_id for news_id, chats in pending.items() if chats]
+        return sent_ids, failed_ids
+
+    def deliver_to_chat(self, chat_id: str, news_list: List[Dict]) -> Tuple[str, List[int]]:
+        """Последовательно отправляет новости в один канал со своим ограничением частоты"""
+        limiter = self.limiters.setdefault(chat_id, RateLimiter(CHANNEL_MESSAGES_PER_MINUTE, 60))
+        sent_ids = []
+
+        for news_data in news_list:
+            try:
+                limiter.wait()
+                if self.telegram.send_news(chat_id, news_data):
+                    sent_ids.append(news_data['id'])
+                    logger.info(f"Новость отправлена в {chat_id}: {news_data['title']}")
+                else:
+                    logger.error(f"Не удалось отправить новость в {chat_id}: {news_data['title']}")
+            except Exception as e:
+                logger.error(f"Ошибка отправки новости в {chat_id}: {e}")
+
+        return chat_id, sent_ids
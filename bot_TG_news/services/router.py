@@ -0,0 +1,51 @@
+import logging
+from typing import Dict, List
+from config.settings import CHAT_ID, CATEGORY_ROUTES, KEYWORD_ROUTES, ARCHIVE_CHAT_ID
+
+logger = logging.getLogger(__name__)
+
+class NewsRouter:
+    """Определяет каналы, в которые нужно отправить новость"""
+
+    def __init__(self, default_chat_id: str = CHAT_ID,
+                 category_routes: Dict[str, List[str]] = None,
+                 keyword_routes: Dict[str, List[str]] = None,
+                 archive_chat_id: str = ARCHIVE_CHAT_ID):
+        self.default_chat_id = default_chat_id
+        self.category_routes = CATEGORY_ROUTES if category_routes is None else category_routes
+        self.keyword_routes = KEYWORD_ROUTES if keyword_routes is None else keyword_routes
+        self.archive_chat_id = archive_chat_id
+
+        logger.info(f"Маршруты: {len(self.category_routes)} по категориям, "
+                    f"{len(self.keyword_routes)} по ключевым словам")
+
+    def get_targets(self, news_data: Dict) -> List[str]:
+        """Возвращает список каналов без повторов в порядке приоритета"""
+        targets = []
+
+        category = (news_data.get('category') or '').lower()
+        targets.extend(self.category_routes.get(category, []))
+
+        if self.keyword_routes:
+            text = f"{news_data.get('title', '')} {news_data.get('content', '')}".lower()
+            for keyword, chat_ids in self.keyword_routes.items():
+                if keyword in text:
+                    targets.extend(chat_ids)
+
+        # Новости без маршрута уходят в основной канал
+        if not targets and self.default_chat_id:
+            targets.append(self.default_chat_id)
+
+        # Архивный канал получает копию всех новостей
+        if self.archive_chat_id:
+            targets.append(self.archive_chat_id)
+
+        return list(dict.fromkeys(targets))
+
+    def get_all_chats(self) -> List[str]:
+        """Возвращает все каналы, участвующие в рассылке"""
+        chats = [self.default_chat_id, self.archive_chat_id]
+        for routes in (self.category_routes, self.keyword_routes):
+            for chat_ids in routes.values():
+                chats.extend(chat_ids)
+        return [chat for chat in dict.fromkeys(chats) if chat]
@@ -11,8 +11,9 @@ from config.settings import (
 logger = logging.getLogger(__name__)
 
 class TelegramService:
-    def __init__(self, token: str = TELEGRAM_TOKEN):
+    def __init__(self, token: str = TELEGRAM_TOKEN, image_service=None):
         self.bot = Bot(token=token)
+        self.image_service = image_service
         self.parse_mode = ParseMode.MARKDOWN
         self.disable_web_page_preview = TELEGRAM_DISABLE_WEB_PAGE_PREVIEW
     
@@ -62,10 +63,12 @@ class TelegramService:
         return "\n\n".join(message_parts)
     
     def send_news_message(self, chat_id: str, title: str, content: str, 
-                         link: str, date: str = None, category: str = None) -> bool:
+                         link: str, date: str = None, category: str = None,
+                         message: str = None) -> bool:
         """Отправляет текстовое сообщение с новостью"""
         try:
-            message = self.format_news_message(title, content, link, date, category)
+            if message is None:
+                message = self.format_news_message(title, content, link, date, category)
             
             self.bot.send_message(
                 chat_id=chat_id,
@@ -80,7 +83,7 @@ class TelegramService:
         except RetryAfter as e:
             logger.warning(f"Telegram требует задержку: {e.retry_after} сек")
             time.sleep(e.retry_after)
-            return self.send_news_message(chat_id, title, content, link, date, category)
+            return self.send_news_message(chat_id, title, content, link, date, category, message)
             
         except TelegramError as e:
             logger.error(f"Ошибка Telegram при отправке текста: {e}")
@@ -91,17 +94,33 @@ class TelegramService:
     
     def send_news_with_image(self, chat_id: str, title: str, content: str, 
                             link: str, image_url: str, date: str = None, 
-                            category: str = None) -> bool:
+                            category: str = None, message: str = None) -> bool:
         """Отправляет новость с изображением"""
         try:
-            message = self.format_news_message(title, content, link, date, category)
+            if message is None:
+                message = self.format_news_message(title, content, link, date, category)
             
-            self.bot.send_photo(
-                chat_id=chat_id,
-                photo=image_url,
-                caption=message,
-                parse_mode=self.parse_mode
-            )
+            if not self.image_service:
+                self.bot.send_photo(
+                    chat_id=chat_id,
+                    photo=image_url,
+                    caption=message,
+                    parse_mode=self.parse_mode
+                )
+            else:
+                # file_id из кэша или заранее проверенные байты вместо удаленного URL
+                with self.image_service.photo(image_url) as photo:
+                    if not photo:
+                        logger.info(f"Изображение не прошло проверку, отправляем текст: {title}")
+                        return self.send_news_message(chat_id, title, content, link, date, category, message)
+                    
+                    sent_message = self.bot.send_photo(
+                        chat_id=chat_id,
+                        photo=photo,
+                        caption=message,
+                        parse_mode=self.parse_mode
+                    )
+                    self.image_service.remember_file_id(image_url, sent_message)
             
             logger.info(f"Отправлено сообщение с изображением: {title}")
             return True
@@ -109,16 +128,16 @@ class TelegramService:
         except RetryAfter as e:
             logger.warning(f"Telegram требует задержку: {e.retry_after} сек")
             time.sleep(e.retry_after)
-            return self.send_news_with_image(chat_id, title, content, link, image_url, date, category)
+            return self.send_news_with_image(chat_id, title, content, link, image_url, date, category, message)
             
         except TelegramError as e:
             logger.error(f"Ошибка Telegram при отправке изображения: {e}")
             # Пробуем отправить без изображения
-            return self.send_news_message(chat_id, title, content, link, date, category)
+            return self.send_news_message(chat_id, title, content, link, date, category, message)
         except Exception as e:
             logger.error(f"Неожиданная ошибка при отправке изображения: {e}")
             # Пробуем отправить без изображения
-            return self.send_news_message(chat_id, title, content, link, date, category)
+            return self.send_news_message(chat_id, title, content, link, date, category, message)
     
     def send_news(self, chat_id: str, news_data: Dict) -> bool:
         """Отправляет новость в зависимости от наличия изображения"""
@@ -129,14 +148,16 @@ class TelegramService:
             date = news_data.get('date', '')
             category = news_data.get('category', '')
             image_url = news_data.get('image_url', '')
+            # Готовый текст, если новость уже отформатирована для рассылки
+            message = news_data.get('message')
             
             if image_url:
                 return self.send_news_with_image(
-                    chat_id, title, content, link, image_url, date, category
+                    chat_id, title, content, link, image_url, date, category, message
                 )
             else:
                 return self.send_news_message(
-                    chat_id, title, content, link, date, category
+                    chat_id, title, content, link, date, category, message
                 )
                 
         except Exception as e:
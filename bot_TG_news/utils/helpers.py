@@ -1,6 +1,7 @@
 import logging
 import time
 import hashlib
+import threading
 from typing import List, Dict, Optional
 from datetime import datetime, timedelta
 from functools import wraps
@@ -60,6 +61,26 @@ def rate_limit(calls: int = 1, period: int = 1):
         return wrapper
     return decorator
 
+class RateLimiter:
+    """Потокобезопасный ограничитель частоты: не больше calls вызовов за period секунд"""
+    
+    def __init__(self, calls: int = 1, period: float = 1.0):
+        self.interval = period / max(calls, 1)
+        self.next_slot = 0.0
+        self.lock = threading.Lock()
+    
+    def wait(self):
+        """Ждет до следующего разрешенного вызова"""
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        
+        sleep_time = slot - now
+        if sleep_time > 0:
+            logger.debug(f"Rate limit: ожидание {sleep_time:.2f} сек")
+            time.sleep(sleep_time)
+
 def health_check(database, telegram_service) -> bool:
     """Проверяет здоровье системы"""
     try: